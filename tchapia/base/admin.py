@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Service, Billing, Notification
+from .models import Service, Billing, Notification, Job
 
 @admin.register(Service)
 class ServiceAdmin(admin.ModelAdmin):
@@ -18,8 +18,17 @@ class BillingAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ['user', 'type', 'project', 'service', 'created_at']
-    list_filter = ['type', 'created_at']
-    search_fields = ['user__email', 'type']
+    list_display = ['user', 'notification_type', 'title', 'project', 'is_read', 'created_at']
+    list_filter = ['notification_type', 'is_read', 'created_at']
+    search_fields = ['user__email', 'title', 'message']
     ordering = ['-created_at']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+    raw_id_fields = ['user', 'project', 'offer']
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'task', 'status', 'attempts', 'max_attempts', 'run_at', 'locked_by', 'created_at']
+    list_filter = ['status', 'task', 'created_at']
+    search_fields = ['task', 'last_error']
+    ordering = ['-created_at']
+    readonly_fields = ['created_at', 'updated_at']
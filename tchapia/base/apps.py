@@ -1,6 +1,18 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .sqlite import configure_connection
+
+        connection_created.connect(configure_connection, dispatch_uid='base.sqlite.configure_connection')
+
+        # Register background tasks declared in each app's tasks.py
+        autodiscover_modules('tasks')
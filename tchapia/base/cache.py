@@ -0,0 +1,264 @@
+"""
+Cache backend shared by every worker process of a node, stored in a local
+SQLite file in WAL mode.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'base.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/tchapia-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+
+WAL lets readers run while one process writes, so gets from all workers
+proceed in parallel. Each thread of each process opens its own connection.
+
+- Expiry: entries carry an absolute expiry time and are dropped when read
+  after it, or when the cache is culled.
+- Eviction: when more than MAX_ENTRIES are stored, expired entries go first,
+  then the least recently used 1/CULL_FREQUENCY of the rest. Reads refresh
+  an entry's access time at most once every LRU_RESOLUTION seconds, so hot
+  keys don't turn every get into a write.
+- Counters: integers are stored as SQLite integers rather than pickles, so
+  incr()/decr() are a single atomic UPDATE shared by all processes.
+- get_many()/set_many() use one statement/transaction per batch.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID;
+    CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+    CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires) WHERE expires IS NOT NULL;
+"""
+
+# Keys per statement in get_many/delete_many, well under SQLite's variable limit
+BATCH_SIZE = 500
+
+# Not expired at `now`
+_LIVE = "(expires IS NULL OR expires > ?)"
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = str(location)
+        self._busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._lru_resolution = float(options.get('LRU_RESOLUTION', 60))
+        # Sets between two checks of the number of entries
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._sets = 0
+        self._local = threading.local()
+
+    # Connections
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            # Never reuse a connection inherited through fork()
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout / 1000, isolation_level=None, check_same_thread=False)
+            connection.execute(f"PRAGMA busy_timeout = {self._busy_timeout}")
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def close(self, **kwargs):
+        # Connections are per thread and cheap to keep; nothing to release per request
+        pass
+
+    # Values
+
+    def _encode(self, value):
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    # Reads
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._connection().execute(
+            f"SELECT value, accessed FROM cache WHERE key = ? AND {_LIVE}", (key, now)
+        ).fetchone()
+        if row is None:
+            return default
+        value, accessed = row
+        if now - accessed > self._lru_resolution:
+            self._connection().execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return self._decode(value)
+
+    def get_many(self, keys, version=None):
+        key_map = {self.make_and_validate_key(key, version=version): key for key in keys}
+        if not key_map:
+            return {}
+        now = time.time()
+        connection = self._connection()
+        result = {}
+        stale = []
+        cache_keys = list(key_map)
+        for start in range(0, len(cache_keys), BATCH_SIZE):
+            batch = cache_keys[start:start + BATCH_SIZE]
+            rows = connection.execute(
+                f"SELECT key, value, accessed FROM cache WHERE key IN ({', '.join('?' * len(batch))}) AND {_LIVE}",
+                [*batch, now],
+            ).fetchall()
+            for cache_key, value, accessed in rows:
+                result[key_map[cache_key]] = self._decode(value)
+                if now - accessed > self._lru_resolution:
+                    stale.append((now, cache_key))
+        if stale:
+            connection.executemany("UPDATE cache SET accessed = ? WHERE key = ?", stale)
+        return result
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(f"SELECT 1 FROM cache WHERE key = ? AND {_LIVE}", (key, time.time())).fetchone()
+        return row is not None
+
+    # Writes
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+            (key, self._encode(value), self.get_backend_timeout(timeout), time.time()),
+        )
+        self._maybe_cull(1)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        if not data:
+            return []
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self.make_and_validate_key(key, version=version), self._encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)", rows)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        self._maybe_cull(len(rows))
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        # Only an expired entry may be replaced; one statement, so concurrent adds can't both win
+        cursor = self._connection().execute(
+            """
+            INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, accessed = excluded.accessed
+            WHERE cache.expires IS NOT NULL AND cache.expires <= ?
+            """,
+            (key, self._encode(value), self.get_backend_timeout(timeout), now, now),
+        )
+        added = cursor.rowcount == 1
+        if added:
+            self._maybe_cull(1)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        cursor = self._connection().execute(
+            f"UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND {_LIVE}",
+            (self.get_backend_timeout(timeout), now, key, now),
+        )
+        return cursor.rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        connection = self._connection()
+        # fetchall() so the statement finishes and commits before returning
+        rows = connection.execute(
+            f"UPDATE cache SET value = value + ?, accessed = ? WHERE key = ? AND {_LIVE} AND typeof(value) = 'integer' RETURNING value",
+            (delta, now, key, now),
+        ).fetchall()
+        if rows:
+            return rows[0][0]
+
+        # Missing, or a pickled number (e.g. a float): read and write back under the write lock
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(f"SELECT value FROM cache WHERE key = ? AND {_LIVE}", (key, now)).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            connection.execute("UPDATE cache SET value = ?, accessed = ? WHERE key = ?", (self._encode(value), now, key))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 1
+
+    def delete_many(self, keys, version=None):
+        cache_keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        connection = self._connection()
+        for start in range(0, len(cache_keys), BATCH_SIZE):
+            batch = cache_keys[start:start + BATCH_SIZE]
+            connection.execute(f"DELETE FROM cache WHERE key IN ({', '.join('?' * len(batch))})", batch)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache")
+
+    # Eviction
+
+    def _maybe_cull(self, written):
+        self._sets += written
+        if self._sets < self._cull_every:
+            return
+        self._sets = 0
+        self.cull()
+
+    def cull(self):
+        """Drop expired entries, then least recently used ones beyond MAX_ENTRIES"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+            count = connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+            if count > self._max_entries:
+                keep = self._max_entries - (self._max_entries // self._cull_frequency if self._cull_frequency else self._max_entries)
+                connection.execute(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (count - keep,),
+                )
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,92 @@
+"""
+Conditional GET (ETag / Last-Modified) for detail pages.
+
+A page's validators come from one query on its object: the object's
+``updated_at`` plus, for every kind of related row the page shows (images,
+offers, ratings...), the newest timestamp and the number of rows. The count
+catches deletions, which leave the newest timestamp unchanged. When the
+browser's copy is still current the view isn't run at all and a 304 goes
+back without a body.
+
+The ETag also covers the page template and, for signed-in users, who is
+looking and their notification cache version (the navbar dropdown), so a
+304 is never sent for a page that would render differently. Relative dates
+("il y a 5 minutes") stay as they were until something on the page changes.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from django.contrib import messages
+from django.db.models import F, Func, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.http import http_date
+
+from .fragments import template_digest
+from .notifications import get_cache_version
+
+
+def changes(name, queryset, field):
+    """
+    Annotations for `conditional_page`: newest `field` (a field name or an
+    expression) and row count of `queryset`, which is filtered on
+    ``OuterRef('pk')``
+    """
+    queryset = queryset.order_by()
+    if isinstance(field, str):
+        field = F(field)
+    return {
+        f'{name}_at': Subquery(queryset.annotate(value=Func(field, function='MAX')).values('value')),
+        f'{name}_count': Subquery(queryset.annotate(value=Func('pk', function='COUNT')).values('value')),
+    }
+
+
+def page_validators(request, template_name, row):
+    """(etag, last modified) of a page from its `changes` row"""
+    state = [template_digest(template_name), sorted(row.items())]
+    if request.user.is_authenticated:
+        state += [request.user.pk, get_cache_version(request.user.pk)]
+    etag = quote_etag(hashlib.md5(repr(state).encode()).hexdigest())
+    last_modified = max(value for value in row.values() if isinstance(value, datetime))
+    return etag, int(last_modified.timestamp())
+
+
+def conditional_page(template_name, changed):
+    """
+    Answer GETs of the decorated view with 304 Not Modified when nothing on
+    the page changed since the browser's copy. `changed(request, **kwargs)`
+    returns a queryset of the page's object annotated with `changes`.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # len() doesn't mark the messages as read
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+
+            queryset = changed(request, *args, **kwargs)
+            row = queryset.values('updated_at', *queryset.query.annotations).first()
+            if row is None:
+                # Let the view answer with its 404 or redirect
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = page_validators(request, template_name, row)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                # A stale copy from the page cache predates these validators
+                if response.status_code != 200 or response.get('X-Page-Cache') == 'stale':
+                    return response
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            # Always revalidate; pages of signed-in users stay out of shared caches
+            if request.user.is_authenticated:
+                patch_cache_control(response, no_cache=True, private=True)
+            else:
+                patch_cache_control(response, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
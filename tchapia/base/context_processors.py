@@ -1,41 +1,51 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import SimpleLazyObject
+
+from base.models import Notification
+from base.notifications import NOTIFICATION_CACHE_TIMEOUT, cache_data_key, get_cache_version
+
+RECENT_NOTIFICATIONS_LIMIT = 5
+
+# Fields of each notification kept in the cached dropdown data
+NOTIFICATION_FIELDS = ['id', 'notification_type', 'title', 'message', 'project_id', 'is_read', 'created_at']
+
+EMPTY_NOTIFICATIONS = {'unread_count': 0, 'recent': []}
+
+
+def _load_notifications(user):
+    """Read the notification summary of `user` from the database"""
+    recent = list(
+        Notification.objects.filter(user_id=user.id)
+        .values(*NOTIFICATION_FIELDS)[:RECENT_NOTIFICATIONS_LIMIT]
+    )
+    # Fresh counter, request.user may have been loaded before a write in this request
+    unread_count = get_user_model().objects.filter(id=user.id).values_list('unread_notifications_count', flat=True).first()
+    return {'unread_count': unread_count or 0, 'recent': recent}
+
+
+def get_notification_summary(user):
+    """Cached notification summary of `user`, keyed on its current cache version"""
+    if not user.is_authenticated:
+        return EMPTY_NOTIFICATIONS
+
+    key = cache_data_key(user.id, get_cache_version(user.id))
+    data = cache.get(key)
+    if data is None:
+        data = _load_notifications(user)
+        cache.set(key, data, timeout=NOTIFICATION_CACHE_TIMEOUT)
+    return data
+
+
 def notifications(request):
     """
-    Context processor to add notification data to all templates
+    Context processor to add notification data to all templates.
+
+    Both values are lazy: nothing is read from the session, the cache or the
+    database unless the template actually renders them.
     """
-    context = {}
-
-    if request.user.is_authenticated:
-        if request.user.user_type == 'artisan':
-            try:
-                handyman = request.user.handyman_profile
-                # Get unread notifications count
-                unread_count = handyman.notifications.filter(is_read=False).count()
-                # Get recent notifications (last 5)
-                recent_notifications = handyman.notifications.all()[:5]
-
-                context['unread_notifications_count'] = unread_count
-                context['recent_notifications'] = recent_notifications
-            except:
-                context['unread_notifications_count'] = 0
-                context['recent_notifications'] = []
-        elif request.user.user_type == 'client':
-            try:
-                customer = request.user.customer_profile
-                # Get unread notifications count for customers
-                unread_count = customer.notifications.filter(is_read=False).count()
-                # Get recent notifications (last 5)
-                recent_notifications = customer.notifications.all()[:5]
-
-                context['unread_notifications_count'] = unread_count
-                context['recent_notifications'] = recent_notifications
-            except:
-                context['unread_notifications_count'] = 0
-                context['recent_notifications'] = []
-        else:
-            context['unread_notifications_count'] = 0
-            context['recent_notifications'] = []
-    else:
-        context['unread_notifications_count'] = 0
-        context['recent_notifications'] = []
-
-    return context
\ No newline at end of file
+    summary = SimpleLazyObject(lambda: get_notification_summary(request.user))
+    return {
+        'unread_notifications_count': SimpleLazyObject(lambda: summary['unread_count']),
+        'recent_notifications': SimpleLazyObject(lambda: summary['recent']),
+    }
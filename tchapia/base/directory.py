@@ -0,0 +1,126 @@
+"""
+Artisan directory: filtering, keyset pagination and totals.
+
+Pages are keyed on (verification_status, created_at, id) so the last page
+costs the same as the first, or on (search_rank, id) for a full-text query.
+The total number of matches comes from the cached facet counts instead of
+being counted on every page.
+"""
+from django.conf import settings
+
+from handyman.models import Handyman
+from handyman.search import SEARCH_ORDERING, search_handymen, search_page
+
+from .facets import directory_facets
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+DIRECTORY_ORDERING = ['verification_status', '-created_at', '-id']
+DIRECTORY_PAGE_SIZE = getattr(settings, 'DIRECTORY_PAGE_SIZE', 24)
+DIRECTORY_MAX_PAGE_SIZE = 100
+
+FILTER_PARAMS = ['q', 'service', 'region', 'city', 'verified']
+
+
+def directory_filters(params):
+    """The directory filters present in `params` (request.GET), '' when unset"""
+    return {name: params.get(name, '') for name in FILTER_PARAMS}
+
+
+def filter_handymen(filters):
+    handymen = Handyman.objects.all()
+
+    if filters['q']:
+        handymen = search_handymen(handymen, filters['q'])
+
+    if filters['service']:
+        handymen = handymen.filter(user__service=filters['service'])
+
+    if filters['region']:
+        handymen = handymen.filter(user__region=filters['region'])
+
+    if filters['city']:
+        handymen = handymen.filter(user__city=filters['city'])
+
+    if filters['verified'] == 'verified':
+        handymen = handymen.filter(verification_status="verified")
+    elif filters['verified'] == 'pending':
+        handymen = handymen.filter(verification_status="pending")
+
+    return handymen
+
+
+def directory_page(filters, cursor=None, page_size=DIRECTORY_PAGE_SIZE):
+    """
+    ``(handymen, next_cursor)`` for one directory page, best matches first
+    when searching.
+
+    The page is first resolved on the sort key alone, which keeps the sort
+    narrow (or index-only without a search), then its rows are loaded with
+    their user by primary key.
+    """
+    if filters['q']:
+        rows, next_cursor = search_directory_page(filters, cursor, page_size)
+    else:
+        keys = [ordering_field.lstrip('-') for ordering_field in DIRECTORY_ORDERING]
+        rows, next_cursor = keyset_page(filter_handymen(filters).values(*keys), DIRECTORY_ORDERING, cursor, page_size)
+
+    loaded = Handyman.objects.select_related('user').in_bulk([row['id'] for row in rows])
+    handymen = []
+    for row in rows:
+        handyman = loaded[row['id']]
+        if filters['q']:
+            handyman.search_rank = row['search_rank']
+        handymen.append(handyman)
+    return handymen, next_cursor
+
+
+def search_directory_page(filters, cursor, page_size):
+    """
+    Keyset page of a full-text search, same contract as keyset_page but
+    read by search_page from the search table in rank order.
+    """
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, Handyman, SEARCH_ORDERING)
+        except InvalidCursor:
+            pass
+        # An invalid cursor restarts from the first page
+        if after is not None and not isinstance(after[0], (int, float)):
+            after = None
+
+    # The other filters, the search itself is done by search_page
+    handymen = filter_handymen(dict(filters, q=''))
+    rows = search_page(handymen, filters['q'], after, page_size + 1)
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], SEARCH_ORDERING)
+    return rows, next_cursor
+
+
+def directory_count(filters):
+    """Number of handymen matching `filters`"""
+    return directory_facets(filters)['total']
+
+
+def serialize_handyman(handyman):
+    """JSON representation of a directory card"""
+    user = handyman.user
+    return {
+        'id': handyman.id,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'service': user.service,
+        'service_display': user.get_service_display() if user.service else None,
+        'region': user.region,
+        'region_display': user.get_region_display() if user.region else None,
+        'city': user.city,
+        'profile_picture': user.profile_picture.url if user.profile_picture else None,
+        'verification_status': handyman.verification_status,
+        'experience_years': handyman.experience_years,
+        'hourly_rate': handyman.hourly_rate,
+        'availability': handyman.availability,
+        'rating_avg': handyman.rating_avg,
+        'rating_count': handyman.rating_count,
+    }
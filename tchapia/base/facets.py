@@ -0,0 +1,131 @@
+"""
+Facet counts for the artisan directory.
+
+A single GROUP BY over the Handyman/User join counts handymen for every
+(service, region, city, verification_status) combination. Every facet of
+every filter combination is then derived from those rows in Python. Each
+facet counts the matches of all *other* active filters, so the numbers next
+to each option show what picking it would return.
+
+A full-text query (``q``) restricts the grouped rows themselves.
+
+Both the grouped rows and the per-filter facets are cached under a version
+key that handyman and profile saves bump (see base.signals), so counts are
+never recomputed until something they depend on changes.
+"""
+import hashlib
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count
+
+from handyman.models import Handyman
+from handyman.search import search_handymen
+
+FACET_CACHE_TIMEOUT = getattr(settings, 'FACET_CACHE_TIMEOUT', 3600)
+
+# Directory filter -> grouped column
+FACET_FIELDS = {
+    'service': 'user__service',
+    'region': 'user__region',
+    'city': 'user__city',
+    'verified': 'verification_status',
+}
+
+# Values of the 'verified' filter that actually filter, see base.directory
+VERIFIED_FILTERS = ['verified', 'pending']
+
+FACETS_VERSION_KEY = "directory:facets:version"
+
+
+def get_facets_version():
+    version = cache.get(FACETS_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so two concurrent first readers agree on a single version
+        if not cache.add(FACETS_VERSION_KEY, version, timeout=None):
+            version = cache.get(FACETS_VERSION_KEY, version)
+    return version
+
+
+def invalidate_facets():
+    """Retire every cached facet once the current transaction commits"""
+    transaction.on_commit(lambda: cache.set(FACETS_VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+def _digest(value):
+    # Filter values come from the query string, hash them into a safe key
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def facet_rows(version=None, q=''):
+    """
+    ``[(service, region, city, verification_status, count), ...]`` from one
+    GROUP BY, over the handymen matching the full-text query `q` if given.
+    """
+    key = f"directory:facets:rows:{version or get_facets_version()}:{_digest(q)}"
+    rows = cache.get(key)
+    if rows is None:
+        handymen = Handyman.objects.all()
+        if q:
+            handymen = search_handymen(handymen, q)
+        rows = list(
+            handymen.order_by()
+            .values_list(*FACET_FIELDS.values())
+            .annotate(n=Count('id'))
+        )
+        cache.set(key, rows, timeout=FACET_CACHE_TIMEOUT)
+    return rows
+
+
+def _active(filters):
+    """{facet index: value} for the filters that actually restrict results"""
+    active = {}
+    for index, name in enumerate(FACET_FIELDS):
+        value = filters.get(name, '')
+        if name == 'verified' and value not in VERIFIED_FILTERS:
+            continue
+        if value:
+            active[index] = value
+    return active
+
+
+def compute_facets(rows, filters):
+    """Facet counts and total for `filters` from grouped `rows`"""
+    active = _active(filters)
+    facets = {name: Counter() for name in FACET_FIELDS}
+    total = 0
+    for row in rows:
+        *values, n = row
+        mismatched = [index for index, value in active.items() if values[index] != value]
+        if not mismatched:
+            total += n
+        for index, name in enumerate(FACET_FIELDS):
+            # A facet ignores its own filter
+            if not mismatched or mismatched == [index]:
+                facets[name][values[index]] += n
+    return {'total': total, **{name: dict(counts) for name, counts in facets.items()}}
+
+
+def directory_facets(filters):
+    """
+    Cached ``{'total': n, 'service': {value: n}, 'region': ..., 'city': ...,
+    'verified': ...}`` for the directory filtered by `filters`.
+    """
+    version = get_facets_version()
+    q = filters.get('q', '')
+    combination = "\0".join([q] + [filters.get(name, '') for name in FACET_FIELDS])
+    key = f"directory:facets:{version}:{_digest(combination)}"
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(facet_rows(version, q), filters)
+        cache.set(key, facets, timeout=FACET_CACHE_TIMEOUT)
+    return facets
+
+
+def facet_options(choices, counts):
+    """``[(value, label, count), ...]`` for a filter's select options"""
+    return [(value, label, counts.get(value, 0)) for value, label in choices]
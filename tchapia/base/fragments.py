@@ -0,0 +1,60 @@
+"""
+Cached list cards.
+
+Each card (an artisan in the directory, a project in the browser) is
+rendered once and cached under a key made of the card template's digest,
+the object and its ``updated_at``. Changes to what a card shows must
+therefore move its object's ``updated_at`` forward: rating updates do so in
+handyman.ratings, profile edits and project image changes through signals
+("touching" the parent, Russian-doll style). Editing a card template changes
+its digest, which retires every card rendered from the old one.
+
+A page fetches all of its cards with one ``get_many``, then renders and
+stores only the missing ones with one ``set_many``.
+
+Cards are rendered without the request, so they can't depend on who looks
+at them.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 24 * 3600)
+
+
+def template_digest(template_name):
+    source = get_template(template_name).template.source
+    return hashlib.md5(source.encode()).hexdigest()[:12]
+
+
+def fragment_key(digest, obj, extra=''):
+    key = f"fragment:{digest}:{obj._meta.label_lower}:{obj.pk}:{obj.updated_at.timestamp()}"
+    if extra:
+        key += f":{hashlib.md5(extra.encode()).hexdigest()}"
+    return key
+
+
+def render_cards(template_name, name, objects, extra=None, prepare=None):
+    """
+    HTML of `template_name` rendered with each of `objects` as `name`, in
+    order. `extra(obj)` adds a string to an object's key for content that
+    changes without a save (e.g. "published 5 minutes ago");
+    ``prepare(objects)`` loads what the missing cards need (prefetches).
+    """
+    objects = list(objects)
+    digest = template_digest(template_name)
+    keys = [fragment_key(digest, obj, extra(obj) if extra else '') for obj in objects]
+    cards = cache.get_many(keys)
+
+    missing = [(key, obj) for key, obj in zip(keys, objects) if key not in cards]
+    if missing:
+        if prepare:
+            prepare([obj for _, obj in missing])
+        rendered = {key: render_to_string(template_name, {name: obj}) for key, obj in missing}
+        cache.set_many(rendered, timeout=FRAGMENT_CACHE_TIMEOUT)
+        cards.update(rendered)
+
+    return [mark_safe(cards[key]) for key in keys]
@@ -0,0 +1,184 @@
+"""
+Database-backed background job queue.
+
+Jobs are rows in ``base_job``. A worker claims the oldest due job with a
+conditional UPDATE (``status='queued'`` -> ``'running'``), so several workers,
+threads or processes can share the table without a broker: whoever's UPDATE
+matches the row owns it. Failed jobs are retried with exponential backoff and
+moved to the ``dead`` state once ``max_attempts`` is reached.
+
+Tasks are plain functions registered with ``@task`` in an app's ``tasks.py``
+and enqueued with ``my_task.enqueue(**kwargs)``. Keyword arguments must be
+JSON serializable (pass ids, not model instances).
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Run jobs in-process right after the enqueuing transaction commits instead of
+# waiting for a worker (JOB_QUEUE_EAGER=1 in the environment, see settings).
+# Handy for development without `manage.py run_workers`.
+JOB_QUEUE_EAGER = getattr(settings, 'JOB_QUEUE_EAGER', False)
+JOB_MAX_ATTEMPTS = getattr(settings, 'JOB_MAX_ATTEMPTS', 5)
+JOB_RETRY_BACKOFF = getattr(settings, 'JOB_RETRY_BACKOFF', 10)  # seconds, doubled per attempt
+JOB_LOCK_TIMEOUT = getattr(settings, 'JOB_LOCK_TIMEOUT', 300)  # seconds before a running job is reclaimed
+
+_registry = {}
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """Register `func` as a background task and give it an ``enqueue`` helper"""
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        _registry[task_name] = func
+        func.task_name = task_name
+        func.enqueue = lambda run_at=None, **kwargs: enqueue(
+            task_name, run_at=run_at, max_attempts=max_attempts, **kwargs
+        )
+        return func
+
+    if func is not None:
+        return decorator(func)
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise LookupError(f"No task registered under '{name}'")
+
+
+def enqueue(task_name, run_at=None, max_attempts=None, **kwargs):
+    """
+    Queue a job. When called inside a transaction the job row commits or rolls
+    back together with the data it refers to.
+    """
+    job = Job.objects.create(
+        task=task_name,
+        payload=kwargs,
+        run_at=run_at or timezone.now(),
+        max_attempts=max_attempts or JOB_MAX_ATTEMPTS,
+    )
+    if JOB_QUEUE_EAGER:
+        transaction.on_commit(lambda: run_eager(job.id))
+    return job
+
+
+def run_eager(job_id):
+    """Run a job in-process, unless a worker polling the queue claimed it first"""
+    if lock_job(job_id, 'eager', timezone.now()):
+        run_job(job_id, worker='eager')
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+def requeue_stale_jobs():
+    """Release jobs whose worker died while holding them"""
+    cutoff = timezone.now() - timedelta(seconds=JOB_LOCK_TIMEOUT)
+    return Job.objects.filter(status='running', locked_at__lt=cutoff).update(
+        status='queued', locked_by=None, locked_at=None
+    )
+
+
+def claim_job(worker):
+    """
+    Claim the next due job for `worker`, returns its id or None.
+
+    The candidate is read first and then locked with an UPDATE guarded on its
+    status; losing the race to another worker simply moves on to the next row.
+    """
+    while True:
+        now = timezone.now()
+        job_id = (
+            Job.objects.filter(status='queued', run_at__lte=now)
+            .order_by('run_at', 'id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+        if lock_job(job_id, worker, now):
+            return job_id
+
+
+def lock_job(job_id, worker, now):
+    """Mark job `job_id` as running for `worker` if it is still queued, returns whether it was"""
+    return Job.objects.filter(id=job_id, status='queued').update(
+        status='running',
+        locked_by=worker,
+        locked_at=now,
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def run_job(job_id, worker=None):
+    """Execute a claimed job and record the outcome"""
+    job = Job.objects.get(id=job_id)
+    try:
+        func = get_task(job.task)
+        with transaction.atomic():
+            func(**job.payload)
+    except Exception:
+        error = traceback.format_exc()
+        attempts = job.attempts or 1
+        if attempts >= job.max_attempts:
+            logger.error("Job #%s (%s) is dead after %d attempt(s)\n%s", job.id, job.task, attempts, error)
+            Job.objects.filter(id=job.id).update(
+                status='dead', last_error=error, locked_by=None, locked_at=None,
+                updated_at=timezone.now(),
+            )
+        else:
+            delay = JOB_RETRY_BACKOFF * 2 ** (attempts - 1)
+            logger.warning("Job #%s (%s) failed, retrying in %ss", job.id, job.task, delay)
+            Job.objects.filter(id=job.id).update(
+                status='queued', last_error=error, locked_by=None, locked_at=None,
+                run_at=timezone.now() + timedelta(seconds=delay),
+                updated_at=timezone.now(),
+            )
+        return False
+
+    Job.objects.filter(id=job.id).update(
+        status='done', locked_by=None, locked_at=None, updated_at=timezone.now()
+    )
+    return True
+
+
+def work(stop_event, poll_interval=1.0, burst=False):
+    """
+    Worker loop: claim and run jobs until `stop_event` is set. With `burst`
+    the loop exits as soon as the queue is empty.
+    """
+    worker = worker_name()
+    logger.info("Worker %s started", worker)
+    processed = 0
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            job_id = claim_job(worker)
+            if job_id is None:
+                if burst:
+                    break
+                requeue_stale_jobs()
+                stop_event.wait(poll_interval)
+                continue
+            run_job(job_id, worker=worker)
+            processed += 1
+    finally:
+        connections.close_all()
+    logger.info("Worker %s stopped after %d job(s)", worker, processed)
+    return processed
@@ -0,0 +1,211 @@
+"""
+Live notification push over Server-Sent Events.
+
+Every open stream subscribes to an in-process broker. Notifications saved in
+this process are published to it when their transaction commits. Rows written
+elsewhere (job workers, bulk fan-out, another server process) are picked up by
+a single poller per event loop, which reads the new rows of every subscribed
+user with one query per interval instead of one per connection.
+
+The poller follows created_at rather than ids: on PostgreSQL a row can commit
+after rows with higher ids, and a notification coalesced in place by
+customer.fanout keeps its id but moves its created_at forward, which pushes
+it again. Each poll rereads LIVE_POLL_OVERLAP seconds back, for rows that
+committed late, and skips the (id, created_at) pairs already pushed.
+
+Idle streams only hold an asyncio queue, so one ASGI worker can keep
+thousands of them open.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+LIVE_POLL_INTERVAL = getattr(settings, 'LIVE_POLL_INTERVAL', 2)  # seconds
+LIVE_HEARTBEAT_INTERVAL = getattr(settings, 'LIVE_HEARTBEAT_INTERVAL', 15)  # seconds
+LIVE_RETRY_DELAY = getattr(settings, 'LIVE_RETRY_DELAY', 5000)  # milliseconds, sent to EventSource
+# How late after its created_at a row may commit and still be polled
+LIVE_POLL_OVERLAP = getattr(settings, 'LIVE_POLL_OVERLAP', 30)  # seconds
+
+# Events buffered per connection before a slow client starts losing them
+LIVE_QUEUE_SIZE = 100
+
+# Notifications replayed to a client reconnecting with Last-Event-ID
+LIVE_REPLAY_LIMIT = 50
+
+EVENT_FIELDS = ['id', 'user_id', 'notification_type', 'title', 'message', 'project_id', 'created_at']
+
+
+def notification_event(notification):
+    """Event payload for a Notification instance or a values() dict"""
+    if not isinstance(notification, dict):
+        notification = {field: getattr(notification, field) for field in EVENT_FIELDS}
+    return {field: notification[field] for field in EVENT_FIELDS if field != 'user_id'}
+
+
+def event_key(event):
+    """What makes an event new: a coalesced notification is pushed again"""
+    return event['id'], event['created_at']
+
+
+def format_event(event):
+    data = json.dumps(event, cls=DjangoJSONEncoder)
+    return f"id: {event['id']}\nevent: notification\ndata: {data}\n\n"
+
+
+class Subscription:
+    """One open stream, fed from any thread through its event loop"""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+
+    def push(self, event):
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # Loop already closed, the stream is gone
+            pass
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The inbox stays authoritative, a slow client just misses the push
+            logger.warning("Dropping live notification %s for user %s", event['id'], self.user_id)
+
+
+class Broker:
+    """In-process pub/sub of notification events, keyed on user id"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._poller = None
+        # Event keys already pushed, so the poller doesn't send them twice
+        self._published = set()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id)
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+            poller = self._poller
+            if poller is None or poller.done() or poller.get_loop() is not subscription.loop:
+                self._published.clear()
+                self._poller = subscription.loop.create_task(self._poll())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, user_id, event, from_poller=False):
+        """Push `event` to every open stream of `user_id`; safe from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+            if not from_poller and self._poller is not None:
+                self._published.add(event_key(event))
+        for subscription in subscribers:
+            subscription.push(event)
+
+    async def _poll(self):
+        """Forward rows committed by other processes, until nobody listens"""
+        since = timezone.now()
+        overlap = timedelta(seconds=LIVE_POLL_OVERLAP)
+        while True:
+            await asyncio.sleep(LIVE_POLL_INTERVAL)
+            with self._lock:
+                user_ids = list(self._subscribers)
+                if not user_ids:
+                    if self._poller is asyncio.current_task():
+                        self._poller = None
+                    self._published.clear()
+                    return
+            try:
+                rows = await sync_to_async(_notifications_since)(since - overlap, user_ids)
+            except Exception:
+                logger.exception("Live notification poll failed")
+                continue
+
+            for row in rows:
+                since = max(since, row['created_at'])
+                key = event_key(row)
+                with self._lock:
+                    if key in self._published:
+                        continue
+                    self._published.add(key)
+                self.publish(row['user_id'], notification_event(row), from_poller=True)
+            with self._lock:
+                # Older keys fall out of the next polls' window
+                self._published = {key for key in self._published if key[1] >= since - overlap}
+
+
+def _notifications_since(created_at, user_ids):
+    return list(
+        Notification.objects.filter(created_at__gte=created_at, user_id__in=user_ids)
+        .order_by('created_at', 'id').values(*EVENT_FIELDS)
+    )
+
+
+def _replay(user_id, last_event_id):
+    rows = (
+        Notification.objects.filter(user_id=user_id, id__gt=last_event_id)
+        .order_by('-id').values(*EVENT_FIELDS)[:LIVE_REPLAY_LIMIT]
+    )
+    return [notification_event(row) for row in reversed(rows)]
+
+
+broker = Broker()
+
+
+def publish_notification(notification):
+    """Push a freshly committed notification to its user's open streams"""
+    broker.publish(notification.user_id, notification_event(notification))
+
+
+async def notification_stream(user_id, last_event_id=None):
+    """
+    Server-Sent Events for `user_id`: replay what was missed since
+    `last_event_id`, then push new notifications as they arrive, with a
+    comment line as keepalive while idle.
+    """
+    subscription = broker.subscribe(user_id)
+    try:
+        yield f"retry: {LIVE_RETRY_DELAY}\n\n"
+
+        replayed = set()
+        if last_event_id:
+            for event in await sync_to_async(_replay)(user_id, last_event_id):
+                replayed.add(event_key(event))
+                yield format_event(event)
+
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), LIVE_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if event_key(event) not in replayed:
+                yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.core.management.commands.createcachetable import Command as CreateCacheTable
+from django.db import connection, transaction
+
+from base.cache import SQLiteCache
+
+BENCH_TABLE = 'bench_cache_table'
+
+
+def _incr_worker(path, key, count):
+    # Runs in a child process with its own connection
+    cache = SQLiteCache(path, {})
+    for _ in range(count):
+        cache.incr(key)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the shared SQLite cache against the LocMem, file and database caches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000)
+        parser.add_argument('--batch', type=int, default=50, help="Keys per get_many/set_many")
+        parser.add_argument('--processes', type=int, default=4, help="Processes incrementing one shared counter")
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        batch = options['batch']
+        # A page of cards or a directory facet entry
+        value = {'html': '<div class="card">' + 'x' * 2000 + '</div>', 'count': 42}
+
+        with tempfile.TemporaryDirectory() as directory:
+            # The database cache table only lives inside this rolled back transaction
+            with transaction.atomic():
+                create = CreateCacheTable()
+                create.verbosity = 0
+                create.create_table(connection.alias, BENCH_TABLE, dry_run=False)
+                backends = [
+                    ('sqlite (shared)', SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {'OPTIONS': {'MAX_ENTRIES': ops * 10}})),
+                    ('locmem (per process)', LocMemCache('bench', {'OPTIONS': {'MAX_ENTRIES': ops * 10}})),
+                    ('file', FileBasedCache(os.path.join(directory, 'files'), {'OPTIONS': {'MAX_ENTRIES': ops * 10}})),
+                    ('database', DatabaseCache(BENCH_TABLE, {'OPTIONS': {'MAX_ENTRIES': ops * 10}})),
+                ]
+                self.stdout.write(f"{'backend':<22} {'set':>10} {'get':>10} {'incr':>10} {'set_many':>10} {'get_many':>10}   (ops/sec, {batch} keys per batch)")
+                for name, cache in backends:
+                    self.run(name, cache, ops, batch, value)
+                transaction.set_rollback(True)
+
+            self.shared_counter(os.path.join(directory, 'counter.sqlite3'), options['processes'], ops)
+
+    def run(self, name, cache, ops, batch, value):
+        keys = [f"bench:{i}" for i in range(ops)]
+        batches = [keys[start:start + batch] for start in range(0, ops, batch)]
+        cache.set('bench:counter', 0)
+
+        rates = [
+            self.rate(ops, lambda: [cache.set(key, value) for key in keys]),
+            self.rate(ops, lambda: [cache.get(key) for key in keys]),
+            self.rate(ops, lambda: [cache.incr('bench:counter') for _ in keys]),
+            self.rate(ops, lambda: [cache.set_many({key: value for key in keys}) for keys in batches]),
+            self.rate(ops, lambda: [cache.get_many(keys) for keys in batches]),
+        ]
+        self.stdout.write(f"{name:<22} " + " ".join(f"{rate:>10.0f}" for rate in rates))
+        cache.clear()
+
+    def rate(self, ops, run, repeat=3):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - start)
+        return ops / statistics.median(timings)
+
+    def shared_counter(self, path, processes, ops):
+        """incr() from several processes at once must not lose updates"""
+        cache = SQLiteCache(path, {})
+        cache.set('counter', 0)
+        per_process = max(ops // processes, 1)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_incr_worker, args=(path, 'counter', per_process)) for _ in range(processes)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        expected = per_process * processes
+        total = cache.get('counter')
+        style = self.style.SUCCESS if total == expected else self.style.ERROR
+        self.stdout.write(style(
+            f"Shared counter: {processes} processes x {per_process} incr -> {total} (expected {expected}), "
+            f"{expected / elapsed:.0f} incr/sec"
+        ))
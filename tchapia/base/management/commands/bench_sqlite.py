@@ -0,0 +1,113 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from base.sqlite import apply_pragmas, write_lock
+
+SCHEMA = """
+    CREATE TABLE project (id INTEGER PRIMARY KEY, name TEXT NOT NULL, offers_count INTEGER NOT NULL DEFAULT 0);
+    CREATE TABLE offer (id INTEGER PRIMARY KEY, project_id INTEGER NOT NULL, message TEXT NOT NULL);
+    CREATE INDEX offer_project ON offer (project_id);
+"""
+
+# (label, pragmas, BEGIN statement, serialize writes in-process)
+MODES = [
+    ("default journal, deferred", {}, "BEGIN", False),
+    ("WAL + pragmas, immediate", None, "BEGIN IMMEDIATE", False),
+    ("WAL + pragmas, serialized", None, "BEGIN IMMEDIATE", True),
+]
+
+
+class Command(BaseCommand):
+    help = "Benchmark concurrent writes on SQLite: default settings vs base.sqlite's pragmas and write queuing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--ops', type=int, default=200, help="Operations per thread")
+        parser.add_argument('--write-ratio', type=float, default=0.3)
+        parser.add_argument('--projects', type=int, default=50)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads x {options['ops']} ops, {options['write_ratio']:.0%} writes "
+            "(read a project, add an offer, bump its counter)"
+        )
+        self.stdout.write(f"{'mode':<28} {'ops/sec':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'locked':>7}")
+        for label, pragmas, begin, serialize in MODES:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, options['projects'])
+                self.run(label, path, pragmas, begin, serialize, options)
+
+    def seed(self, path, projects):
+        connection = sqlite3.connect(path)
+        connection.executescript(SCHEMA)
+        connection.executemany("INSERT INTO project (name) VALUES (?)", [(f"Projet {i}",) for i in range(projects)])
+        connection.commit()
+        connection.close()
+
+    def run(self, label, path, pragmas, begin, serialize, options):
+        lock = write_lock(f'bench:{label}')
+        latencies = []
+        errors = []
+        barrier = threading.Barrier(options['threads'])
+
+        def worker():
+            connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+            apply_pragmas(connection, pragmas)
+            barrier.wait()
+            mine = []
+            for _ in range(options['ops']):
+                project_id = random.randint(1, options['projects'])
+                start = time.perf_counter()
+                try:
+                    if random.random() < options['write_ratio']:
+                        if serialize:
+                            with lock:
+                                self.write(connection, begin, project_id)
+                        else:
+                            self.write(connection, begin, project_id)
+                    else:
+                        connection.execute("SELECT COUNT(*) FROM offer WHERE project_id = ?", (project_id,)).fetchone()
+                except sqlite3.OperationalError as error:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    errors.append(error)
+                mine.append(time.perf_counter() - start)
+            connection.close()
+            latencies.extend(mine)
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        latencies.sort()
+        p50 = statistics.median(latencies)
+        p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)]
+        style = self.style.ERROR if errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f"{label:<28} {len(latencies) / elapsed:>9.0f} {p50 * 1000:>8.2f} {p99 * 1000:>8.2f} "
+            f"{latencies[-1] * 1000:>8.1f} {len(errors):>7}"
+        ))
+
+    def write(self, connection, begin, project_id):
+        """A short write transaction shaped like an offer submission"""
+        connection.execute(begin)
+        try:
+            connection.execute("SELECT name FROM project WHERE id = ?", (project_id,)).fetchone()
+            connection.execute("INSERT INTO offer (project_id, message) VALUES (?, ?)", (project_id, "Disponible demain"))
+            connection.execute("UPDATE project SET offers_count = offers_count + 1 WHERE id = ?", (project_id,))
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.matching import check_index, get_index, invalidate_matching
+
+
+class Command(BaseCommand):
+    help = "Compare the in-memory matching index against the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help="Have every process rebuild its index if they differ")
+
+    def handle(self, *args, **options):
+        index = get_index()
+        problems = check_index(index)
+        for problem in problems:
+            self.stdout.write(problem)
+        if not problems:
+            self.stdout.write(self.style.SUCCESS(
+                f"Matching index is consistent: {len(index.handyman_entries)} handymen, {len(index.project_entries)} projects"
+            ))
+            return
+        if options['repair']:
+            invalidate_matching()
+            self.stdout.write(self.style.WARNING(f"{len(problems)} difference(s), every index will be rebuilt"))
+            return
+        raise CommandError(f"{len(problems)} difference(s) between the matching index and the database")
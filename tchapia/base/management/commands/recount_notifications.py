@@ -0,0 +1,13 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from base.models import Notification
+from base.notifications import recount
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized unread notification counters from the notification table"
+
+    def handle(self, *args, **options):
+        users = recount(get_user_model(), Notification)
+        self.stdout.write(self.style.SUCCESS(f"Recounted unread notifications for {users} users"))
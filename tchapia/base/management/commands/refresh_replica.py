@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from base.replica import REPLICA_DATABASE
+from base.sqlite import apply_pragmas
+
+
+class Command(BaseCommand):
+    help = "Copy the database into the replica file (DATABASE_REPLICA_PATH) with SQLite's online backup API"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024, help="Pages copied per step; writers may run between steps")
+        parser.add_argument('--every', type=float, default=0, help="Repeat every N seconds instead of copying once")
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        replica = connections[REPLICA_DATABASE].settings_dict['NAME']
+        # "file:/path?mode=ro" -> /path
+        target = replica.removeprefix('file:').split('?', 1)[0]
+        if os.path.abspath(target) == os.path.abspath(str(source)):
+            raise CommandError("The replica reads the database file itself; set DATABASE_REPLICA_PATH to use a copy.")
+
+        while True:
+            start = time.perf_counter()
+            self.refresh(str(source), target, options['pages'])
+            self.stdout.write(f"Replica {target} refreshed in {time.perf_counter() - start:.2f}s")
+            if not options['every']:
+                break
+            time.sleep(options['every'])
+
+    def refresh(self, source, target, pages):
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(target)
+        try:
+            # WAL on the copy too, so replica readers keep reading while it is written
+            apply_pragmas(dst, {'journal_mode': 'WAL', 'busy_timeout': 5000})
+            src.backup(dst, pages=pages)
+        finally:
+            src.close()
+            dst.close()
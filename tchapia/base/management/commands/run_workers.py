@@ -0,0 +1,92 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from base.jobs import requeue_stale_jobs, work
+from base.matching import get_index
+
+
+def _process_worker(poll_interval, burst):
+    # Child processes stop on SIGTERM/SIGINT like the parent
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *args: stop_event.set())
+    # Inherited from the parent when forked, built here otherwise
+    get_index()
+    work(stop_event, poll_interval=poll_interval, burst=burst)
+
+
+class Command(BaseCommand):
+    help = "Run background job workers against the database queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=2, help="Number of workers")
+        parser.add_argument('--processes', action='store_true', help="Use worker processes instead of threads")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--burst', action='store_true', help="Exit once the queue is empty")
+
+    def handle(self, *args, **options):
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+        burst = options['burst']
+
+        released = requeue_stale_jobs()
+        if released:
+            self.stdout.write(f"Requeued {released} stale job(s)")
+
+        # Fan-out jobs read their recipients from the matching index: build
+        # it now rather than in the first of them
+        index = get_index()
+        self.stdout.write(
+            f"Matching index built: {len(index.handyman_entries)} handymen, {len(index.project_entries)} projects"
+        )
+
+        mode = "process" if options['processes'] else "thread"
+        self.stdout.write(f"Starting {concurrency} {mode} worker(s)...")
+
+        if options['processes']:
+            self.run_processes(concurrency, poll_interval, burst)
+        else:
+            self.run_threads(concurrency, poll_interval, burst)
+
+        self.stdout.write(self.style.SUCCESS("Workers stopped"))
+
+    def run_threads(self, concurrency, poll_interval, burst):
+        stop_event = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop_event.set())
+
+        threads = [
+            threading.Thread(target=work, args=(stop_event,), kwargs={'poll_interval': poll_interval, 'burst': burst})
+            for _ in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            stop_event.set()
+            for thread in threads:
+                thread.join()
+
+    def run_processes(self, concurrency, poll_interval, burst):
+        # Never share the parent's database connection with forked children
+        connections.close_all()
+        processes = [
+            multiprocessing.Process(target=_process_worker, args=(poll_interval, burst))
+            for _ in range(concurrency)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            for process in processes:
+                process.join()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
@@ -0,0 +1,332 @@
+"""
+In-memory matching index between artisans and projects.
+
+Artisans see the open projects of their (service, region) and new projects
+are pushed to the available artisans of theirs. Instead of asking the
+database each time, every process keeps an inverted index
+
+    (service, region, city) -> available handyman ids
+    (service, region, city) -> open project ids
+
+built on first use and updated by model signals (see base.signals) once the
+writing transaction commits.
+
+Each change also increments a counter in the cache and is logged there
+under its new value as the kind and id of the row it touched. A process
+whose index is exactly one change behind applies its own change in place.
+When another process wrote, the next read catches up: it re-reads the
+logged rows by id and applies them. The index is only rebuilt when the log
+has a hole (an expired entry, a bulk write through invalidate_matching) or
+is more than MATCHING_CHANGE_LOG_SIZE changes ahead. The counter is only
+shared between processes if the cache is, so indexes are also rebuilt after
+MATCHING_INDEX_MAX_AGE seconds.
+
+A build reads every available handyman and open project, so it stays off
+the request path where it can: ``manage.py run_workers`` builds the index
+before taking jobs, and an index that is only too old keeps being served
+while a thread rebuilds it. The first use in a web process and a gap in
+the change log still rebuild before returning. ``check_index``
+compares an index against the database (``manage.py check_matching_index``).
+"""
+import random
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q
+
+from customer.models import Project
+from handyman.models import Handyman
+
+MATCHING_INDEX_MAX_AGE = getattr(settings, 'MATCHING_INDEX_MAX_AGE', 300)
+
+MATCHING_VERSION_KEY = "matching:version"
+
+# Changes other processes can catch up with; an index further behind is rebuilt
+MATCHING_CHANGE_LOG_SIZE = getattr(settings, 'MATCHING_CHANGE_LOG_SIZE', 1000)
+MATCHING_CHANGE_TIMEOUT = 3600
+
+# Columns an index entry is made of
+HANDYMAN_FIELDS = ('id', 'user_id', 'user__service', 'user__region', 'user__city', 'availability', 'notification_digest')
+PROJECT_FIELDS = ('id', 'service', 'region', 'city', 'status')
+
+# Project statuses artisans can still see and bid on
+OPEN_STATUSES = ('published', 'in_progress')
+
+
+def _initial_version():
+    # Random start, so a counter lost from the cache doesn't restart at a
+    # version some process still holds
+    return random.randrange(2 ** 31)
+
+
+def get_matching_version():
+    version = cache.get(MATCHING_VERSION_KEY)
+    if version is None:
+        cache.add(MATCHING_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(MATCHING_VERSION_KEY)
+    return version
+
+
+def _change_key(version):
+    return f"matching:change:{version}"
+
+
+def _next_version():
+    try:
+        return cache.incr(MATCHING_VERSION_KEY)
+    except ValueError:
+        cache.add(MATCHING_VERSION_KEY, _initial_version(), timeout=None)
+        return cache.incr(MATCHING_VERSION_KEY)
+
+
+class MatchingIndex:
+    def __init__(self):
+        self.version = None
+        self.built_at = 0.0
+        # (service, region, city) -> ids
+        self.handymen = defaultdict(set)
+        self.projects = defaultdict(set)
+        # handyman id -> (key, user id, per-project notifications)
+        self.handyman_entries = {}
+        # user id -> handyman id, to follow profile edits
+        self.handyman_users = {}
+        # project id -> (key, status)
+        self.project_entries = {}
+
+    def put_handyman(self, handyman_id, user_id, service, region, city, available, instant):
+        self.drop_handyman(handyman_id)
+        if not available:
+            return
+        key = (service, region, city)
+        self.handymen[key].add(handyman_id)
+        self.handyman_entries[handyman_id] = (key, user_id, instant)
+        self.handyman_users[user_id] = handyman_id
+
+    def drop_handyman(self, handyman_id):
+        entry = self.handyman_entries.pop(handyman_id, None)
+        if entry is None:
+            return
+        key, user_id, _ = entry
+        self.handymen[key].discard(handyman_id)
+        if not self.handymen[key]:
+            del self.handymen[key]
+        self.handyman_users.pop(user_id, None)
+
+    def move_user(self, user_id, service, region, city):
+        """Follow a change of an artisan's service, region or city"""
+        handyman_id = self.handyman_users.get(user_id)
+        if handyman_id is None:
+            return
+        _, _, instant = self.handyman_entries[handyman_id]
+        self.put_handyman(handyman_id, user_id, service, region, city, True, instant)
+
+    def put_project(self, project_id, service, region, city, status):
+        self.drop_project(project_id)
+        if status not in OPEN_STATUSES:
+            return
+        key = (service, region, city)
+        self.projects[key].add(project_id)
+        self.project_entries[project_id] = (key, status)
+
+    def drop_project(self, project_id):
+        entry = self.project_entries.pop(project_id, None)
+        if entry is None:
+            return
+        key, _ = entry
+        self.projects[key].discard(project_id)
+        if not self.projects[key]:
+            del self.projects[key]
+
+    def _keys(self, buckets, service, region, city):
+        if city:
+            return [(service, region, city)] if (service, region, city) in buckets else []
+        return [key for key in buckets if key[0] == service and key[1] == region]
+
+    def handyman_ids(self, service, region, city=None):
+        """Available handymen of (service, region), of one city if given"""
+        return set().union(*(self.handymen[key] for key in self._keys(self.handymen, service, region, city)))
+
+    def subscriber_user_ids(self, service, region):
+        """User ids of the matching handymen who want per-project notifications"""
+        ids = []
+        for handyman_id in self.handyman_ids(service, region):
+            _, user_id, instant = self.handyman_entries[handyman_id]
+            if instant:
+                ids.append(user_id)
+        return ids
+
+    def project_ids(self, service, region, city=None, status=None):
+        """Open projects of (service, region), narrowed to a city and status if given"""
+        ids = set().union(*(self.projects[key] for key in self._keys(self.projects, service, region, city)))
+        if status:
+            ids = {project_id for project_id in ids if self.project_entries[project_id][1] == status}
+        return ids
+
+    def project_counts(self, service, region):
+        """``{status: n}`` over the open projects of (service, region)"""
+        counts = dict.fromkeys(OPEN_STATUSES, 0)
+        for project_id in self.project_ids(service, region):
+            counts[self.project_entries[project_id][1]] += 1
+        return counts
+
+
+def _put_handymen(index, rows):
+    """Index HANDYMAN_FIELDS rows, returning their ids"""
+    handyman_ids = set()
+    for handyman_id, user_id, service, region, city, available, digest in rows:
+        index.put_handyman(handyman_id, user_id, service, region, city, available, digest == 'off')
+        handyman_ids.add(handyman_id)
+    return handyman_ids
+
+
+def build_index():
+    """A MatchingIndex loaded from the database"""
+    index = MatchingIndex()
+    # Changes are applied on top of what was loaded: never load from a
+    # replica that may lag behind (see base.replica)
+    handymen = Handyman.objects.using(DEFAULT_DB_ALIAS).filter(availability=True).values_list(*HANDYMAN_FIELDS)
+    _put_handymen(index, handymen.iterator(chunk_size=2000))
+    # Unordered, read from project_status_idx
+    projects = Project.objects.using(DEFAULT_DB_ALIAS).filter(status__in=OPEN_STATUSES).order_by().values_list(
+        *PROJECT_FIELDS,
+    )
+    for row in projects.iterator(chunk_size=2000):
+        index.put_project(*row)
+    index.built_at = time.monotonic()
+    return index
+
+
+def catch_up(index, version):
+    """
+    Bring `index` to `version` from the change log, re-reading the rows the
+    missing changes touched. False, with `index` untouched, if the log
+    doesn't cover the gap.
+    """
+    if not 0 < version - index.version <= MATCHING_CHANGE_LOG_SIZE:
+        return False
+    keys = [_change_key(missed) for missed in range(index.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) < len(keys):
+        return False
+
+    changed = defaultdict(set)
+    for kind, object_id in changes.values():
+        changed[kind].add(object_id)
+    if changed['handyman'] or changed['artisan']:
+        handymen = Handyman.objects.using(DEFAULT_DB_ALIAS).filter(
+            Q(id__in=changed['handyman']) | Q(user_id__in=changed['artisan'])
+        ).values_list(*HANDYMAN_FIELDS)
+        found = _put_handymen(index, handymen)
+        for handyman_id in changed['handyman'] - found:
+            index.drop_handyman(handyman_id)
+    if changed['project']:
+        found = set()
+        for row in Project.objects.using(DEFAULT_DB_ALIAS).filter(id__in=changed['project']).values_list(*PROJECT_FIELDS):
+            index.put_project(*row)
+            found.add(row[0])
+        for project_id in changed['project'] - found:
+            index.drop_project(project_id)
+    index.version = version
+    return True
+
+
+def check_index(index):
+    """Differences between `index` and the database, as readable strings"""
+    fresh = build_index()
+    problems = []
+    for name, indexed, actual in [
+        ('handyman', index.handyman_entries, fresh.handyman_entries),
+        ('project', index.project_entries, fresh.project_entries),
+    ]:
+        for object_id in sorted(indexed.keys() - actual.keys()):
+            problems.append(f"{name} #{object_id} is indexed but does not match in the database")
+        for object_id in sorted(actual.keys() - indexed.keys()):
+            problems.append(f"{name} #{object_id} is missing from the index")
+        for object_id in sorted(indexed.keys() & actual.keys()):
+            if indexed[object_id] != actual[object_id]:
+                problems.append(f"{name} #{object_id} is indexed as {indexed[object_id]}, database has {actual[object_id]}")
+    return problems
+
+
+_index = None
+_lock = threading.RLock()
+_refresh_thread = None
+
+
+def get_index():
+    """
+    This process's index. It is built on first use and catches up with the
+    changes of other processes, or is rebuilt if it can't; once older than
+    MATCHING_INDEX_MAX_AGE it is still returned while a thread rebuilds it.
+    """
+    global _index
+    with _lock:
+        version = get_matching_version()
+        index = _index
+        if index is None or (index.version != version and not catch_up(index, version)):
+            index = build_index()
+            index.version = version
+            _index = index
+        elif time.monotonic() - index.built_at > MATCHING_INDEX_MAX_AGE:
+            _start_refresh(version)
+        return index
+
+
+def _start_refresh(version):
+    global _refresh_thread
+    if _refresh_thread is not None and _refresh_thread.is_alive():
+        return
+    _refresh_thread = threading.Thread(target=_refresh, args=(version,), name='matching-index', daemon=True)
+    _refresh_thread.start()
+
+
+def _refresh(version):
+    global _index
+    try:
+        index = build_index()
+    finally:
+        # This thread's own connections
+        connections.close_all()
+    index.version = version
+    with _lock:
+        # Changes committed during the build were only applied to the
+        # current index, which is kept then
+        if _index is not None and _index.version == version:
+            _index = index
+
+
+def reset_index():
+    global _index
+    with _lock:
+        _index = None
+
+
+def record_change(kind, object_id, apply):
+    """
+    Call ``apply(index)`` on this process's index once the current
+    transaction commits, and log the change for other processes: `kind` is
+    'handyman', 'artisan' (by user id) or 'project'.
+    """
+    def commit():
+        with _lock:
+            version = _next_version()
+            cache.set(_change_key(version), (kind, object_id), timeout=MATCHING_CHANGE_TIMEOUT)
+            if _index is not None and _index.version == version - 1:
+                apply(_index)
+                _index.version = version
+    transaction.on_commit(commit)
+
+
+def invalidate_matching():
+    """
+    Have every process rebuild its index, for bulk writes that bypass
+    signals: the version is bumped without a change log entry.
+    """
+    def commit():
+        with _lock:
+            _next_version()
+    transaction.on_commit(commit)
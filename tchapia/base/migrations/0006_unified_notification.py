@@ -0,0 +1,64 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_job'),
+        ('customer', '0009_customernotification_customer_notif_unread_idx_and_more'),
+        ('handyman', '0009_handyman_notification_digest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='notification',
+            old_name='type',
+            new_name='notification_type',
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('new_project', 'New Project'), ('project_update', 'Project Update'), ('offer_status', 'Offer Status'), ('digest', 'Digest'), ('new_offer', 'New Offer'), ('offer_update', 'Offer Update'), ('message', 'Message')], max_length=50),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='title',
+            field=models.CharField(default='', max_length=200),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='message',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='offer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='handyman.projectoffer'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='payload',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='is_read',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='base_notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'created_at'], name='base_notif_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def recount_unread(apps, schema_editor):
+    User = apps.get_model('userauths', 'User')
+    Notification = apps.get_model('base', 'Notification')
+    unread = (
+        Notification.objects.filter(user=models.OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('user')
+        .annotate(n=models.Count('id'))
+        .values('n')
+    )
+    User.objects.update(
+        unread_notifications_count=Coalesce(models.Subquery(unread, output_field=models.IntegerField()), models.Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_unified_notification'),
+        ('customer', '0010_move_notifications_to_base'),
+        ('handyman', '0010_move_notifications_to_base'),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_unread, migrations.RunPython.noop),
+    ]
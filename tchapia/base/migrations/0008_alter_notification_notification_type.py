@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0007_recount_unread_notifications'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('new_project', 'New Project'), ('project_update', 'Project Update'), ('offer_status', 'Offer Status'), ('digest', 'Digest'), ('saved_search', 'Saved Search'), ('new_offer', 'New Offer'), ('offer_update', 'Offer Update'), ('message', 'Message')], max_length=50),
+        ),
+    ]
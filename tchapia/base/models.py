@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from .notifications import mark_read
 
 STATUS_CHOICES = [
     ('active', 'Active'),
@@ -20,6 +21,23 @@ PAYMENT_METHOD_CHOICES = [
     ('cash', 'Cash'),
 ]
 
+class DenormalizedFieldsMixin:
+    """
+    For models whose DENORMALIZED_FIELDS are only ever changed with F()
+    updates: a full save() of a loaded instance (profile forms) writes every
+    other field, never the possibly stale values it loaded.
+    """
+    DENORMALIZED_FIELDS = []
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DENORMALIZED_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+
 class Service(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
@@ -50,16 +68,83 @@ class Billing(models.Model):
     class Meta:
         db_table = 'base_billing'
 
+NOTIFICATION_TYPES = [
+    # Sent to artisans
+    ('new_project', 'New Project'),
+    ('project_update', 'Project Update'),
+    ('offer_status', 'Offer Status'),
+    ('digest', 'Digest'),
+    ('saved_search', 'Saved Search'),
+    # Sent to customers
+    ('new_offer', 'New Offer'),
+    ('offer_update', 'Offer Update'),
+    # Either
+    ('message', 'Message'),
+]
+
+class NotificationQuerySet(models.QuerySet):
+    def mark_read(self):
+        return mark_read(self)
+
+
 class Notification(models.Model):
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    """
+    Notifications for every kind of user. Type specific data that has no
+    column of its own goes in `payload` (e.g. the project ids of a digest).
+    """
+    # No single-column index: the composite indexes below lead with user
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications', db_index=False)
+    notification_type = models.CharField(max_length=50, choices=NOTIFICATION_TYPES)
+    title = models.CharField(max_length=200, default='')
+    message = models.TextField(blank=True, default='')
     project = models.ForeignKey('customer.Project', on_delete=models.CASCADE, blank=True, null=True)
+    offer = models.ForeignKey('handyman.ProjectOffer', on_delete=models.CASCADE, blank=True, null=True)
     service = models.ForeignKey('base.Service', on_delete=models.CASCADE, blank=True, null=True)
-    type = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict, blank=True)
+    is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = NotificationQuerySet.as_manager()
+
     def __str__(self):
-        return f"Notification for {self.user.email} - {self.type}"
+        return f"Notification for {self.user.email} - {self.notification_type}"
 
     class Meta:
         db_table = 'base_notification'
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Inbox pages, the dropdown and "mark all read" for one user
+            models.Index(fields=['user', 'is_read', 'created_at'], name='base_notif_unread_idx'),
+            models.Index(fields=['user', 'created_at'], name='base_notif_inbox_idx'),
+        ]
+
+
+JOB_STATUS_CHOICES = [
+    ('queued', 'Queued'),
+    ('running', 'Running'),
+    ('done', 'Done'),
+    ('dead', 'Dead'),
+]
+
+class Job(models.Model):
+    task = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=JOB_STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Job #{self.id} - {self.task} ({self.status})"
+
+    class Meta:
+        db_table = 'base_job'
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at'], name='base_job_status_run_at_idx'),
+        ]
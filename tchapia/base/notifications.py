@@ -0,0 +1,138 @@
+"""
+Helpers keeping the denormalized ``User.unread_notifications_count`` counter
+in step with the user's notification rows.
+
+Counters are only ever changed with F() expressions so concurrent writers
+never overwrite each other. Anything that slips through (raw SQL, admin bulk
+actions) is repaired by ``manage.py recount_notifications``.
+
+Every counter change also bumps the user's notification cache version, so
+the cached dropdown data read by the context processor is never stale.
+"""
+import uuid
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+NOTIFICATION_CACHE_TIMEOUT = getattr(settings, 'NOTIFICATION_CACHE_TIMEOUT', 300)
+
+
+def cache_version_key(user_id):
+    return f"notifications:version:{user_id}"
+
+
+def cache_data_key(user_id, version):
+    return f"notifications:data:{user_id}:{version}"
+
+
+def get_cache_version(user_id):
+    """Current notification cache version for `user_id`, creating one if needed"""
+    key = cache_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        # add() so two concurrent first readers agree on a single version
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key, version)
+    return version
+
+
+def invalidate_notification_cache(user_ids):
+    """
+    Retire the cached notification data of `user_ids` by giving them a new
+    version. Runs after commit so readers can't re-cache uncommitted state.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+
+    def bump():
+        version = uuid.uuid4().hex
+        cache.set_many({cache_version_key(user_id): version for user_id in user_ids}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def _user_model():
+    from django.contrib.auth import get_user_model
+    return get_user_model()
+
+
+def bump_unread(user_ids, delta=1):
+    """Add `delta` to the unread counter of every user in `user_ids`"""
+    user_ids = list(user_ids)
+    if not user_ids or not delta:
+        return 0
+    updated = _user_model().objects.filter(id__in=user_ids).update(
+        unread_notifications_count=Greatest(F('unread_notifications_count') + delta, Value(0))
+    )
+    invalidate_notification_cache(user_ids)
+    return updated
+
+
+def bump_unread_counts(counts):
+    """Apply a {user_id: delta} mapping with one UPDATE per distinct delta"""
+    by_delta = defaultdict(list)
+    for user_id, delta in counts.items():
+        by_delta[delta].append(user_id)
+    for delta, user_ids in by_delta.items():
+        bump_unread(user_ids, delta)
+
+
+def unread_counts(queryset):
+    """{user_id: number of unread rows} for the notifications in `queryset`"""
+    rows = (
+        queryset.filter(is_read=False)
+        .order_by()
+        .values('user')
+        .annotate(n=Count('id'))
+    )
+    return {row['user']: row['n'] for row in rows}
+
+
+def forget_unread(queryset):
+    """Decrement counters for unread rows in `queryset` that are about to go away"""
+    counts = unread_counts(queryset)
+    bump_unread_counts({user_id: -n for user_id, n in counts.items()})
+    return sum(counts.values())
+
+
+def mark_read(queryset):
+    """Mark every notification in `queryset` as read, returns the number of rows changed"""
+    with transaction.atomic():
+        counts = unread_counts(queryset)
+        updated = queryset.filter(is_read=False).update(is_read=True)
+        bump_unread_counts({user_id: -n for user_id, n in counts.items()})
+        return updated
+
+
+def mark_all_read(user):
+    """
+    Mark every notification of `user` as read with a single UPDATE and reset
+    its counter, without counting the rows first.
+    """
+    with transaction.atomic():
+        updated = user.notifications.filter(is_read=False).update(is_read=True)
+        _user_model().objects.filter(id=user.id).update(unread_notifications_count=0)
+        invalidate_notification_cache([user.id])
+    user.unread_notifications_count = 0
+    return updated
+
+
+def recount(user_model, notification_model):
+    """Recompute every user's counter from the notification table in one UPDATE"""
+    unread = (
+        notification_model.objects.filter(user=OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('user')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    return user_model.objects.update(
+        unread_notifications_count=Coalesce(Subquery(unread, output_field=models.IntegerField()), Value(0))
+    )
@@ -0,0 +1,141 @@
+"""
+Full-page cache for anonymous visitors of the public pages.
+
+Pages are cached per host, path and normalized query string (parameters
+sorted, empty ones dropped). Each entry records the page version it was
+rendered at; saves of the models the pages show bump the version (see
+base.signals), which makes every entry stale at once.
+
+A stale entry, or one older than PAGE_CACHE_TIMEOUT, keeps being served
+for up to PAGE_CACHE_STALE_TIMEOUT more seconds while a single request
+renders the page again: whoever takes the page's lock re-renders, everyone
+else gets the stale copy. When nothing is cached yet, the others wait up to
+PAGE_CACHE_WAIT seconds for that render instead of all hitting the database.
+
+Signed-in users, non-GET requests, requests with pending flash messages
+and responses that set cookies are never cached.
+"""
+import hashlib
+import time
+import uuid
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+PAGE_CACHE_TIMEOUT = getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+PAGE_CACHE_STALE_TIMEOUT = getattr(settings, 'PAGE_CACHE_STALE_TIMEOUT', 3600)
+PAGE_CACHE_WAIT = getattr(settings, 'PAGE_CACHE_WAIT', 2.0)
+
+# Seconds a render may hold a page's lock, in case it dies without releasing it
+PAGE_CACHE_LOCK_TIMEOUT = 30
+
+PAGE_VERSION_KEY = "page:version"
+
+# Response headers replayed from a cache entry
+CACHED_HEADERS = ['Content-Type', 'Content-Language', 'Vary']
+
+
+def get_page_version():
+    version = cache.get(PAGE_VERSION_KEY)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(PAGE_VERSION_KEY, version, timeout=None):
+            version = cache.get(PAGE_VERSION_KEY, version)
+    return version
+
+
+def invalidate_pages():
+    """Make every cached page stale once the current transaction commits"""
+    transaction.on_commit(lambda: cache.set(PAGE_VERSION_KEY, uuid.uuid4().hex, timeout=None))
+
+
+def normalized_query(query_dict):
+    return urlencode(sorted(
+        (name, value) for name, values in query_dict.lists() for value in values if value
+    ))
+
+
+def page_key(request):
+    url = f"{request.get_host()}{request.path}?{normalized_query(request.GET)}"
+    return f"page:{hashlib.md5(url.encode()).hexdigest()}"
+
+
+def cacheable(request):
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        # len() doesn't mark the messages as read
+        and not len(messages.get_messages(request))
+    )
+
+
+def _response(entry, status):
+    response = HttpResponse(entry['content'], status=entry['status'])
+    for header, value in entry['headers'].items():
+        response[header] = value
+    # The entry is only valid without a session, whatever the view added
+    patch_vary_headers(response, ('Cookie',))
+    response['X-Page-Cache'] = status
+    return response
+
+
+def _render(view, request, args, kwargs, key, version):
+    response = view(request, *args, **kwargs)
+    storable = (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        # A CSRF token in the page belongs to this visitor only
+        and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE')
+    )
+    if storable:
+        entry = {
+            'content': response.content,
+            'status': response.status_code,
+            'headers': {header: response[header] for header in CACHED_HEADERS if header in response},
+            'version': version,
+            'stored_at': time.time(),
+        }
+        cache.set(key, entry, timeout=PAGE_CACHE_TIMEOUT + PAGE_CACHE_STALE_TIMEOUT)
+    response['X-Page-Cache'] = 'miss'
+    return response
+
+
+def anonymous_page_cache(view):
+    """Serve `view` from the page cache to anonymous visitors"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not cacheable(request):
+            return view(request, *args, **kwargs)
+
+        key = page_key(request)
+        version = get_page_version()
+        entry = cache.get(key)
+        if entry is not None and entry['version'] == version and time.time() - entry['stored_at'] < PAGE_CACHE_TIMEOUT:
+            return _response(entry, 'hit')
+
+        lock_key = f"{key}:lock"
+        if cache.add(lock_key, 1, timeout=PAGE_CACHE_LOCK_TIMEOUT):
+            try:
+                return _render(view, request, args, kwargs, key, version)
+            finally:
+                cache.delete(lock_key)
+
+        # Another request is rendering this page
+        if entry is not None:
+            return _response(entry, 'stale')
+        deadline = time.monotonic() + PAGE_CACHE_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            entry = cache.get(key)
+            if entry is not None:
+                return _response(entry, 'hit')
+        return view(request, *args, **kwargs)
+
+    return wrapper
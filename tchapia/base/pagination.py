@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET, each page continues from the sort key of the last row of
+the previous page, so fetching page N costs the same as page 1 as long as an
+index matches the ordering. The ordering must end with a unique field (``id``)
+to make the key total, and its fields must not be nullable. Annotations such
+as a search rank can be part of the key, their values are kept as decoded
+from JSON.
+"""
+import base64
+import datetime
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates microseconds, which would skip rows created
+    # within the same millisecond
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _field_name(ordering_field):
+    return ordering_field.lstrip('-')
+
+
+def _field(model, name):
+    # Follow relations such as 'user__region'; None for annotations
+    field = None
+    for part in name.split('__'):
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None
+        if field.is_relation:
+            model = field.related_model
+    return field
+
+
+def _to_python(model, name, value):
+    field = _field(model, name)
+    if value is None or field is None:
+        return value
+    return field.to_python(value)
+
+
+def encode_cursor(row, ordering):
+    """Cursor pointing just after `row` (a model instance or a values() dict)"""
+    values = []
+    for ordering_field in ordering:
+        name = _field_name(ordering_field)
+        if isinstance(row, dict):
+            value = row[name]
+        else:
+            value = row
+            for part in name.split('__'):
+                value = getattr(value, part)
+        values.append(value)
+    raw = json.dumps(values, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    """Sort key values encoded in `cursor`, converted back to Python types"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    try:
+        return [
+            _to_python(model, _field_name(ordering_field), value)
+            for ordering_field, value in zip(ordering, values)
+        ]
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def after(ordering, values):
+    """
+    Q selecting the rows that sort strictly after the key `values`.
+
+    The OR chain (``a < x OR (a = x AND id < y)``) alone can't be used as an
+    index range, so the database would read and filter every row before the
+    cursor. It is ANDed with a bound on the first key (``a <= x``), which
+    the index seeks to.
+    """
+    condition = Q(pk__in=[])
+    equal = Q()
+    for ordering_field, value in zip(ordering, values):
+        name = _field_name(ordering_field)
+        lookup = 'lt' if ordering_field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f"{name}__{lookup}": value})
+        equal &= Q(**{name: value})
+    first = ordering[0]
+    bound = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f"{_field_name(first)}__{bound}": values[0]}) & condition
+
+
+def keyset_page(queryset, ordering, cursor=None, page_size=20):
+    """
+    One page of `queryset` sorted by `ordering`, starting after `cursor`.
+
+    Returns ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    An invalid cursor restarts from the first page.
+    """
+    queryset = queryset.order_by(*ordering)
+    if cursor:
+        try:
+            values = decode_cursor(cursor, queryset.model, ordering)
+        except InvalidCursor:
+            values = None
+        if values is not None:
+            queryset = queryset.filter(after(ordering, values))
+
+    # Fetch one extra row to know whether another page exists
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1], ordering)
+    return rows, next_cursor
@@ -0,0 +1,84 @@
+"""
+Reads of read-only pages from a separate, read-only database connection.
+
+Views decorated with `read_only_view` run their queries on the
+REPLICA_DATABASE connection ("replica" in settings.DATABASES), everything
+else stays on "default". By default the replica opens the same SQLite file
+in read-only mode (``mode=ro``) with its own pragmas (see base.sqlite): in
+WAL mode its reads never wait for writers, and it can't take the write lock
+or queue behind write transactions. It may instead point at a copy kept
+fresh by ``manage.py refresh_replica`` (DATABASE_REPLICA_PATH), which then
+lags by the refresh interval.
+
+Read-your-writes: after a signed-in user sends a request that may write
+(anything but GET/HEAD/OPTIONS), their requests stay on "default" for
+REPLICA_STICKY_SECONDS. Reads inside a transaction on "default" also stay
+there, so they see that transaction's own writes. Writes always go to
+"default", including get_or_create() in read-only views.
+"""
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_DATABASE = getattr(settings, 'REPLICA_DATABASE', 'replica')
+REPLICA_STICKY_SECONDS = getattr(settings, 'REPLICA_STICKY_SECONDS', 60)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Whether the current request reads from the replica
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def sticky_key(user_id):
+    return f"replica:sticky:{user_id}"
+
+
+def read_only_view(view):
+    """Mark `view` as only reading, so GETs can be served from the replica"""
+    # Decorators applied on top copy the attribute along with __dict__
+    view.read_only = True
+    return view
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _use_replica.set(False)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_replica.reset(token)
+        # request.user is the new user after a login
+        if request.method not in SAFE_METHODS and request.user.is_authenticated:
+            cache.set(sticky_key(request.user.pk), True, timeout=REPLICA_STICKY_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            getattr(view_func, 'read_only', False)
+            and request.method in SAFE_METHODS
+            and REPLICA_DATABASE in settings.DATABASES
+            and not (request.user.is_authenticated and cache.get(sticky_key(request.user.pk)))
+        ):
+            _use_replica.set(True)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and not connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both connections hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_DATABASE
@@ -0,0 +1,134 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from customer.models import Project
+from handyman.models import Handyman, HandymanPortfolioImage, HandymanRating
+from .facets import invalidate_facets
+from .live import publish_notification
+from .matching import record_change
+from .page_cache import invalidate_pages
+from .models import Notification
+from .notifications import bump_unread
+
+# User fields the directory facets are grouped or searched on
+FACET_USER_FIELDS = {'service', 'region', 'city', 'first_name', 'last_name', 'bio'}
+
+# User fields no public page shows
+PAGE_IGNORED_USER_FIELDS = {'last_login', 'password', 'unread_notifications_count'}
+
+# Fields the matching index is keyed on
+MATCHING_USER_FIELDS = {'service', 'region', 'city'}
+MATCHING_HANDYMAN_FIELDS = {'user', 'availability', 'notification_digest'}
+MATCHING_PROJECT_FIELDS = {'service', 'region', 'city', 'status'}
+
+
+@receiver(post_save, sender=Notification)
+def count_new_notification(sender, instance, created, **kwargs):
+    if created and not instance.is_read:
+        bump_unread([instance.user_id])
+
+
+@receiver(post_save, sender=Notification)
+def push_new_notification(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publish_notification(instance))
+
+
+@receiver(post_save, sender=Handyman)
+@receiver(post_delete, sender=Handyman)
+def handyman_changed(sender, **kwargs):
+    invalidate_facets()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def profile_changed(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, don't throw the facets away for those
+    if update_fields is not None and not FACET_USER_FIELDS & set(update_fields):
+        return
+    if instance.user_type == 'artisan':
+        invalidate_facets()
+
+
+@receiver(post_save, sender=Handyman)
+def match_handyman(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not MATCHING_HANDYMAN_FIELDS & set(update_fields):
+        return
+    user = instance.user
+    entry = (
+        instance.pk, instance.user_id, user.service, user.region, user.city,
+        instance.availability, instance.notification_digest == 'off',
+    )
+    record_change('handyman', instance.pk, lambda index: index.put_handyman(*entry))
+
+
+@receiver(post_delete, sender=Handyman)
+def unmatch_handyman(sender, instance, **kwargs):
+    handyman_id = instance.pk
+    record_change('handyman', handyman_id, lambda index: index.drop_handyman(handyman_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def match_profile(sender, instance, update_fields=None, **kwargs):
+    if instance.user_type != 'artisan':
+        return
+    if update_fields is not None and not MATCHING_USER_FIELDS & set(update_fields):
+        return
+    entry = (instance.pk, instance.service, instance.region, instance.city)
+    record_change('artisan', instance.pk, lambda index: index.move_user(*entry))
+
+
+@receiver(post_save, sender=Project)
+def match_project(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not MATCHING_PROJECT_FIELDS & set(update_fields):
+        return
+    entry = (instance.pk, instance.service, instance.region, instance.city, instance.status)
+    record_change('project', instance.pk, lambda index: index.put_project(*entry))
+
+
+@receiver(post_delete, sender=Project)
+def unmatch_project(sender, instance, **kwargs):
+    project_id = instance.pk
+    record_change('project', project_id, lambda index: index.drop_project(project_id))
+
+
+@receiver(post_save, sender=Handyman)
+@receiver(post_delete, sender=Handyman)
+@receiver(post_save, sender=HandymanRating)
+@receiver(post_delete, sender=HandymanRating)
+@receiver(post_save, sender=HandymanPortfolioImage)
+@receiver(post_delete, sender=HandymanPortfolioImage)
+def public_page_changed(sender, **kwargs):
+    invalidate_pages()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def public_profile_changed(sender, instance, update_fields=None, **kwargs):
+    # Artisans' and reviewers' names and pictures are on public pages, logins aren't
+    if update_fields is not None and set(update_fields) <= PAGE_IGNORED_USER_FIELDS:
+        return
+    invalidate_pages()
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_delete, sender=Project)
+def public_project_changed(sender, instance, **kwargs):
+    # Only projects assigned to an artisan appear on their public profile
+    if instance.handyman_id:
+        invalidate_pages()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def touch_cards(sender, instance, update_fields=None, **kwargs):
+    # Cards show the user's name and profile but are cached on their
+    # handyman's or projects' updated_at, see base.fragments
+    if update_fields is not None and set(update_fields) <= PAGE_IGNORED_USER_FIELDS:
+        return
+    now = timezone.now()
+    if instance.user_type == 'artisan':
+        Handyman.objects.filter(user_id=instance.pk).update(updated_at=now)
+    else:
+        Project.objects.filter(customer__user_id=instance.pk).update(updated_at=now)
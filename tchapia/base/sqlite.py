@@ -0,0 +1,95 @@
+"""
+SQLite connection setup for production.
+
+Every new SQLite connection gets SQLITE_PRAGMAS applied (see
+`configure_connection`, connected in base.apps; the read-only replica of
+base.replica gets SQLITE_REPLICA_PRAGMAS):
+
+- journal_mode=WAL: readers no longer block the writer nor the writer the
+  readers; only writers wait for each other.
+- synchronous=NORMAL: in WAL mode a commit is still atomic and durable
+  against application crashes, and no longer waits for an fsync.
+- busy_timeout: a writer waits for the lock instead of failing at once
+  with "database is locked".
+- mmap_size/cache_size: reads come from memory-mapped pages and a larger
+  per-connection page cache.
+
+Settings complete this: connections are kept between requests
+(CONN_MAX_AGE) so the pragmas and the page cache survive, and
+transactions start with BEGIN IMMEDIATE, so a transaction that will write
+takes the write lock up front rather than failing when upgrading from a
+read lock, which busy_timeout can't retry.
+
+With SQLITE_SERIALIZE_WRITES on, `write_transaction` also queues write
+transactions of one process on a lock before they reach SQLite: waiting
+threads are woken in turn instead of polling SQLite's busy handler, whose
+sleeps between retries make the tail latency under contention.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+
+from .replica import REPLICA_DATABASE
+
+SQLITE_PRAGMAS = getattr(settings, 'SQLITE_PRAGMAS', {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative: in KiB
+    'cache_size': -20000,
+    'temp_store': 'MEMORY',
+})
+
+# The read-only replica connection (see base.replica): no journal_mode, which
+# a read-only connection can't change, and a larger page cache
+SQLITE_REPLICA_PRAGMAS = getattr(settings, 'SQLITE_REPLICA_PRAGMAS', {
+    'query_only': 'ON',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+    'temp_store': 'MEMORY',
+})
+
+SQLITE_SERIALIZE_WRITES = getattr(settings, 'SQLITE_SERIALIZE_WRITES', False)
+
+_write_locks = {}
+_write_locks_guard = threading.Lock()
+
+
+def apply_pragmas(cursor, pragmas=None):
+    """Run the PRAGMA statements of `pragmas` (SQLITE_PRAGMAS by default) on `cursor`"""
+    for name, value in (SQLITE_PRAGMAS if pragmas is None else pragmas).items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, SQLITE_REPLICA_PRAGMAS if connection.alias == REPLICA_DATABASE else SQLITE_PRAGMAS)
+
+
+def write_lock(alias):
+    """Process-wide lock queuing the write transactions on database `alias`"""
+    with _write_locks_guard:
+        # Reentrant: on_commit callbacks run while the lock is held and may write too
+        return _write_locks.setdefault(alias, threading.RLock())
+
+
+@contextmanager
+def write_transaction(using=None):
+    """
+    ``transaction.atomic()`` for a short transaction that writes; with
+    SQLITE_SERIALIZE_WRITES it waits for the other write transactions of this
+    process to finish before starting.
+    """
+    connection = transaction.get_connection(using)
+    if not SQLITE_SERIALIZE_WRITES or connection.vendor != 'sqlite' or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+    with write_lock(connection.alias), transaction.atomic(using=using):
+        yield
@@ -1,3 +1,1103 @@
-from django.test import TestCase
+import asyncio
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import QuerySet
+from django.db.utils import ConnectionHandler, OperationalError
+from django.template import RequestContext, Template
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from base import fragments, jobs, live, matching, page_cache, replica, sqlite
+from base.directory import DIRECTORY_ORDERING
+from base.facets import directory_facets
+from base.cache import SQLiteCache
+from base.notifications import bump_unread
+from base.models import Job, Notification
+from customer.fanout import fanout_new_project
+from customer.models import Customer, Project
+from customer.tasks import notify_handymen
+from handyman.models import Handyman, HandymanPortfolioImage, ProjectOffer
+from tchapia.databases import databases_from_environment
+from userauths.models import User
+
+
+ran_jobs = []
+
+
+@jobs.task(name='tests.record')
+def record_job(**kwargs):
+    ran_jobs.append(kwargs)
+
+
+@jobs.task(name='tests.fail', max_attempts=3)
+def failing_job():
+    raise ValueError("SMTP down")
+
+
+class JobQueueTests(TestCase):
+    def setUp(self):
+        ran_jobs.clear()
+
+    def run_next(self, worker='worker'):
+        job_id = jobs.claim_job(worker)
+        self.assertIsNotNone(job_id)
+        jobs.run_job(job_id, worker=worker)
+        return Job.objects.get(id=job_id)
+
+    def test_jobs_run_once_in_order(self):
+        record_job.enqueue(value=1)
+        record_job.enqueue(value=2)
+        self.assertEqual(self.run_next().status, 'done')
+        self.assertEqual(self.run_next().status, 'done')
+        self.assertIsNone(jobs.claim_job('worker'))
+        self.assertEqual(ran_jobs, [{'value': 1}, {'value': 2}])
+
+    def test_rolled_back_jobs_are_never_queued(self):
+        with mock.patch.object(jobs, 'JOB_QUEUE_EAGER', True), self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                record_job.enqueue(value=1)
+                raise RuntimeError
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(ran_jobs, [])
+
+    def test_losing_a_claim_race_moves_on(self):
+        first = record_job.enqueue(value=1)
+        second = record_job.enqueue(value=2)
+        self.assertEqual(jobs.claim_job('a'), first.id)
+
+        # Worker b read `first` as queued just before a's UPDATE claimed it
+        stale = iter([first.id])
+        first_row = QuerySet.first
+        with mock.patch.object(QuerySet, 'first', lambda queryset: next(stale, None) or first_row(queryset)):
+            self.assertEqual(jobs.claim_job('b'), second.id)
+
+        first.refresh_from_db()
+        self.assertEqual((first.locked_by, first.attempts), ('a', 1))
+
+    def test_eager_jobs_claimed_by_a_worker_run_once(self):
+        with mock.patch.object(jobs, 'JOB_QUEUE_EAGER', True):
+            with self.captureOnCommitCallbacks() as callbacks:
+                job = record_job.enqueue(value=1)
+            # A worker polling the queue picked the row up before the callback ran
+            self.assertEqual(jobs.claim_job('worker'), job.id)
+            jobs.run_job(job.id, worker='worker')
+            for callback in callbacks:
+                callback()
+        self.assertEqual(ran_jobs, [{'value': 1}])
+
+    def test_eager_jobs_run_after_commit(self):
+        with mock.patch.object(jobs, 'JOB_QUEUE_EAGER', True), self.captureOnCommitCallbacks(execute=True):
+            job = record_job.enqueue(value=1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.locked_by, job.attempts), ('done', None, 1))
+        self.assertEqual(ran_jobs, [{'value': 1}])
+
+    def test_failures_back_off_then_die(self):
+        job = failing_job.enqueue()
+        for attempt, delay in [(1, 10), (2, 20)]:
+            start = timezone.now()
+            with self.assertLogs('base.jobs', 'WARNING'):
+                job = self.run_next()
+            self.assertEqual((job.status, job.attempts), ('queued', attempt))
+            self.assertIn("SMTP down", job.last_error)
+            self.assertAlmostEqual((job.run_at - start).total_seconds(), delay, delta=5)
+            # Not due before the backoff is over
+            self.assertIsNone(jobs.claim_job('worker'))
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+
+        with self.assertLogs('base.jobs', 'ERROR'):
+            job = self.run_next()
+        self.assertEqual((job.status, job.attempts, job.locked_by), ('dead', 3, None))
+        self.assertIsNone(jobs.claim_job('worker'))
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        stale = record_job.enqueue(value=1)
+        busy = record_job.enqueue(value=2)
+        self.assertEqual(jobs.claim_job('gone'), stale.id)
+        self.assertEqual(jobs.claim_job('alive'), busy.id)
+        Job.objects.filter(id=stale.id).update(
+            locked_at=timezone.now() - timedelta(seconds=jobs.JOB_LOCK_TIMEOUT + 1),
+        )
+
+        self.assertEqual(jobs.requeue_stale_jobs(), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by), ('queued', None))
+        self.assertEqual(Job.objects.get(id=busy.id).status, 'running')
+        self.assertEqual(self.run_next().id, stale.id)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        )
+        self.project = Project.objects.create(
+            customer=Customer.objects.create(user=self.user), name='Fuite', description='Fuite',
+            service='plomberie', region='littoral', location_address='Akwa',
+        )
+
+    def notify(self, **fields):
+        return Notification.objects.create(user=self.user, notification_type='message', title='Bonjour', **fields)
+
+    def unread(self):
+        self.user.refresh_from_db()
+        return self.user.unread_notifications_count
+
+    def test_new_unread_notifications_are_counted(self):
+        self.notify()
+        self.notify()
+        self.notify(is_read=True)
+        self.assertEqual(self.unread(), 2)
+
+    def test_reading_only_counts_unread_rows(self):
+        first, _ = self.notify(), self.notify()
+        self.notify(is_read=True)
+        self.assertEqual(Notification.objects.filter(id=first.id).mark_read(), 1)
+        # Already read: no change
+        self.assertEqual(Notification.objects.filter(id=first.id).mark_read(), 0)
+        self.assertEqual(self.unread(), 1)
+
+    def test_deleted_projects_take_their_unread_rows_along(self):
+        self.notify(project=self.project)
+        self.notify(project=self.project, is_read=True)
+        self.notify()
+        self.project.delete()
+        self.assertEqual(self.unread(), 1)
+
+    def test_counters_never_go_negative(self):
+        bump_unread([self.user.id], -5)
+        self.assertEqual(self.unread(), 0)
+
+    def test_recount_repairs_drift(self):
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret')
+        self.notify()
+        self.notify(is_read=True)
+        # Writes that bypass the counters
+        Notification.objects.bulk_create([Notification(user=other, notification_type='message')])
+        User.objects.filter(id=self.user.id).update(unread_notifications_count=7)
+
+        out = io.StringIO()
+        call_command('recount_notifications', stdout=out)
+        self.assertIn("for 2 users", out.getvalue())
+        self.assertEqual(self.unread(), 1)
+        other.refresh_from_db()
+        self.assertEqual(other.unread_notifications_count, 1)
+
+
+class NotificationContextProcessorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.handyman = Handyman.objects.create(user=self.user)
+        self.factory = RequestFactory()
+
+    def render(self, source):
+        request = self.factory.get('/')
+        request.user = self.user
+        return Template(source).render(RequestContext(request, {}))
+
+    def notify(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(
+                user=self.user, notification_type='message', title=title, message=title,
+            )
+
+    def test_page_without_bell_runs_no_queries(self):
+        self.notify('Bonjour')
+        with self.assertNumQueries(0):
+            self.render('{{ request.path }}')
+
+    def test_anonymous_page_runs_no_notification_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/services/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse([q for q in queries.captured_queries if 'notification' in q['sql']])
+
+    def test_bell_is_cached_until_a_notification_is_written(self):
+        self.notify('Premier')
+        self.assertEqual(self.render('{{ unread_notifications_count }}'), '1')
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.render('{{ unread_notifications_count }} {% for n in recent_notifications %}{{ n.title }}{% endfor %}'),
+                '1 Premier',
+            )
+
+        self.notify('Second')
+        self.assertEqual(self.render('{{ unread_notifications_count }}'), '2')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.filter(user=self.user).mark_read()
+        self.assertEqual(self.render('{{ unread_notifications_count }}'), '0')
+
+
+class StreamConnection:
+    """A raw ASGI HTTP connection to the notification stream"""
+
+    def __init__(self, application, cookie=''):
+        self.application = application
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': '/notifications/stream/',
+            'raw_path': b'/notifications/stream/',
+            'query_string': b'',
+            'root_path': '',
+            'headers': [(b'host', b'testserver'), (b'cookie', cookie.encode())],
+            'client': ('127.0.0.1', 50000),
+            'server': ('testserver', 80),
+        }
+        self.messages = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self.request_sent = False
+
+    async def receive(self):
+        if not self.request_sent:
+            self.request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    async def open(self):
+        self.task = asyncio.create_task(self.application(self.scope, self.receive, self.send))
+        start = await asyncio.wait_for(self.messages.get(), 10)
+        self.status = start['status']
+        self.headers = dict(start['headers'])
+
+    async def read(self, timeout=10):
+        message = await asyncio.wait_for(self.messages.get(), timeout)
+        return message.get('body', b'').decode()
+
+    async def close(self):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 10)
+
+
+class NotificationStreamTests(TestCase):
+    IDLE_CONNECTIONS = 1000
+
+    def setUp(self):
+        from tchapia.asgi import application
+
+        self.application = application
+        self.user = User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        )
+        self.client.force_login(self.user)
+        self.cookie = f"{settings.SESSION_COOKIE_NAME}={self.client.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        # The ASGI handler would close the connection holding the test transaction
+        for signal in (request_started, request_finished):
+            signal.disconnect(close_old_connections)
+            self.addCleanup(signal.connect, close_old_connections)
+
+    def notify(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(
+                user=self.user, notification_type='message', title=title, message=title,
+            )
+
+    def test_anonymous_stream_is_refused(self):
+        async def scenario():
+            stream = StreamConnection(self.application)
+            await stream.open()
+            await stream.close()
+            return stream.status
+
+        self.assertEqual(async_to_sync(scenario)(), 401)
+
+    def test_idle_connections_on_one_worker(self):
+        async def scenario():
+            streams = [StreamConnection(self.application, self.cookie) for _ in range(self.IDLE_CONNECTIONS)]
+            await asyncio.gather(*(stream.open() for stream in streams))
+            self.assertEqual({stream.status for stream in streams}, {200})
+            self.assertEqual(streams[0].headers[b'Content-Type'], b'text/event-stream')
+            # retry hint, sent as soon as the stream is subscribed
+            await asyncio.gather(*(stream.read() for stream in streams))
+            self.assertEqual(live.broker.subscriber_count(), self.IDLE_CONNECTIONS)
+
+            await sync_to_async(self.notify)('Nouvelle offre')
+            bodies = await asyncio.gather(*(stream.read() for stream in streams))
+            self.assertTrue(all('event: notification' in body and 'Nouvelle offre' in body for body in bodies))
+
+            await asyncio.gather(*(stream.close() for stream in streams))
+            self.assertEqual(live.broker.subscriber_count(), 0)
+
+        async_to_sync(scenario)()
+
+    def test_rows_written_elsewhere_are_polled(self):
+        async def scenario():
+            stream = StreamConnection(self.application, self.cookie)
+            await stream.open()
+            await stream.read()
+            # Let the poller take its starting watermark
+            await asyncio.sleep(0.1)
+
+            # bulk_create sends no signal, like a write from a job worker
+            await sync_to_async(Notification.objects.bulk_create)([
+                Notification(user=self.user, notification_type='message', title='Depuis un worker', message='...'),
+            ])
+            body = await stream.read()
+            await stream.close()
+            return body
+
+        with mock.patch.object(live, 'LIVE_POLL_INTERVAL', 0.05):
+            body = async_to_sync(scenario)()
+        self.assertIn('Depuis un worker', body)
+
+    def poll(self, *writes):
+        """Bodies read from a polled stream after each of `writes`"""
+        async def scenario():
+            stream = StreamConnection(self.application, self.cookie)
+            await stream.open()
+            await stream.read()
+            await asyncio.sleep(0.1)
+            bodies = []
+            for write in writes:
+                await sync_to_async(write)()
+                bodies.append(await stream.read())
+            await stream.close()
+            return bodies
+
+        with mock.patch.object(live, 'LIVE_POLL_INTERVAL', 0.05):
+            return async_to_sync(scenario)()
+
+    def worker_notification(self, title, **fields):
+        return Notification.objects.bulk_create([
+            Notification(user=self.user, notification_type='message', title=title, message=title, **fields),
+        ])[0]
+
+    def test_rows_committed_late_with_a_lower_id_are_polled(self):
+        def late():
+            # Its id was taken, and its created_at set, before the row above committed
+            notification = self.worker_notification('En retard', id=10)
+            Notification.objects.filter(id=notification.id).update(created_at=timezone.now() - timedelta(seconds=5))
+
+        first, second = self.poll(lambda: self.worker_notification('Premier', id=1000), late)
+        self.assertIn('Premier', first)
+        self.assertIn('En retard', second)
+        self.assertNotIn('Premier', second)
+
+    def test_coalesced_notifications_are_pushed_again(self):
+        def coalesce():
+            # As fanout_project_update refreshes an unread row in place
+            Notification.objects.filter(title='Projet modifie').update(message='Seconde modification', created_at=timezone.now())
+
+        first, second = self.poll(lambda: self.worker_notification('Projet modifie'), coalesce)
+        self.assertIn('Projet modifie', first)
+        self.assertIn('Seconde modification', second)
+        self.assertEqual(first.split('\n', 1)[0], second.split('\n', 1)[0])
+
+
+class MatchingIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        matching.reset_index()
+        self.addCleanup(matching.reset_index)
+        self.artisan = self.commit(lambda: User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral', city='douala',
+        ))
+        self.handyman = self.commit(lambda: Handyman.objects.create(user=self.artisan))
+        self.customer = self.commit(lambda: Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        )))
+
+    def commit(self, write):
+        with self.captureOnCommitCallbacks(execute=True):
+            return write()
+
+    def project(self, status='published', region='littoral'):
+        return self.commit(lambda: Project.objects.create(
+            customer=self.customer, name='Fuite', description='Fuite', service='plomberie',
+            region=region, city='douala', status=status, location_address='Akwa',
+        ))
+
+    def test_signals_keep_the_index_in_sync(self):
+        index = matching.get_index()
+        published = self.project()
+        draft = self.project(status='draft')
+        self.assertEqual(index.project_ids('plomberie', 'littoral'), {published.id})
+
+        draft.status = 'in_progress'
+        self.commit(lambda: draft.save(update_fields=['status']))
+        published.status = 'completed'
+        self.commit(published.save)
+        self.assertEqual(index.project_counts('plomberie', 'littoral'), {'published': 0, 'in_progress': 1})
+
+        self.artisan.region = 'centre'
+        self.commit(lambda: self.artisan.save(update_fields=['region']))
+        self.assertEqual(index.handyman_ids('plomberie', 'centre'), {self.handyman.id})
+        self.handyman.notification_digest = 'daily'
+        self.commit(self.handyman.save)
+        self.assertEqual(index.subscriber_user_ids('plomberie', 'centre'), [])
+        self.handyman.availability = False
+        self.commit(self.handyman.save)
+        self.commit(draft.delete)
+
+        # Every change was applied in place
+        self.assertIs(matching.get_index(), index)
+        self.assertEqual(index.project_entries, {})
+        self.assertEqual(index.handyman_entries, {})
+        self.assertEqual(matching.check_index(index), [])
+
+    def test_checker_reports_drift(self):
+        index = matching.get_index()
+        project = self.project()
+        # A write that bypasses the signals
+        Project.objects.filter(id=project.id).update(region='centre')
+        problems = matching.check_index(index)
+        self.assertEqual(len(problems), 1)
+        self.assertIn(f"project #{project.id}", problems[0])
+
+    def elsewhere(self, write):
+        """Commit `write` as another process would: this process's index is left behind"""
+        index = matching._index
+        matching.reset_index()
+        try:
+            return self.commit(write)
+        finally:
+            matching._index = index
+
+    def test_jobs_catch_up_with_changes_from_another_process(self):
+        index = matching.get_index()
+        version = index.version
+        self.artisan.region = 'centre'
+        self.elsewhere(lambda: self.artisan.save(update_fields=['region']))
+        project = self.elsewhere(lambda: self.project(region='centre'))
+        stale = self.elsewhere(self.project)
+        self.elsewhere(stale.delete)
+        self.assertEqual(index.version, version)
+
+        with mock.patch.object(matching, 'build_index') as build:
+            self.assertEqual(notify_handymen(project.id, 'plomberie'), 1)
+        build.assert_not_called()
+        self.assertIs(matching.get_index(), index)
+        self.assertEqual(index.version, matching.get_matching_version())
+        self.assertEqual(matching.check_index(index), [])
+
+    def test_gap_in_the_change_log_rebuilds(self):
+        index = matching.get_index()
+        # A bulk write from another process, which isn't logged
+        self.commit(matching.invalidate_matching)
+        project = self.project()
+        rebuilt = matching.get_index()
+        self.assertIsNot(rebuilt, index)
+        self.assertEqual(rebuilt.project_ids('plomberie', 'littoral'), {project.id})
+
+    def test_old_index_is_served_while_it_is_rebuilt(self):
+        index = matching.get_index()
+        index.built_at -= matching.MATCHING_INDEX_MAX_AGE + 1
+        fresh = matching.MatchingIndex()
+        fresh.built_at = time.monotonic()
+        with mock.patch.object(matching, 'build_index', return_value=fresh) as build:
+            self.assertIs(matching.get_index(), index)
+            matching._refresh_thread.join()
+            self.assertIs(matching.get_index(), fresh)
+        build.assert_called_once_with()
+
+    def test_workers_build_the_index_before_taking_jobs(self):
+        with mock.patch('base.management.commands.run_workers.work') as work:
+            call_command('run_workers', '--burst', '--concurrency', '1', stdout=io.StringIO())
+        work.assert_called_once()
+        self.assertEqual(matching.get_index().handyman_ids('plomberie', 'littoral'), {self.handyman.id})
+        self.assertEqual(matching.get_index().version, matching.get_matching_version())
+
+    def test_fanout_reads_recipients_from_the_index(self):
+        project = self.project()
+        matching.get_index()
+        with CaptureQueriesContext(connection) as queries:
+            result = fanout_new_project('plomberie', project)
+        self.assertEqual(result.count, 1)
+        self.assertFalse([q for q in queries.captured_queries if 'handyman_handyman' in q['sql']])
+
+
+class DirectoryApiTests(TestCase):
+    url = '/api/handymen/'
+
+    def setUp(self):
+        cache.clear()
+        for i, (service, status) in enumerate([
+            ('plomberie', 'verified'), ('plomberie', 'pending'), ('electricite', 'verified'),
+            ('plomberie', 'pending'), ('plomberie', 'rejected'), ('electricite', 'pending'),
+            ('plomberie', 'verified'),
+        ]):
+            Handyman.objects.create(user=User.objects.create_user(
+                username=f'artisan{i}', email=f'artisan{i}@example.com', password='secret',
+                user_type='artisan', service=service, region='littoral',
+            ), verification_status=status)
+
+    def walk(self, url):
+        ids = []
+        while url:
+            data = self.client.get(url).json()
+            ids.append([row['id'] for row in data['results']])
+            url = data['next_url']
+        return ids
+
+    def test_cursor_walks_the_directory_once(self):
+        expected = list(Handyman.objects.order_by(*DIRECTORY_ORDERING).values_list('id', flat=True))
+        pages = self.walk(f'{self.url}?limit=3')
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_filters_follow_the_cursor(self):
+        expected = list(
+            Handyman.objects.filter(user__service='plomberie').order_by(*DIRECTORY_ORDERING).values_list('id', flat=True)
+        )
+        self.assertEqual(sum(self.walk(f'{self.url}?service=plomberie&limit=2'), []), expected)
+
+    def test_results_and_count(self):
+        data = self.client.get(self.url, {'verified': 'verified', 'count': '1'}).json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual({row['verification_status'] for row in data['results']}, {'verified'})
+        self.assertIsNone(data['next_cursor'])
+        self.assertNotIn('count', self.client.get(self.url).json())
+
+    def test_page_size_is_bounded(self):
+        self.assertEqual(len(self.client.get(self.url, {'limit': '0'}).json()['results']), 1)
+        self.assertEqual(len(self.client.get(self.url, {'limit': 'tous'}).json()['results']), 7)
+        with mock.patch('base.views.DIRECTORY_MAX_PAGE_SIZE', 2):
+            self.assertEqual(len(self.client.get(self.url, {'limit': '50'}).json()['results']), 2)
+
+    def test_invalid_cursor_restarts_from_the_first_page(self):
+        first = self.client.get(self.url, {'limit': 3}).json()['results']
+        self.assertEqual(self.client.get(self.url, {'limit': 3, 'cursor': '%%%'}).json()['results'], first)
+
+
+class DirectoryFacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for i, (service, region, city, status) in enumerate([
+            ('plomberie', 'littoral', 'douala', 'verified'),
+            ('plomberie', 'littoral', 'douala', 'pending'),
+            ('plomberie', 'centre', 'yaounde', 'verified'),
+            ('electricite', 'littoral', 'douala', 'verified'),
+        ]):
+            self.artisan(f'artisan{i}', service, region, city, status)
+
+    def artisan(self, name, service, region, city, status='pending'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Handyman.objects.create(user=User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='secret',
+                user_type='artisan', service=service, region=region, city=city,
+            ), verification_status=status)
+
+    def facets(self, **filters):
+        return directory_facets(dict({'q': '', 'service': '', 'region': '', 'city': '', 'verified': ''}, **filters))
+
+    def test_each_facet_counts_the_other_filters(self):
+        facets = self.facets(service='plomberie', region='littoral')
+        self.assertEqual(facets['total'], 2)
+        # Picking another service keeps the region filter, and vice versa
+        self.assertEqual(facets['service'], {'plomberie': 2, 'electricite': 1})
+        self.assertEqual(facets['region'], {'littoral': 2, 'centre': 1})
+        self.assertEqual(facets['city'], {'douala': 2})
+        self.assertEqual(facets['verified'], {'verified': 1, 'pending': 1})
+
+        verified = self.facets(verified='verified')
+        self.assertEqual(verified['total'], 3)
+        self.assertEqual(verified['verified'], {'verified': 3, 'pending': 1})
+
+    def test_one_query_for_every_combination(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.facets()
+            self.facets(service='plomberie')
+            self.facets(region='centre', verified='pending')
+        self.assertEqual(len(queries), 1)
+        with self.assertNumQueries(0):
+            self.facets(service='plomberie')
+
+    def test_saves_refresh_the_counts(self):
+        self.assertEqual(self.facets(service='plomberie')['total'], 3)
+        handyman = self.artisan('artisan4', 'plomberie', 'littoral', 'douala')
+        self.assertEqual(self.facets(service='plomberie')['total'], 4)
+
+        user = handyman.user
+        user.service = 'electricite'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.facets(service='plomberie')['total'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            handyman.delete()
+        self.assertEqual(self.facets()['service'], {'plomberie': 3, 'electricite': 1})
+
+    def test_logins_keep_the_cache(self):
+        self.facets()
+        user = User.objects.get(username='artisan0')
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        with self.assertNumQueries(0):
+            self.facets()
+
+
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            first_name='Brice', user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.handyman = Handyman.objects.create(user=self.artisan)
+
+    def test_second_anonymous_hit_runs_no_queries(self):
+        self.assertEqual(self.client.get('/services/')['X-Page-Cache'], 'miss')
+        with self.assertNumQueries(0):
+            response = self.client.get('/services/')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, 'Plomberie')
+
+    def test_query_string_is_normalized(self):
+        self.client.get('/handymen_list/?service=plomberie&region=littoral')
+        response = self.client.get('/handymen_list/?region=littoral&q=&service=plomberie')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get('/handymen_list/?region=centre')['X-Page-Cache'], 'miss')
+
+    def test_signed_in_users_are_not_cached(self):
+        self.client.get(f'/handyman/{self.handyman.id}/')
+        self.client.force_login(self.artisan)
+        self.assertNotIn('X-Page-Cache', self.client.get(f'/handyman/{self.handyman.id}/'))
+
+    def test_saves_invalidate_pages(self):
+        url = f'/handyman/{self.handyman.id}/'
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.artisan.first_name = 'Hervé'
+            self.artisan.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Hervé')
+
+    def test_logins_keep_pages(self):
+        self.client.get('/services/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.login(username='artisan@example.com', password='secret')
+        self.client.logout()
+        self.assertEqual(self.client.get('/services/')['X-Page-Cache'], 'hit')
+
+    def test_stale_page_is_served_while_another_request_renders(self):
+        self.client.get('/services/')
+        with self.captureOnCommitCallbacks(execute=True):
+            page_cache.invalidate_pages()
+        cache.add(f"{page_cache.page_key(RequestFactory().get('/services/'))}:lock", 1)
+        with self.assertNumQueries(0):
+            response = self.client.get('/services/')
+        self.assertEqual(response['X-Page-Cache'], 'stale')
+
+    def test_hits_vary_on_cookie(self):
+        @page_cache.anonymous_page_cache
+        def view(request):
+            response = HttpResponse('page')
+            response['Vary'] = 'Accept-Language'
+            return response
+
+        request = RequestFactory().get('/page/')
+        request.user = AnonymousUser()
+        view(request)
+        response = view(request)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie')
+
+        self.assertEqual(self.client.get('/services/')['X-Page-Cache'], 'miss')
+        response = self.client.get('/services/')
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertIn('Cookie', response['Vary'])
+
+
+class PageCacheSingleFlightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_render_once(self):
+        renders = []
+
+        @page_cache.anonymous_page_cache
+        def slow_view(request):
+            renders.append(1)
+            time.sleep(0.3)
+            return HttpResponse('page')
+
+        def visit(responses):
+            request = RequestFactory().get('/slow/')
+            request.user = AnonymousUser()
+            responses.append(slow_view(request))
+
+        responses = []
+        threads = [threading.Thread(target=visit, args=(responses,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(renders), 1)
+        self.assertEqual([response.content for response in responses], [b'page'] * 8)
+
+
+class FragmentCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            first_name='Brice', user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.handyman = Handyman.objects.create(user=self.artisan)
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+        # Signed in, so pages bypass the anonymous page cache
+        self.client.force_login(self.artisan)
+
+    def test_cards_are_fetched_in_one_get_many_and_rendered_once(self):
+        self.client.get('/handymen_list/')
+        with mock.patch.object(fragments, 'render_to_string') as render, \
+                mock.patch.object(fragments.cache, 'get_many', wraps=fragments.cache.get_many) as get_many:
+            response = self.client.get('/handymen_list/')
+        render.assert_not_called()
+        get_many.assert_called_once()
+        self.assertContains(response, 'Brice')
+
+    def test_profile_edits_refresh_the_card(self):
+        self.client.get('/handymen_list/')
+        self.artisan.first_name = 'Hervé'
+        self.artisan.save()
+        self.assertContains(self.client.get('/handymen_list/'), 'Hervé')
+
+    def test_only_changed_project_cards_are_rendered(self):
+        projects = [
+            Project.objects.create(
+                customer=self.customer, name=f'Fuite {i}', description='Fuite', service='plomberie',
+                region='littoral', status='published', location_address='Akwa',
+            )
+            for i in range(3)
+        ]
+        self.client.get('/handyman/projects/')
+        projects[1].name = 'Fuite réparée'
+        projects[1].save()
+        with mock.patch.object(fragments, 'render_to_string', wraps=fragments.render_to_string) as render:
+            response = self.client.get('/handyman/projects/')
+        self.assertEqual(render.call_count, 1)
+        self.assertContains(response, 'Fuite réparée')
+
+
+def _incr_many(path, count):
+    cache = SQLiteCache(path, {})
+    for _ in range(count):
+        cache.incr('hits')
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.open()
+
+    def open(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_values_are_shared_between_instances(self):
+        self.cache.set('card', {'html': '<div>'})
+        self.cache.set_many({'a': 1, 'b': [2]})
+        other = self.open()
+        self.assertEqual(other.get('card'), {'html': '<div>'})
+        self.assertEqual(other.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        other.delete_many(['a', 'b'])
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_expired_entries_are_missing_and_can_be_added(self):
+        self.cache.set('old', 'value', timeout=1)
+        self.assertFalse(self.cache.add('old', 'new'))
+        with mock.patch('base.cache.time.time', return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get('old'))
+            self.assertFalse(self.cache.has_key('old'))
+            self.assertTrue(self.cache.add('old', 'new'))
+            self.assertEqual(self.cache.get('old'), 'new')
+
+    def test_incr(self):
+        self.cache.set('count', 5)
+        self.assertEqual(self.cache.incr('count'), 6)
+        self.assertEqual(self.cache.decr('count', 2), 4)
+        self.cache.set('ratio', 0.5)
+        self.assertEqual(self.cache.incr('ratio'), 1.5)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_incr_from_several_processes_loses_nothing(self):
+        self.cache.set('hits', 0)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_incr_many, args=(self.path, 50)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('hits'), 150)
+
+    def test_least_recently_used_entries_are_culled(self):
+        cache = self.open(MAX_ENTRIES=10, CULL_FREQUENCY=2, CULL_EVERY=1, LRU_RESOLUTION=0)
+        now = time.time()
+        for i in range(10):
+            with mock.patch('base.cache.time.time', return_value=now + i):
+                cache.set(f'key{i}', i)
+        with mock.patch('base.cache.time.time', return_value=now + 10):
+            cache.get('key0')
+        with mock.patch('base.cache.time.time', return_value=now + 11):
+            cache.set('key10', 10)
+        self.assertEqual(cache.get('key0'), 0)
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(len(cache.get_many([f'key{i}' for i in range(11)])), 5)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            first_name='Brice', user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.handyman = Handyman.objects.create(user=self.artisan)
+        self.client_user = User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        )
+        self.customer = Customer.objects.create(user=self.client_user)
+        self.project = Project.objects.create(
+            customer=self.customer, name='Fuite', description='Fuite sous évier', service='plomberie',
+            region='littoral', status='published', location_address='Akwa',
+        )
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_profile_is_not_sent_again(self):
+        url = f'/handyman/{self.handyman.id}/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('no-cache', response['Cache-Control'])
+        with mock.patch('base.views.render') as render:
+            # Validators come from a single aggregate query
+            with self.assertNumQueries(1):
+                revalidated = self.revalidate(url, response)
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        render.assert_not_called()
+        self.assertEqual(revalidated.content, b'')
+
+    def test_new_and_deleted_portfolio_images_change_the_profile(self):
+        url = f'/handyman/{self.handyman.id}/'
+        first = self.client.get(url)
+        image = HandymanPortfolioImage.objects.create(handyman=self.handyman, image='handyman_portfolio/a.jpg')
+        second = self.client.get(url)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+        image.delete()
+        self.assertEqual(self.revalidate(url, second).status_code, 200)
+
+    def test_customer_project_page_follows_offers(self):
+        url = f'/customer/project/{self.project.id}/'
+        self.client.force_login(self.client_user)
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        ProjectOffer.objects.create(handyman=self.handyman, project=self.project, message='Disponible demain')
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_validators_are_per_viewer(self):
+        url = f'/handyman/{self.handyman.id}/'
+        response = self.client.get(url)
+        self.client.force_login(self.client_user)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_other_customers_still_get_404(self):
+        url = f'/customer/project/{self.project.id}/'
+        self.client.force_login(self.client_user)
+        etag = self.client.get(url)['ETag']
+        other = User.objects.create_user(username='other', email='other@example.com', password='secret', user_type='client')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "SQLite connection setup")
+class SQLiteConnectionTests(TestCase):
+    def test_pragmas_are_applied_on_connect(self):
+        with connection.cursor() as cursor:
+            for pragma, expected in [('synchronous', 1), ('busy_timeout', 5000), ('cache_size', -20000)]:
+                cursor.execute(f"PRAGMA {pragma}")
+                self.assertEqual(cursor.fetchone()[0], expected, pragma)
+
+    def test_transactions_take_the_write_lock_up_front(self):
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "Write queuing only applies to SQLite")
+class WriteTransactionTests(TransactionTestCase):
+    def lock_is_free(self):
+        """Whether another thread could take this process's write lock now"""
+        free = []
+
+        def try_lock():
+            lock = sqlite.write_lock(connection.alias)
+            free.append(lock.acquire(blocking=False))
+            if free[0]:
+                lock.release()
+
+        thread = threading.Thread(target=try_lock)
+        thread.start()
+        thread.join()
+        return free[0]
+
+    def test_write_transactions_queue_on_the_process_lock(self):
+        with mock.patch.object(sqlite, 'SQLITE_SERIALIZE_WRITES', True):
+            with sqlite.write_transaction():
+                self.assertTrue(connection.in_atomic_block)
+                self.assertFalse(self.lock_is_free())
+                # Nested blocks (and on_commit callbacks) don't wait for themselves
+                with sqlite.write_transaction():
+                    pass
+            self.assertTrue(self.lock_is_free())
+
+    def test_lock_is_optional(self):
+        with mock.patch.object(sqlite, 'SQLITE_SERIALIZE_WRITES', False), sqlite.write_transaction():
+            self.assertTrue(self.lock_is_free())
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, "No replica database configured")
+class ReplicaRoutingTests(TransactionTestCase):
+    # The runner sets up the databases of skipped classes too
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    @classmethod
+    def tearDownClass(cls):
+        # Only the test database's own pool is closed before it is dropped,
+        # not the pool of its mirror
+        if connections['replica'].vendor == 'postgresql':
+            connections['replica'].close_pool()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        Handyman.objects.create(user=self.artisan)
+
+    def replica_queries(self, method, url, **data):
+        with CaptureQueriesContext(connections['replica']) as queries:
+            response = getattr(self.client, method)(url, data)
+        self.assertLess(response.status_code, 400)
+        return len(queries)
+
+    def test_read_only_pages_read_from_the_replica(self):
+        self.assertTrue(self.replica_queries('get', '/handymen_list/'))
+        self.client.force_login(self.artisan)
+        self.assertTrue(self.replica_queries('get', '/handyman/projects/'))
+        self.assertFalse(self.replica_queries('get', '/handyman/notifications/'))
+
+    def test_users_read_their_own_writes(self):
+        self.client.force_login(self.artisan)
+        self.assertFalse(self.replica_queries('post', '/handyman/searches/save/', priority='urgent'))
+        self.assertFalse(self.replica_queries('get', '/handyman/projects/'))
+        cache.delete(replica.sticky_key(self.artisan.pk))
+        self.assertTrue(self.replica_queries('get', '/handyman/projects/'))
+
+    def test_writes_go_to_default(self):
+        router = replica.ReplicaRouter()
+        token = replica._use_replica.set(True)
+        try:
+            self.assertEqual(router.db_for_read(User), 'replica')
+            self.assertEqual(router.db_for_write(User), 'default')
+            # Reads inside a transaction see its writes
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(User))
+        finally:
+            replica._use_replica.reset(token)
+
+
+@unittest.skipUnless('replica' in settings.DATABASES, "No replica database configured")
+class ReplicaConnectionTests(SimpleTestCase):
+    # Connections of their own to a temporary file, not the test database
+    databases = {'default', 'replica'} & set(settings.DATABASES)
+
+    def test_open_write_transaction_does_not_block_replica_reads(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3')
+        databases = ConnectionHandler({
+            'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': path},
+            'replica': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': f'file:{path}?mode=ro'},
+        })
+        self.addCleanup(databases.close_all)
+        writer = databases['default'].cursor()
+        writer.execute("CREATE TABLE offer (id INTEGER PRIMARY KEY)")
+        writer.execute("INSERT INTO offer DEFAULT VALUES")
+
+        # A writer holds an exclusive lock with uncommitted changes, which
+        # would lock readers out without WAL
+        writer.execute("BEGIN EXCLUSIVE")
+        writer.execute("INSERT INTO offer DEFAULT VALUES")
+        reader = databases['replica'].cursor()
+        start = time.monotonic()
+        reader.execute("SELECT COUNT(*) FROM offer")
+        self.assertEqual(reader.fetchone()[0], 1)
+        # Far below busy_timeout: the read didn't wait for the writer
+        self.assertLess(time.monotonic() - start, 1)
+        with self.assertRaises(OperationalError):
+            reader.execute("INSERT INTO offer DEFAULT VALUES")
+        writer.execute("COMMIT")
+
+        reader.execute("SELECT COUNT(*) FROM offer")
+        self.assertEqual(reader.fetchone()[0], 2)
+
+
+class DatabaseUrlTests(SimpleTestCase):
+    def configure(self, **environ):
+        with mock.patch.dict(os.environ, environ, clear=True):
+            return databases_from_environment('/srv/tchapia')
+
+    def test_sqlite_by_default(self):
+        databases = self.configure()
+        self.assertEqual(databases['default']['NAME'], '/srv/tchapia/db.sqlite3')
+        self.assertEqual(databases['replica']['NAME'], 'file:/srv/tchapia/db.sqlite3?mode=ro')
+        self.assertEqual(self.configure(DATABASE_URL='sqlite:////var/lib/db.sqlite3')['default']['NAME'], '/var/lib/db.sqlite3')
+
+    def test_postgres_uses_a_pool(self):
+        databases = self.configure(DATABASE_URL='postgres://tchapia:p%40ss@db:5432/tchapia?sslmode=require')
+        default = databases['default']
+        self.assertEqual(default['ENGINE'], 'django.db.backends.postgresql')
+        self.assertEqual((default['USER'], default['PASSWORD'], default['HOST'], default['PORT']), ('tchapia', 'p@ss', 'db', '5432'))
+        self.assertEqual(default['OPTIONS']['sslmode'], 'require')
+        self.assertIn('pool', default['OPTIONS'])
+        self.assertEqual(default['CONN_MAX_AGE'], 0)
+        self.assertNotIn('replica', databases)
+
+    def test_postgres_replica_is_read_only(self):
+        databases = self.configure(DATABASE_URL='postgres://db/tchapia', DATABASE_REPLICA_URL='postgres://replica/tchapia')
+        self.assertIn('default_transaction_read_only=on', databases['replica']['OPTIONS']['options'])
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            self.configure(DATABASE_URL='mysql://db/tchapia')
@@ -6,6 +6,8 @@ app_name = 'base'
 urlpatterns = [
     path('', views.home_view, name='home'),
     path('handymen_list/', views.handymen_list_view, name='handymen_list'),
+    path('api/handymen/', views.handymen_list_api_view, name='handymen_list_api'),
     path('handyman/<int:handyman_id>/', views.handyman_profile_view, name='handyman_profile'),
     path('services/', views.services_list_view, name='services_list'),
+    path('notifications/stream/', views.notification_stream_view, name='notification_stream'),
 ]
\ No newline at end of file
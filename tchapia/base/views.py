@@ -1,7 +1,24 @@
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import OuterRef
+from django.db.models.functions import Greatest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.urls import reverse
+from customer.models import Project
 from handyman import models as handyman_models
+from .conditional import changes, conditional_page
+from .directory import (
+    DIRECTORY_MAX_PAGE_SIZE, DIRECTORY_PAGE_SIZE, directory_count, directory_filters, directory_page,
+    serialize_handyman,
+)
+from .facets import directory_facets, facet_options
+from .fragments import render_cards
+from .live import notification_stream
+from .page_cache import anonymous_page_cache
+from .replica import read_only_view
 from userauths.models import REGION_CHOICES, SERVICE_CHOICES, CITIES 
 
+@anonymous_page_cache
 def home_view(request):
 
     print(f"########## Current User: {request.user} ######")
@@ -11,60 +28,74 @@ def home_view(request):
     return render(request, 'base/home.html', context)
 
 
-def handymen_list_view(request):
-    handymen = handyman_models.Handyman.objects.select_related('user').all()
-
-    # Get filter parameters
-    service_filter = request.GET.get('service', '')
-    region_filter = request.GET.get('region', '')
-    city_filter = request.GET.get('city', '')
-    verified_filter = request.GET.get('verified', '')
-
-    # Apply filters
-    if service_filter:
-        handymen = handymen.filter(user__service=service_filter)
-
-    if region_filter:
-        handymen = handymen.filter(user__region=region_filter)
+def _next_query(request, next_cursor):
+    """Current query string with the cursor moved to the next page"""
+    if not next_cursor:
+        return ''
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    return params.urlencode()
 
-    if city_filter:
-        handymen = handymen.filter(user__city=city_filter)
 
-    if verified_filter == 'verified':
-        handymen = handymen.filter(verification_status="verified")
-    elif verified_filter == 'pending':
-        handymen = handymen.filter(verification_status="pending")
-
-    # Order by verification status and rating
-    handymen = handymen.order_by('verification_status', '-created_at')
+@read_only_view
+@anonymous_page_cache
+def handymen_list_view(request):
+    filters = directory_filters(request.GET)
+    handymen, next_cursor = directory_page(filters, request.GET.get('cursor'))
+    facets = directory_facets(filters)
 
     context = {
         "handymen": handymen,
-        "current_service": service_filter,
-        "current_region": region_filter,
-        "current_city": city_filter,
-        "verified_filter": verified_filter,
-        "service_choices": SERVICE_CHOICES,
-        "region_choices": REGION_CHOICES,
-        "cities": CITIES,
-        "handymen_count": handymen.count(),
+        "cards": render_cards('partials/handyman_card.html', 'handyman', handymen),
+        "next_cursor": next_cursor,
+        "next_query": _next_query(request, next_cursor),
+        "current_q": filters['q'],
+        "current_service": filters['service'],
+        "current_region": filters['region'],
+        "current_city": filters['city'],
+        "verified_filter": filters['verified'],
+        "service_options": facet_options(SERVICE_CHOICES, facets['service']),
+        "region_options": facet_options(REGION_CHOICES, facets['region']),
+        "city_options": facet_options([city for city in CITIES if city[0] != 'all'], facets['city']),
+        "verified_counts": facets['verified'],
+        "handymen_count": facets['total'],
     }
 
     return render(request, "base/handymen_list.html", context)
 
 
+@read_only_view
+def handymen_list_api_view(request):
+    """JSON pages of the directory for infinite scroll; ?count=1 adds the (cached) total"""
+    filters = directory_filters(request.GET)
+    try:
+        page_size = min(int(request.GET.get('limit', DIRECTORY_PAGE_SIZE)), DIRECTORY_MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = DIRECTORY_PAGE_SIZE
+    handymen, next_cursor = directory_page(filters, request.GET.get('cursor'), max(page_size, 1))
+
+    next_query = _next_query(request, next_cursor)
+    data = {
+        'results': [serialize_handyman(handyman) for handyman in handymen],
+        'html': "".join(render_cards('partials/handyman_card.html', 'handyman', handymen)),
+        'next_cursor': next_cursor,
+        'next_query': next_query,
+        'next_url': f"{reverse('base:handymen_list_api')}?{next_query}" if next_cursor else None,
+    }
+    if request.GET.get('count'):
+        data['count'] = directory_count(filters)
+    return JsonResponse(data)
+
+
+@read_only_view
+@anonymous_page_cache
 def services_list_view(request):
-    # Get service statistics - count of artisans per service
-    services_with_counts = []
-    for service_code, service_name in SERVICE_CHOICES:
-        artisan_count = handyman_models.Handyman.objects.filter(
-            user__service=service_code
-        ).count()
-        services_with_counts.append({
-            'code': service_code,
-            'name': service_name,
-            'count': artisan_count
-        })
+    # Artisans per service, from the cached facet counts
+    service_counts = directory_facets({})['service']
+    services_with_counts = [
+        {'code': code, 'name': name, 'count': count}
+        for code, name, count in facet_options(SERVICE_CHOICES, service_counts)
+    ]
 
     context = {
         'services_with_counts': services_with_counts,
@@ -74,11 +105,24 @@ def services_list_view(request):
     return render(request, "base/services_list.html", context)
 
 
+def handyman_profile_changes(request, handyman_id):
+    handyman = OuterRef('pk')
+    return handyman_models.Handyman.objects.filter(id=handyman_id).annotate(
+        # A rating shows its customer's name; renaming a customer touches their projects
+        **changes('ratings', handyman_models.HandymanRating.objects.filter(handyman=handyman), Greatest('created_at', 'project__updated_at')),
+        **changes('portfolio', handyman_models.HandymanPortfolioImage.objects.filter(handyman=handyman), 'uploaded_at'),
+        **changes('projects', Project.objects.filter(handyman=handyman, status__in=['completed', 'in_progress']), 'updated_at'),
+    )
+
+
+@read_only_view
+@conditional_page('base/handyman_profile.html', handyman_profile_changes)
+@anonymous_page_cache
 def handyman_profile_view(request, handyman_id):
     handyman = get_object_or_404(handyman_models.Handyman, id=handyman_id)
 
     # Get handyman's ratings and reviews
-    ratings = handyman.ratings.all().order_by('-created_at')
+    ratings = handyman.ratings.select_related('customer__user').order_by('-created_at')
 
     # Get recent projects (if any)
     recent_projects = handyman.projects.filter(status__in=['completed', 'in_progress']).order_by('-created_at')[:3]
@@ -87,8 +131,33 @@ def handyman_profile_view(request, handyman_id):
         'handyman': handyman,
         'ratings': ratings,
         'recent_projects': recent_projects,
-        'ratings_count': ratings.count(),
-        'average_rating': handyman.average_rating,
+        'ratings_count': handyman.rating_count,
+        'average_rating': handyman.rating_avg,
     }
 
     return render(request, "base/handyman_profile.html", context)
+
+
+async def notification_stream_view(request):
+    """Server-Sent Events stream of the logged-in user's new notifications"""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    # Under WSGI the stream would pin a worker thread forever; 204 tells
+    # EventSource to stop reconnecting, pages still refresh the bell on load
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', 0))
+    except ValueError:
+        last_event_id = 0
+
+    response = StreamingHttpResponse(
+        notification_stream(user.id, last_event_id),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
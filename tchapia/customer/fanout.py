@@ -0,0 +1,177 @@
+import logging
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from base.matching import get_index
+from base.notifications import bump_unread, invalidate_notification_cache
+from base.models import Notification
+from handyman.models import Handyman
+from userauths.models import SERVICE_CHOICES
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT statement. Django further splits the batch if the
+# backend has a lower limit on query parameters (old SQLite builds).
+FANOUT_BATCH_SIZE = getattr(settings, 'NOTIFICATION_FANOUT_BATCH_SIZE', 500)
+
+# Seconds during which edits of a project update a handyman's unread
+# notification about it in place instead of inserting a new one
+NOTIFICATION_COALESCE_WINDOW = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 3600)
+
+
+@dataclass
+class FanoutResult:
+    """Outcome of a notification fan-out"""
+    count: int = 0
+    coalesced: int = 0
+    batches: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def rows_per_sec(self):
+        if not self.elapsed:
+            return 0.0
+        return self.count / self.elapsed
+
+
+def matching_handymen(service, project):
+    """
+    Available handymen offering `service` in the project's region who want
+    per-project notifications. Digest subscribers are served by
+    ``manage.py send_notification_digests`` instead.
+
+    The fan-outs read the same set from the matching index, see
+    ``subscribers``.
+    """
+    return Handyman.objects.filter(
+        user__service=service,
+        user__region=project.region,
+        availability=True,
+        notification_digest='off'
+    )
+
+
+def subscribers(service, project):
+    """User ids of matching_handymen(), from the in-memory matching index"""
+    return get_index().subscriber_user_ids(service, project.region)
+
+
+def build_new_project_notification(service, project):
+    """Render the notification fields once for every recipient of `project`"""
+    service_label = dict(SERVICE_CHOICES).get(service, service)
+    return {
+        'notification_type': 'new_project',
+        'title': f"Nouveau projet: {project.name}",
+        'message': f"Un nouveau projet '{project.name}' a été publié dans votre région ({project.get_region_display()}) pour le service {service_label}. Budget: {project.budget_range}",
+        'project_id': project.id,
+    }
+
+
+def build_project_update_notification(service, project):
+    """Render the notification fields for an edit of `project`"""
+    return {
+        'notification_type': 'project_update',
+        'title': f"Projet mis à jour: {project.name}",
+        'message': f"Le projet '{project.name}' dans votre région ({project.get_region_display()}) a été modifié. Budget: {project.budget_range}",
+        'project_id': project.id,
+    }
+
+
+def fanout(user_ids, fields, batch_size=None):
+    """
+    Write one Notification per user id with chunked bulk_create.
+
+    `user_ids` may be any iterable (a values_list iterator streams the ids
+    without materializing model instances); `fields` are shared by every row.
+    """
+    batch_size = batch_size or FANOUT_BATCH_SIZE
+    result = FanoutResult()
+    start = time.perf_counter()
+
+    def flush(batch):
+        Notification.objects.bulk_create(batch, batch_size=batch_size)
+        # bulk_create skips post_save, so bump the unread counters per batch
+        if not fields.get('is_read'):
+            bump_unread([notification.user_id for notification in batch])
+        result.count += len(batch)
+        result.batches += 1
+
+    batch = []
+    for user_id in user_ids:
+        batch.append(Notification(user_id=user_id, **fields))
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+
+    result.elapsed = time.perf_counter() - start
+    logger.info(
+        "Fan-out wrote %d notification(s) in %d batch(es), %.3fs (%.0f rows/sec)",
+        result.count, result.batches, result.elapsed, result.rows_per_sec
+    )
+    return result
+
+
+def fanout_new_project(service, project, batch_size=None):
+    """Notify every matching handyman that `project` was published"""
+    batch_size = batch_size or FANOUT_BATCH_SIZE
+    fields = build_new_project_notification(service, project)
+    return fanout(subscribers(service, project), fields, batch_size=batch_size)
+
+
+def fanout_project_update(service, project, window=None, batch_size=None):
+    """
+    Notify matching handymen that `project` was edited.
+
+    A handyman who still has an unread notification about the project from
+    the last `window` seconds gets that row refreshed in place (one bulk
+    UPDATE for all of them); only the others receive a new row. Refreshing
+    moves the row's created_at forward, so a run of edits keeps coalescing
+    until the handyman reads it.
+    """
+    window = NOTIFICATION_COALESCE_WINDOW if window is None else window
+    batch_size = batch_size or FANOUT_BATCH_SIZE
+    fields = build_project_update_notification(service, project)
+    now = timezone.now()
+    start = time.perf_counter()
+
+    recipients = set(subscribers(service, project))
+    unread = Notification.objects.filter(
+        project=project,
+        is_read=False,
+        created_at__gte=now - timedelta(seconds=window),
+    )
+
+    with transaction.atomic():
+        # Only the project's own recent notifications, narrowed in Python
+        pending = {
+            notification_id: user_id
+            for notification_id, user_id in unread.values_list('id', 'user_id')
+            if user_id in recipients
+        }
+        coalesced_ids = set(pending.values())
+        coalesced = Notification.objects.filter(id__in=pending).update(
+            notification_type=fields['notification_type'],
+            title=fields['title'],
+            message=fields['message'],
+            created_at=now,
+        )
+        # Counters are unchanged (the rows stay unread) but the cached dropdowns are stale
+        invalidate_notification_cache(coalesced_ids)
+
+        user_ids = (user_id for user_id in recipients if user_id not in coalesced_ids)
+        result = fanout(user_ids, fields, batch_size=batch_size)
+
+    result.coalesced = coalesced
+    result.elapsed = time.perf_counter() - start
+    logger.info(
+        "Project #%s update: %d notification(s) refreshed in place, %d inserted",
+        project.id, result.coalesced, result.count
+    )
+    return result
@@ -0,0 +1,95 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from customer.fanout import fanout_new_project, matching_handymen
+from customer.models import Customer, Project
+from base.matching import reset_index
+from base.models import Notification
+from handyman.models import Handyman
+from userauths.models import User
+
+
+class Command(BaseCommand):
+    help = "Benchmark publishing a project to many handymen, per-row INSERTs vs batched fan-out"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=10000)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--service', default='plomberie')
+        parser.add_argument('--region', default='littoral')
+
+    def handle(self, *args, **options):
+        recipients = options['recipients']
+        service = options['service']
+        region = options['region']
+
+        # Everything runs in one transaction that is rolled back at the end,
+        # so the benchmark leaves the database untouched.
+        with transaction.atomic():
+            project = self.seed(recipients, service, region)
+            # Seeded rows are never committed, so no signal updates the matching index
+            reset_index()
+
+            legacy_elapsed = self.legacy_fanout(service, project)
+            legacy_count = Notification.objects.filter(project=project).count()
+            Notification.objects.filter(project=project).delete()
+
+            result = fanout_new_project(service, project, batch_size=options['batch_size'])
+
+            transaction.set_rollback(True)
+        reset_index()
+
+        self.report("per-row create()", legacy_count, legacy_elapsed)
+        self.report(f"bulk_create ({result.batches} batches)", result.count, result.elapsed)
+        if result.elapsed:
+            self.stdout.write(self.style.SUCCESS(f"Speed-up: {legacy_elapsed / result.elapsed:.1f}x"))
+
+    def seed(self, recipients, service, region):
+        self.stdout.write(f"Seeding {recipients} handymen ({service}/{region})...")
+        users = User.objects.bulk_create([
+            User(
+                username=f"bench-artisan-{i}",
+                email=f"bench-artisan-{i}@bench.tchapia.local",
+                user_type='artisan',
+                service=service,
+                region=region,
+            )
+            for i in range(recipients)
+        ], batch_size=500)
+        Handyman.objects.bulk_create([Handyman(user=user) for user in users], batch_size=500)
+
+        client = User.objects.create(
+            username="bench-client",
+            email="bench-client@bench.tchapia.local",
+            user_type='client',
+            region=region,
+        )
+        customer = Customer.objects.create(user=client)
+        return Project.objects.create(
+            customer=customer,
+            name="Fuite d'eau cuisine",
+            description="Benchmark",
+            service=service,
+            location_address="Akwa",
+            region=region,
+            status='published',
+        )
+
+    def legacy_fanout(self, service, project):
+        """The original notify_handymen: one INSERT per handyman"""
+        start = time.perf_counter()
+        for handyman in matching_handymen(service, project).select_related('user'):
+            Notification.objects.create(
+                user=handyman.user,
+                notification_type='new_project',
+                title=f"Nouveau projet: {project.name}",
+                message=f"Un nouveau projet '{project.name}' a été publié dans votre région ({project.get_region_display()}) pour le service {handyman.user.get_service_display()}. Budget: {project.budget_range}",
+                project=project
+            )
+        return time.perf_counter() - start
+
+    def report(self, label, count, elapsed):
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f"{label:<28} {count:>7} rows  {elapsed:8.3f}s  {rate:>10.0f} rows/sec")
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:53
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread_count(apps, schema_editor):
+    Customer = apps.get_model('customer', 'Customer')
+    CustomerNotification = apps.get_model('customer', 'CustomerNotification')
+    unread = (
+        CustomerNotification.objects.filter(customer=models.OuterRef('pk'), is_read=False)
+        .order_by()
+        .values('customer')
+        .annotate(n=models.Count('id'))
+        .values('n')
+    )
+    Customer.objects.update(
+        unread_count=Coalesce(models.Subquery(unread, output_field=models.IntegerField()), models.Value(0))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0007_projectimage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of unread notifications'),
+        ),
+        migrations.RunPython(backfill_unread_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0008_customer_unread_count'),
+        ('handyman', '0007_handyman_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='customernotification',
+            index=models.Index(fields=['customer', 'is_read', 'created_at'], name='customer_notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customernotification',
+            index=models.Index(fields=['customer', 'created_at'], name='customer_notif_inbox_idx'),
+        ),
+    ]
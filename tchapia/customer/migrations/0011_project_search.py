@@ -0,0 +1,82 @@
+import re
+import unicodedata
+
+from django.db import migrations
+
+# A copy of customer.search's normalization as of this migration, so the
+# migration keeps working whatever that module becomes. After a change to
+# the normalization, `manage.py rebuild_search_index` rewrites the rows.
+STOP_WORDS = frozenset("""
+    a au aux avec ce ces dans de des du elle en et il ils je la le les leur mais me mes
+    mon ne nous on ou par pas pour qu que qui sa se ses son sur ta te tes ton tu un une
+    vos votre vous y d l j m n s t c
+""".split())
+
+AUX_PLURALS = {
+    'animaux': 'animal', 'canaux': 'canal', 'chevaux': 'cheval', 'generaux': 'general',
+    'hopitaux': 'hopital', 'journaux': 'journal', 'locaux': 'local', 'metaux': 'metal',
+    'signaux': 'signal', 'travaux': 'travail', 'vitraux': 'vitrail',
+}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+BATCH_SIZE = 2000
+
+
+def stem(word):
+    if len(word) <= 3:
+        return word
+    if word in AUX_PLURALS:
+        return AUX_PLURALS[word]
+    if word[-1] in 'sx':
+        word = word[:-1]
+    if len(word) > 4 and word.endswith('er'):
+        word = word[:-2]
+    else:
+        word = word.rstrip('e') if len(word.rstrip('e')) >= 3 else word
+    if len(word) > 4 and word[-1] == word[-2]:
+        word = word[:-1]
+    return word
+
+
+def normalize(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    unaccented = ''.join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(stem(word) for word in WORD_RE.findall(unaccented.lower()) if word not in STOP_WORDS)
+
+
+def create_project_search(apps, schema_editor):
+    # FTS5 is SQLite only, other backends search with icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE project_search USING fts5(name, description, tokenize = "unicode61 remove_diacritics 2")'
+    )
+    Project = apps.get_model('customer', 'Project')
+    insert = "INSERT INTO project_search(rowid, name, description) VALUES (%s, %s, %s)"
+    with schema_editor.connection.cursor() as cursor:
+        batch = []
+        for project_id, name, description in Project.objects.values_list('id', 'name', 'description').iterator(chunk_size=BATCH_SIZE):
+            batch.append((project_id, normalize(name), normalize(description)))
+            if len(batch) >= BATCH_SIZE:
+                cursor.executemany(insert, batch)
+                batch = []
+        if batch:
+            cursor.executemany(insert, batch)
+
+
+def drop_project_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS project_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0010_move_notifications_to_base'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_project_search, drop_project_search),
+    ]
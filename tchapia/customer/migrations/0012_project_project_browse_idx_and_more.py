@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0011_project_search'),
+        ('handyman', '0013_handyman_search'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['service', 'region', 'status', '-created_at'], name='project_browse_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['customer', '-created_at'], name='project_customer_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:18
+
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+
+# Frozen copy of customer.models.PRIORITY_RANKS
+PRIORITY_RANKS = {'low': 0, 'medium': 1, 'high': 2, 'urgent': 3}
+
+
+def backfill_priority_rank(apps, schema_editor):
+    Project = apps.get_model('customer', 'Project')
+    Project.objects.update(priority_rank=Case(
+        *[When(priority=priority, then=Value(rank)) for priority, rank in PRIORITY_RANKS.items()],
+        default=Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0012_project_project_browse_idx_and_more'),
+        ('handyman', '0013_handyman_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='project',
+            name='priority_rank',
+            field=models.PositiveSmallIntegerField(default=1, editable=False, help_text='Denormalized sort key of priority, higher is more urgent'),
+        ),
+        migrations.RunPython(backfill_priority_rank, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['service', 'region', '-priority_rank', '-created_at', 'status'], name='project_priority_idx'),
+        ),
+    ]
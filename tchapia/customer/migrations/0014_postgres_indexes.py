@@ -0,0 +1,49 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+# PostgreSQL only: SQLite searches projects through its FTS5 table instead,
+# and these are not in Project.Meta, which SQLite migrations would apply too.
+#
+# The trigram indexes cover UPPER(column) with gin_trgm_ops, the expression
+# icontains compiles to, so UPPER(name::text) LIKE UPPER('%fuite%') is
+# answered from the index. The partial index only holds the open projects,
+# the ones every browsing query filters on; psycopg binds parameters client
+# side, so the planner sees the statuses and can use it.
+INDEXES = [
+    GinIndex(OpClass(Upper('name'), name='gin_trgm_ops'), name='project_name_trgm_idx'),
+    GinIndex(OpClass(Upper('description'), name='gin_trgm_ops'), name='project_description_trgm_idx'),
+    models.Index(
+        fields=['service', 'region', '-priority_rank', '-created_at'],
+        condition=models.Q(status__in=['published', 'in_progress']),
+        name='project_open_idx',
+    ),
+]
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    Project = apps.get_model('customer', 'Project')
+    for index in INDEXES:
+        schema_editor.add_index(Project, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Project = apps.get_model('customer', 'Project')
+    for index in INDEXES:
+        schema_editor.remove_index(Project, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0013_project_priority_rank'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0014_postgres_indexes'),
+        ('handyman', '0015_postgres_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='project',
+            index=models.Index(fields=['status', 'service', 'region', 'city'], name='project_status_idx'),
+        ),
+    ]
@@ -19,6 +19,9 @@ PRIORITY_CHOICES = [
     ('urgent', 'Urgent'),
 ]
 
+# Sort key of each priority, least to most urgent
+PRIORITY_RANKS = {value: rank for rank, (value, _) in enumerate(PRIORITY_CHOICES)}
+
 
 class Customer(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='customer_profile')
@@ -30,6 +33,15 @@ class Customer(models.Model):
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - Customer"
 
+    @property
+    def notifications(self):
+        # Compatibility with the former per-role notification table
+        return self.user.notifications.all()
+
+    @property
+    def unread_count(self):
+        return self.user.unread_notifications_count
+
     @property
     def total_projects(self):
         return self.projects.count()
@@ -54,6 +66,7 @@ class Project(models.Model):
     region = models.CharField(max_length=20, choices=REGION_CHOICES)
     status = models.CharField(max_length=20, choices=PROJECT_STATUS_CHOICES, default='draft')
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, default='medium')
+    priority_rank = models.PositiveSmallIntegerField(default=PRIORITY_RANKS['medium'], editable=False, help_text='Denormalized sort key of priority, higher is more urgent')
     start_date = models.DateField(blank=True, null=True)
     end_date = models.DateField(blank=True, null=True)
     deadline = models.DateField(blank=True, null=True)
@@ -64,6 +77,14 @@ class Project(models.Model):
     def __str__(self):
         return f"{self.name} - {self.customer.user.first_name}"
 
+    def save(self, *args, **kwargs):
+        # Kept in sync here only; bulk updates of priority must set it too
+        self.priority_rank = PRIORITY_RANKS.get(self.priority, 0)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'priority' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'priority_rank'}
+        super().save(*args, **kwargs)
+
     @property
     def budget_range(self):
         # Handle both None and 0 as "no budget specified"
@@ -86,6 +107,16 @@ class Project(models.Model):
     class Meta:
         db_table = 'customer_project'
         ordering = ['-created_at']
+        indexes = [
+            # Artisan project lists and digests: service/region/status equality, newest first
+            models.Index(fields=['service', 'region', 'status', '-created_at'], name='project_browse_idx'),
+            # Customer dashboard: own projects, newest first
+            models.Index(fields=['customer', '-created_at'], name='project_customer_idx'),
+            # Project browser: most urgent first, newest first within a priority
+            models.Index(fields=['service', 'region', '-priority_rank', '-created_at', 'status'], name='project_priority_idx'),
+            # Matching index build (base.matching): the open projects and their bucket, from the index alone
+            models.Index(fields=['status', 'service', 'region', 'city'], name='project_status_idx'),
+        ]
 
 
 class ProjectImage(models.Model):
@@ -100,29 +131,3 @@ class ProjectImage(models.Model):
     class Meta:
         db_table = 'customer_project_image'
         ordering = ['uploaded_at']
-
-
-class CustomerNotification(models.Model):
-    NOTIFICATION_TYPES = [
-        ('new_offer', 'New Offer'),
-        ('offer_update', 'Offer Update'),
-        ('project_update', 'Project Update'),
-        ('message', 'Message'),
-    ]
-
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='notifications')
-    notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
-    title = models.CharField(max_length=200)
-    message = models.TextField()
-    project = models.ForeignKey(Project, on_delete=models.CASCADE, null=True, blank=True)
-    offer = models.ForeignKey('handyman.ProjectOffer', on_delete=models.CASCADE, null=True, blank=True)
-    is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return f"{self.customer.user.first_name} - {self.title}"
-
-    class Meta:
-        db_table = 'customer_notification'
-        ordering = ['-created_at']
-
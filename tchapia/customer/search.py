@@ -0,0 +1,182 @@
+"""
+Full-text search over projects.
+
+On SQLite, ``project_search`` is an FTS5 table whose rowid is the project id.
+It holds the project's name and description *normalized* for French:
+lowercased, without accents or stop words, and with a light stemmer applied.
+Queries go through the same normalization, so "Fuites électriques" finds a
+project about a "fuite electrique". Rows are written on project save and
+removed on delete (see customer.signals), and results are ranked with bm25.
+
+Other database backends fall back to ``icontains`` filters, backed on
+PostgreSQL by trigram indexes (see customer migration 0014).
+"""
+import re
+import unicodedata
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'project_search'
+
+# bm25 column weights, in table column order: name, description
+SEARCH_WEIGHTS = (4.0, 1.0)
+
+# Ids of the projects matching an FTS5 query
+SEARCH_MATCH_SQL = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+
+# bm25 of the current project row, the match run once (see handyman.search)
+SEARCH_RANK_SQL = (
+    f"WITH hits AS MATERIALIZED ("
+    f"SELECT rowid AS id, bm25({SEARCH_TABLE}, {', '.join(str(weight) for weight in SEARCH_WEIGHTS)}) AS rank "
+    f"FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+    f") SELECT rank FROM hits WHERE hits.id = customer_project.id"
+)
+
+# Maximum number of terms taken from a query
+SEARCH_MAX_TERMS = 8
+
+STOP_WORDS = frozenset("""
+    a au aux avec ce ces dans de des du elle en et il ils je la le les leur mais me mes
+    mon ne nous on ou par pas pour qu que qui sa se ses son sur ta te tes ton tu un une
+    vos votre vous y d l j m n s t c
+""".split())
+
+# Plurals in -aux whose singular is in -al or -ail; other words in -aux
+# only lose the x (tuyaux -> tuyau, noyaux -> noyau)
+AUX_PLURALS = {
+    'animaux': 'animal', 'canaux': 'canal', 'chevaux': 'cheval', 'generaux': 'general',
+    'hopitaux': 'hopital', 'journaux': 'journal', 'locaux': 'local', 'metaux': 'metal',
+    'signaux': 'signal', 'travaux': 'travail', 'vitraux': 'vitrail',
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def strip_accents(text):
+    decomposed = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def stem(word):
+    """
+    Light French stemmer: folds plurals, feminine and past participle
+    endings, and -er infinitives onto one stem (réparer, réparé, réparées ->
+    repar; fuite, fuites -> fuit; travaux -> travail). Expects an unaccented
+    lowercase word.
+    """
+    if len(word) <= 3:
+        return word
+    if word in AUX_PLURALS:
+        return AUX_PLURALS[word]
+    if word[-1] in 'sx':
+        word = word[:-1]
+    if len(word) > 4 and word.endswith('er'):
+        word = word[:-2]
+    else:
+        word = word.rstrip('e') if len(word.rstrip('e')) >= 3 else word
+    if len(word) > 4 and word[-1] == word[-2]:
+        word = word[:-1]
+    return word
+
+
+def normalize(text):
+    """Stemmed, unaccented, lowercase terms of `text`, without stop words"""
+    words = _WORD_RE.findall(strip_accents(text or '').lower())
+    return [stem(word) for word in words if word not in STOP_WORDS]
+
+
+def fts_query(q):
+    """
+    FTS5 query matching every normalized term of `q` as a prefix, or '' if
+    there is nothing to search. User input never reaches the FTS5 query
+    syntax unquoted.
+    """
+    return " ".join(f'"{term}"*' for term in normalize(q)[:SEARCH_MAX_TERMS])
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def index_project(project):
+    """Write or refresh the search row of `project`"""
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [project.pk])
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (%s, %s, %s)",
+            [project.pk, " ".join(normalize(project.name)), " ".join(normalize(project.description))],
+        )
+
+
+def unindex_project(project_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [project_id])
+
+
+def search_projects(queryset, q):
+    """
+    `queryset` restricted to projects matching `q`, annotated with
+    ``search_rank`` (lower is better).
+    """
+    if not fts_available():
+        return _search_fallback(queryset, q)
+
+    match = fts_query(q)
+    if not match:
+        return _no_match(queryset)
+    return queryset.filter(id__in=RawSQL(SEARCH_MATCH_SQL, [match])).annotate(
+        search_rank=RawSQL(SEARCH_RANK_SQL, [match], output_field=FloatField()),
+    )
+
+
+def fallback_terms(q):
+    """
+    Terms of `q` for icontains filters: stemmed like the index, but with
+    their accents, as in the stored text ("Fuites" -> "fuit").
+    """
+    terms = []
+    for word in _WORD_RE.findall((q or '').lower()):
+        if word in STOP_WORDS:
+            continue
+        # Matching both forms: travaux -> travau, not travail
+        terms.append(word[:-1] if word in AUX_PLURALS else stem(word))
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def _search_fallback(queryset, q):
+    words = fallback_terms(q)
+    if not words:
+        return _no_match(queryset)
+    for word in words:
+        queryset = queryset.filter(Q(name__icontains=word) | Q(description__icontains=word))
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def _no_match(queryset):
+    # Still annotated, so callers can order by search_rank
+    return queryset.none().annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def rebuild_search_index(project_model):
+    """Repopulate the search table from `project_model`, returns the number of rows"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        rows = 0
+        batch = []
+        for project_id, name, description in project_model.objects.values_list('id', 'name', 'description').iterator(chunk_size=2000):
+            batch.append((project_id, " ".join(normalize(name)), " ".join(normalize(description))))
+            if len(batch) >= 2000:
+                cursor.executemany(f"INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (%s, %s, %s)", batch)
+                rows += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f"INSERT INTO {SEARCH_TABLE}(rowid, name, description) VALUES (%s, %s, %s)", batch)
+            rows += len(batch)
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+    return rows
@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from base.models import Notification
+from base.notifications import forget_unread
+from .models import Project, ProjectImage
+from .search import index_project, unindex_project
+
+# Project fields copied into the full-text index
+SEARCH_FIELDS = {'name', 'description'}
+
+
+@receiver(pre_delete, sender=Project)
+def forget_project_notifications(sender, instance, **kwargs):
+    # Notifications about this project are removed by the cascade
+    forget_unread(Notification.objects.filter(project=instance))
+
+
+@receiver(post_save, sender=Project)
+def index_project_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    index_project(instance)
+
+
+@receiver(post_delete, sender=Project)
+def unindex_project_text(sender, instance, **kwargs):
+    unindex_project(instance.pk)
+
+
+@receiver(post_save, sender=ProjectImage)
+@receiver(post_delete, sender=ProjectImage)
+def touch_project(sender, instance, **kwargs):
+    # Project cards show the images but are cached on the project's updated_at
+    Project.objects.filter(id=instance.project_id).update(updated_at=timezone.now())
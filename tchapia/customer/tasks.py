@@ -0,0 +1,33 @@
+from base.jobs import task
+from handyman.saved_searches import alert_saved_searches
+from .fanout import fanout_new_project, fanout_project_update, subscribers
+from .models import Project
+
+
+@task
+def notify_handymen(project_id, service):
+    """Fan out new-project notifications for a published project"""
+    project = Project.objects.filter(id=project_id).first()
+    if project is None:
+        # Project was deleted before the job ran
+        return 0
+    return fanout_new_project(service, project).count
+
+
+@task
+def notify_project_update(project_id, service):
+    """Fan out update notifications for an edited project, coalescing repeats"""
+    project = Project.objects.filter(id=project_id).first()
+    if project is None:
+        return 0
+    return fanout_project_update(service, project).count
+
+
+@task
+def notify_saved_searches(project_id, service):
+    """Alert artisans whose saved searches match a published project"""
+    project = Project.objects.filter(id=project_id).first()
+    if project is None:
+        return 0
+    # Artisans notified by notify_handymen don't need a second alert
+    return alert_saved_searches(project, exclude_user_ids=subscribers(service, project))
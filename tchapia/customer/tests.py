@@ -1,3 +1,380 @@
+import re
+import unittest
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from base import matching
+from base.models import Notification
+from customer.fanout import (
+    NOTIFICATION_COALESCE_WINDOW, build_new_project_notification, fanout, fanout_new_project, fanout_project_update,
+    matching_handymen,
+)
+from customer.models import PRIORITY_RANKS, Customer, Project
+from customer.search import fallback_terms, normalize, search_projects, stem
+from handyman.digest import send_digests
+from handyman.models import Handyman
+from userauths.models import User
+
+# Tables whose hot queries must be answered from an index
+HOT_TABLES = ['customer_project', 'userauths_user']
+
+_SCAN_RE = re.compile(r'^SCAN (\w+)')
+
+
+class QueryRecorder:
+    """execute_wrapper recording the SQL and parameters actually sent to the database"""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+class ProjectQueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN QUERY PLAN on the project queries of the artisan pages, the
+    customer dashboard and the notification fan-out/digests, and fails if any
+    of them reads a hot table with a full scan.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        cls.handyman = Handyman.objects.create(user=cls.artisan)
+        Handyman.objects.create(user=User.objects.create_user(
+            username='digest', email='digest@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        ), notification_digest='daily')
+        cls.owner = User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        )
+        cls.customer = Customer.objects.create(user=cls.owner)
+        for i, (status, region) in enumerate([
+            ('published', 'littoral'), ('in_progress', 'littoral'), ('draft', 'littoral'),
+            ('published', 'centre'), ('completed', 'littoral'),
+        ]):
+            Project.objects.create(
+                customer=cls.customer, name=f"Fuite d'eau {i}", description="Réparer une fuite sous l'évier",
+                service='plomberie', region=region, status=status, location_address='Douala',
+            )
+
+    def record(self, run):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            run()
+        return recorder.queries
+
+    def setUp(self):
+        # Pages and fan-outs build the matching index on first use, which is checked too
+        cache.clear()
+        matching.reset_index()
+        self.addCleanup(matching.reset_index)
+
+    def full_scans(self, sql, params, tables=HOT_TABLES):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            details = [row[-1] for row in cursor.fetchall()]
+        scans = []
+        for detail in details:
+            match = _SCAN_RE.match(detail)
+            if match and match.group(1) in tables:
+                scans.append(detail)
+        return scans, details
+
+    def assertNoFullScan(self, queries, tables=HOT_TABLES):
+        hot = [(sql, params) for sql, params in queries if any(f'"{table}"' in sql for table in tables)]
+        self.assertTrue(hot, "no query read a hot table")
+        for sql, params in hot:
+            scans, details = self.full_scans(sql, params, tables)
+            self.assertFalse(scans, f"full scan in\n{sql}\nplan: {details}")
+
+    def get(self, url, user):
+        self.client.force_login(user)
+        queries = self.record(lambda: self.assertEqual(self.client.get(url).status_code, 200))
+        self.client.logout()
+        return queries
+
+    def test_handyman_dashboard(self):
+        self.assertNoFullScan(self.get('/handyman/dashboard/', self.artisan))
+
+    def test_projects_browse_defaults(self):
+        self.assertNoFullScan(self.get('/handyman/projects/', self.artisan))
+
+    def test_projects_browse_filtered(self):
+        self.assertNoFullScan(self.get(
+            '/handyman/projects/?service=plomberie&region=centre&status=published&priority=medium&budget=low',
+            self.artisan,
+        ))
+
+    def test_projects_browse_search(self):
+        self.assertNoFullScan(self.get('/handyman/projects/?q=fuite', self.artisan))
+
+    def test_projects_browse_is_ordered_by_the_index(self):
+        queries = self.get('/handyman/projects/', self.artisan)
+        sql, params = next((sql, params) for sql, params in queries if 'ORDER BY "customer_project"."priority_rank" DESC' in sql)
+        _, details = self.full_scans(sql, params)
+        self.assertFalse([detail for detail in details if 'TEMP B-TREE' in detail], details)
+
+    def test_customer_dashboard(self):
+        self.assertNoFullScan(self.get('/customer/dashboard/', self.owner))
+
+    def test_fanout_matching(self):
+        project = Project.objects.filter(status='published').first()
+        self.assertNoFullScan(self.record(lambda: list(matching_handymen('plomberie', project).values_list('user_id', flat=True))))
+        # Recipients come from the matching index, built here by the first fan-out
+        self.assertNoFullScan(self.record(lambda: fanout_new_project('plomberie', project)))
+        # Recent unread notifications about the project, looked up to coalesce an edit
+        queries = self.record(lambda: fanout_project_update('plomberie', project))
+        self.assertNoFullScan(queries, tables=['base_notification'])
+
+    def test_matching_index_build(self):
+        queries = self.record(matching.build_index)
+        self.assertNoFullScan(queries)
+        sql, params = next((sql, params) for sql, params in queries if '"customer_project"' in sql)
+        _, details = self.full_scans(sql, params)
+        self.assertTrue([detail for detail in details if 'COVERING INDEX project_status_idx' in detail], details)
+
+    def test_digest_projects(self):
+        queries = self.record(send_digests)
+        self.assertNoFullScan([(sql, params) for sql, params in queries if '"customer_project"' in sql])
+
+
+class ProjectPriorityRankTests(TestCase):
+    def setUp(self):
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        Handyman.objects.create(user=self.artisan)
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+
+    def project(self, name, priority):
+        return Project.objects.create(
+            customer=self.customer, name=name, description=name, service='plomberie',
+            region='littoral', status='published', priority=priority, location_address='Douala',
+        )
+
+    def test_rank_follows_priority(self):
+        project = self.project('Toiture', 'low')
+        self.assertEqual(project.priority_rank, PRIORITY_RANKS['low'])
+        project.priority = 'urgent'
+        project.save(update_fields=['priority'])
+        project.refresh_from_db()
+        self.assertEqual(project.priority_rank, PRIORITY_RANKS['urgent'])
+
+    def test_browse_lists_most_urgent_first(self):
+        for name, priority in [('Bas', 'low'), ('Haut', 'high'), ('Urgent', 'urgent'), ('Moyen', 'medium')]:
+            self.project(name, priority)
+        self.client.force_login(self.artisan)
+        response = self.client.get('/handyman/projects/')
+        self.assertEqual([project.name for project in response.context['projects']], ['Urgent', 'Haut', 'Moyen', 'Bas'])
+
+
+class FanoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        matching.reset_index()
+        self.addCleanup(matching.reset_index)
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+        self.project = Project.objects.create(
+            customer=self.customer, name='Fuite', description='Fuite', service='plomberie',
+            region='littoral', status='published', location_address='Akwa',
+        )
+
+    def artisan(self, name, region='littoral', **fields):
+        user = User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='secret',
+            user_type='artisan', service='plomberie', region=region,
+        )
+        Handyman.objects.create(user=user, **fields)
+        return user
+
+    def test_rows_are_written_in_batches(self):
+        users = [self.artisan(f'artisan{i}') for i in range(5)]
+        fields = build_new_project_notification('plomberie', self.project)
+        with CaptureQueriesContext(connection) as queries:
+            result = fanout((user.id for user in users), fields, batch_size=2)
+
+        self.assertEqual((result.count, result.batches), (5, 3))
+        inserts = [q for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "base_notification"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(
+            set(Notification.objects.filter(project=self.project).values_list('user_id', 'title')),
+            {(user.id, "Nouveau projet: Fuite") for user in users},
+        )
+        # bulk_create skips post_save: the counters are bumped per batch
+        self.assertEqual(
+            set(User.objects.filter(id__in=[user.id for user in users]).values_list('unread_notifications_count', flat=True)),
+            {1},
+        )
+
+    def test_new_project_reaches_only_matching_artisans(self):
+        matching_users = [self.artisan('douala'), self.artisan('kribi')]
+        self.artisan('yaounde', region='centre')
+        self.artisan('busy', availability=False)
+        self.artisan('digest', notification_digest='daily')
+
+        result = fanout_new_project('plomberie', self.project)
+
+        self.assertEqual(result.count, 2)
+        self.assertEqual(
+            set(Notification.objects.values_list('user_id', flat=True)),
+            {user.id for user in matching_users},
+        )
+        self.assertEqual(
+            set(matching_handymen('plomberie', self.project).values_list('user_id', flat=True)),
+            {user.id for user in matching_users},
+        )
+
+    def test_edits_refresh_the_unread_notification(self):
+        user = self.artisan('artisan')
+        fanout_new_project('plomberie', self.project)
+        self.project.name = 'Fuite sous évier'
+        self.project.save()
+        for _ in range(2):
+            result = fanout_project_update('plomberie', self.project)
+            self.assertEqual((result.coalesced, result.count), (1, 0))
+
+        notification = Notification.objects.get(user=user)
+        self.assertEqual(notification.notification_type, 'project_update')
+        self.assertEqual(notification.title, "Projet mis à jour: Fuite sous évier")
+        user.refresh_from_db()
+        self.assertEqual(user.unread_notifications_count, 1)
+
+    def test_read_or_old_notifications_get_a_new_row(self):
+        reader, away = self.artisan('reader'), self.artisan('away')
+        fanout_new_project('plomberie', self.project)
+        Notification.objects.filter(user=reader).mark_read()
+        Notification.objects.filter(user=away).update(
+            created_at=timezone.now() - timedelta(seconds=NOTIFICATION_COALESCE_WINDOW + 1),
+        )
+
+        result = fanout_project_update('plomberie', self.project)
+
+        self.assertEqual((result.coalesced, result.count), (0, 2))
+        self.assertEqual(Notification.objects.filter(notification_type='project_update').count(), 2)
+        for user, unread in [(reader, 1), (away, 2)]:
+            user.refresh_from_db()
+            self.assertEqual(user.unread_notifications_count, unread)
+
+    def test_no_recipients_writes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            result = fanout([], {'notification_type': 'message'})
+        self.assertEqual((result.count, result.batches), (0, 0))
+        self.assertEqual(queries.captured_queries, [])
+
+
+class ProjectSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        Handyman.objects.create(user=self.artisan)
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+
+    def project(self, name, description='', status='published', **fields):
+        return Project.objects.create(
+            customer=self.customer, name=name, description=description, service='plomberie',
+            region='littoral', status=status, location_address='Douala', **fields,
+        )
+
+    def found(self, q):
+        return set(search_projects(Project.objects.all(), q).values_list('name', flat=True))
+
+    def test_normalize(self):
+        self.assertEqual(normalize("Fuites électriques dans la cuisine"), ['fuit', 'electriqu', 'cuisin'])
+        self.assertEqual(normalize("Réparer, réparé, réparées"), ['repar', 'repar', 'repar'])
+        self.assertEqual(normalize("l'évier de l'étage"), ['evi', 'etag'])
+        self.assertEqual(normalize(''), [])
+
+    def test_fallback_terms_keep_accents(self):
+        self.assertEqual(fallback_terms("Fuites électriques de l'évier"), ['fuit', 'électriqu', 'évi'])
+        self.assertEqual(fallback_terms('travaux tuyaux'), ['travau', 'tuyau'])
+
+    def test_stem_plurals(self):
+        for plural, singular in [
+            ('tuyaux', 'tuyau'), ('bureaux', 'bureau'), ('travaux', 'travail'),
+            ('chevaux', 'cheval'), ('fuites', 'fuite'), ('portes', 'porte'),
+        ]:
+            with self.subTest(plural=plural):
+                self.assertEqual(stem(plural), stem(singular))
+        self.assertEqual(stem('eau'), 'eau')
+
+    def test_every_term_must_match(self):
+        self.project('Fuite sous évier', 'Le tuyau goutte')
+        self.project('Tableau électrique', 'Disjoncteur qui saute')
+        self.assertEqual(self.found('fuites tuyaux'), {'Fuite sous évier'})
+        self.assertEqual(self.found('électrique'), {'Tableau électrique'})
+        self.assertEqual(self.found('fuite disjoncteur'), set())
+        self.assertEqual(self.found('"*) OR ('), set())
+
+    def test_edits_are_searchable(self):
+        project = self.project('Fuite sous évier')
+        project.name = 'Travaux de toiture'
+        project.save()
+        self.assertEqual(self.found('toitures travaux'), {'Travaux de toiture'})
+        self.assertEqual(self.found('fuite'), set())
+
+        # Saves of other fields leave the text as it is
+        project.status = 'in_progress'
+        project.save(update_fields=['status'])
+        self.assertEqual(self.found('toiture'), {'Travaux de toiture'})
+
+        project.delete()
+        self.assertEqual(self.found('toiture'), set())
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "bm25 ranking needs FTS5")
+    def test_names_rank_above_descriptions(self):
+        self.project('Carrelage salle de bain', 'Refaire la fuite du mur')
+        self.project('Fuite de la douche', 'Carrelage abîmé')
+        ranked = search_projects(Project.objects.all(), 'fuite').order_by('search_rank', 'id')
+        self.assertEqual(list(ranked.values_list('name', flat=True)), ['Fuite de la douche', 'Carrelage salle de bain'])
+
+    def test_browse_search(self):
+        self.project('Fuite sous évier', 'Urgent', priority='urgent')
+        self.project('Fuites de la douche')
+        self.project('Tableau électrique')
+        self.project('Fuite au bureau', status='completed')
+        self.client.force_login(self.artisan)
+
+        response = self.client.get('/handyman/projects/', {'q': 'fuite'})
+        self.assertEqual(
+            {project.name for project in response.context['projects']}, {'Fuite sous évier', 'Fuites de la douche'},
+        )
+        self.assertEqual(response.context['current_q'], 'fuite')
+
+        response = self.client.get('/handyman/projects/', {'q': 'fuite', 'priority': 'urgent'})
+        self.assertEqual([project.name for project in response.context['projects']], ['Fuite sous évier'])
+
 
-# Create your tests here.
+@unittest.skipUnless(connection.vendor == 'postgresql', "PostgreSQL only indexes")
+class PostgresIndexTests(TestCase):
+    def test_search_and_open_project_indexes_exist(self):
+        with connection.cursor() as cursor:
+            indexes = {
+                table: set(connection.introspection.get_constraints(cursor, table))
+                for table in ['customer_project', 'handyman_handyman', 'userauths_user']
+            }
+        self.assertLessEqual({'project_name_trgm_idx', 'project_description_trgm_idx', 'project_open_idx'}, indexes['customer_project'])
+        self.assertIn('handyman_skills_trgm_idx', indexes['handyman_handyman'])
+        self.assertIn('user_bio_trgm_idx', indexes['userauths_user'])
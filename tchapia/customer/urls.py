@@ -10,4 +10,7 @@ urlpatterns = [
     path('project/<int:project_id>/edit/', views.project_edit_view, name='project_edit'),
     path('project/<int:project_id>/delete/', views.project_delete_view, name='project_delete'),
     path('profile/edit/', views.profile_edit_view, name='profile_edit'),
+    path('notifications/', views.notifications_view, name='notifications'),
+    path('notifications/<int:notification_id>/', views.notification_open_view, name='notification_open'),
+    path('notifications/mark-all-read/', views.notifications_mark_all_read_view, name='notifications_mark_all_read'),
 ]
\ No newline at end of file
@@ -1,12 +1,23 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
+from django.db.models import OuterRef
+from django.db.models.functions import Greatest
 from django.http import Http404, JsonResponse
 from .forms import PostProjectForm, CustomerProfileForm, CustomerUserProfileForm
 from .models import Customer, Project, ProjectImage
-from handyman.models import Handyman, HandymanNotification
+from . import tasks
+from handyman.models import ProjectOffer
 from userauths.models import SERVICE_CHOICES
+from base.conditional import changes, conditional_page
+from base.models import Notification
+from base.notifications import mark_all_read
+from base.pagination import keyset_page
+from base.replica import read_only_view
+from base.sqlite import write_transaction
+
+NOTIFICATIONS_PAGE_SIZE = 20
+NOTIFICATION_ORDERING = ['-created_at', '-id']
 
 @login_required
 def post_project_view(request):
@@ -17,7 +28,7 @@ def post_project_view(request):
         form = PostProjectForm(request.POST, request.FILES)
         if form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     # Create the project
                     project = form.save(commit=False)
                     project.customer = customer
@@ -46,14 +57,14 @@ def post_project_view(request):
                     # Get the selected service
                     selected_service = form.cleaned_data['service']
 
-                    # Notify handymen in the same service and region
-                    notification_count = notify_handymen(selected_service, project)
+                    # Notify handymen in the same service and region in the background
+                    notify_handymen(selected_service, project)
 
                     image_text = f" avec {len(images)} image(s)" if images else ""
                     messages.success(
                         request,
                         f"Projet '{project.name}' publié avec succès{image_text}! "
-                        f"{notification_count} artisan(s) ont été notifié(s)."
+                        f"Les artisans de votre région vont être notifiés."
                     )
                     return redirect('customer:dashboard')
 
@@ -69,6 +80,7 @@ def post_project_view(request):
     }
     return render(request, 'customer/post_project.html', context)
 
+@read_only_view
 @login_required
 def dashboard_view(request):
     # Ensure user has customer profile
@@ -83,7 +95,18 @@ def dashboard_view(request):
     }
     return render(request, 'customer/dashboard.html', context)
 
+def project_detail_changes(request, project_id):
+    project = OuterRef('pk')
+    return Project.objects.filter(id=project_id, customer__user=request.user).annotate(
+        **changes('images', ProjectImage.objects.filter(project=project), 'uploaded_at'),
+        # Offers show their artisan's name, photo and rating
+        **changes('offers', ProjectOffer.objects.filter(project=project), Greatest('updated_at', 'handyman__updated_at')),
+        **changes('notifications', Notification.objects.filter(project=project), 'created_at'),
+    )
+
+
 @login_required
+@conditional_page('customer/project_detail.html', project_detail_changes)
 def project_detail_view(request, project_id):
     # Ensure user has customer profile
     customer, created = Customer.objects.get_or_create(user=request.user)
@@ -92,7 +115,7 @@ def project_detail_view(request, project_id):
     project = get_object_or_404(Project, id=project_id, customer=customer)
 
     # Get notifications related to this project (if any)
-    related_notifications = HandymanNotification.objects.filter(project=project)
+    related_notifications = Notification.objects.filter(project=project).exclude(user_id=customer.user_id)
 
     # Get offers for this project
     offers = project.offers.all().select_related('handyman__user').order_by('-created_at')
@@ -118,7 +141,7 @@ def project_edit_view(request, project_id):
         form = PostProjectForm(request.POST, request.FILES, instance=project)
         if form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     # Update the project
                     updated_project = form.save(commit=False)
 
@@ -145,14 +168,15 @@ def project_edit_view(request, project_id):
                     # Check if service changed and notify new handymen if needed
                     selected_service = form.cleaned_data['service']
                     if project.status == 'published':
-                        # Create update notifications
-                        notification_count = notification_count = notify_handymen(selected_service, project)
+                        # Create update notifications in the background, coalesced
+                        # with unread ones from recent edits
+                        notify_project_update(selected_service, project)
 
                         image_text = f" avec {len(images)} nouvelle(s) image(s)" if images else ""
                         messages.success(
                             request,
                             f"Projet '{updated_project.name}' mis à jour avec succès{image_text}! "
-                            f"{notification_count} artisan(s) ont été notifié(s) de la modification."
+                            f"Les artisans concernés vont être notifiés de la modification."
                         )
                     else:
                         image_text = f" avec {len(images)} nouvelle(s) image(s)" if images else ""
@@ -192,7 +216,7 @@ def profile_edit_view(request):
 
         if user_form.is_valid() and customer_form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     user_form.save()
                     customer_form.save()
                     messages.success(request, "Profil mis à jour avec succès!")
@@ -238,26 +262,69 @@ def project_delete_view(request, project_id):
     return redirect('customer:dashboard')
 
 
-def notify_handymen(service, project): 
-    handymen_to_notify = Handyman.objects.filter(
-        user__service=service,
-        user__region=project.region,
-        availability=True
-    ).select_related('user')
-
-    print("############# Handymen: ", handymen_to_notify)
-    # Create notifications for handymen
-    notification_count = 0
-    for handyman in handymen_to_notify:
-        HandymanNotification.objects.create(
-            handyman=handyman,
-            notification_type='new_project',
-            title=f"Nouveau projet: {project.name}",
-            message=f"Un nouveau projet '{project.name}' a été publié dans votre région ({project.get_region_display()}) pour le service {handyman.user.get_service_display()}. Budget: {project.budget_range}",
-            project=project
-        )
-        notification_count += 1
-    
-    return notification_count
+def notify_handymen(service, project):
+    """Queue the fan-out of new-project notifications and saved search alerts"""
+    tasks.notify_saved_searches.enqueue(project_id=project.id, service=service)
+    return tasks.notify_handymen.enqueue(project_id=project.id, service=service)
+
+
+def notify_project_update(service, project):
+    """Queue the fan-out of update notifications for an edited project"""
+    return tasks.notify_project_update.enqueue(project_id=project.id, service=service)
+
+
+@login_required
+def notifications_view(request):
+    # Ensure user is a customer
+    if request.user.user_type != 'client':
+        messages.error(request, "Accès non autorisé. Cette page est réservée aux clients.")
+        return redirect('base:home')
+
+    customer, created = Customer.objects.get_or_create(user=request.user)
+
+    # Newest first, paged with a (created_at, id) cursor instead of OFFSET
+    notifications = customer.notifications.all()
+    unread_only = request.GET.get('unread') == '1'
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+
+    page, next_cursor = keyset_page(
+        notifications,
+        NOTIFICATION_ORDERING,
+        cursor=request.GET.get('cursor'),
+        page_size=NOTIFICATIONS_PAGE_SIZE,
+    )
+
+    context = {
+        'customer': customer,
+        'notifications': page,
+        'next_cursor': next_cursor,
+        'unread_only': unread_only,
+        'unread_count': customer.unread_count,
+        'open_url_name': 'customer:notification_open',
+        'mark_all_read_url_name': 'customer:notifications_mark_all_read',
+        'inbox_url_name': 'customer:notifications',
+    }
+    return render(request, 'customer/notifications.html', context)
+
 
+@login_required
+def notification_open_view(request, notification_id):
+    notification = get_object_or_404(Notification, id=notification_id, user=request.user)
+
+    # Mark on click
+    if not notification.is_read:
+        Notification.objects.filter(id=notification.id).mark_read()
+
+    if notification.project_id:
+        return redirect('customer:project_detail', project_id=notification.project_id)
+    return redirect('customer:notifications')
+
+
+@login_required
+def notifications_mark_all_read_view(request):
+    if request.method == 'POST':
+        updated = mark_all_read(request.user)
+        messages.success(request, f"{updated} notification(s) marquée(s) comme lue(s).")
 
+    return redirect('customer:notifications')
@@ -1,13 +1,13 @@
 from django.contrib import admin
-from .models import Handyman, HandymanService, HandymanRating
+from .models import Handyman, HandymanService, HandymanRating, SavedSearch
 
 @admin.register(Handyman)
 class HandymanAdmin(admin.ModelAdmin):
-    list_display = ['user', 'experience_years', 'hourly_rate', 'availability', 'verification_status', 'created_at']
+    list_display = ['user', 'experience_years', 'hourly_rate', 'availability', 'verification_status', 'rating_avg', 'rating_count', 'created_at']
     list_filter = ['availability', 'verification_status', 'experience_years', 'created_at']
     search_fields = ['user__email', 'user__first_name', 'user__last_name', 'skills']
     ordering = ['-created_at']
-    readonly_fields = ['created_at', 'updated_at']
+    readonly_fields = ['rating_sum', 'rating_count', 'rating_avg', 'created_at', 'updated_at']
 
 @admin.register(HandymanService)
 class HandymanServiceAdmin(admin.ModelAdmin):
@@ -22,4 +22,12 @@ class HandymanRatingAdmin(admin.ModelAdmin):
     list_filter = ['rating', 'created_at']
     search_fields = ['handyman__user__first_name', 'customer__user__first_name', 'comment']
     ordering = ['-created_at']
-    readonly_fields = ['created_at']
\ No newline at end of file
+    readonly_fields = ['created_at']
+
+@admin.register(SavedSearch)
+class SavedSearchAdmin(admin.ModelAdmin):
+    list_display = ['handyman', 'service', 'region', 'city', 'priority', 'budget', 'alert_count', 'last_alert_at', 'created_at']
+    list_filter = ['service', 'region', 'priority', 'budget', 'created_at']
+    search_fields = ['handyman__user__first_name', 'handyman__user__last_name', 'handyman__user__email']
+    ordering = ['-created_at']
+    readonly_fields = ['alert_count', 'last_alert_at', 'created_at']
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class HandymanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'handyman'
+
+    def ready(self):
+        from . import signals  # noqa: F401
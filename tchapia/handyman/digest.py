@@ -0,0 +1,115 @@
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from base.models import Notification
+from base.notifications import bump_unread
+from customer.models import Project
+from .models import Handyman
+
+logger = logging.getLogger(__name__)
+
+DIGEST_INTERVALS = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1),
+}
+
+DIGEST_BATCH_SIZE = 500
+
+# Project names listed in a digest message before "et N autre(s)"
+DIGEST_MAX_LISTED = 5
+
+
+@dataclass
+class DigestResult:
+    """Outcome of a digest run"""
+    subscribers: int = 0
+    digests: int = 0
+    projects: int = 0
+
+
+def due_subscribers(mode, now):
+    """Digest subscribers of `mode` whose last digest is at least one interval old"""
+    interval = DIGEST_INTERVALS[mode]
+    return Handyman.objects.filter(
+        notification_digest=mode,
+        availability=True,
+    ).filter(
+        Q(digest_sent_at__isnull=True) | Q(digest_sent_at__lte=now - interval)
+    )
+
+
+def build_digest(user_id, projects):
+    """Digest notification for `projects`, newest first"""
+    names = ", ".join(f"'{project['name']}'" for project in projects[:DIGEST_MAX_LISTED])
+    others = len(projects) - DIGEST_MAX_LISTED
+    if others > 0:
+        names += f" et {others} autre(s)"
+    return Notification(
+        user_id=user_id,
+        notification_type='digest',
+        title=f"Résumé: {len(projects)} nouveau(x) projet(s)",
+        message=f"Nouveaux projets dans votre région: {names}.",
+        project_id=projects[0]['id'] if len(projects) == 1 else None,
+        payload={'project_ids': [project['id'] for project in projects]},
+    )
+
+
+def send_digests(now=None, batch_size=DIGEST_BATCH_SIZE):
+    """
+    Materialize one digest notification per due subscriber.
+
+    Subscribers are grouped by (service, region) so the published projects of
+    each group are read with a single query; notifications are written with
+    bulk_create and every subscriber's digest_sent_at with one UPDATE per batch.
+    Subscribers without new projects still move their window forward.
+    """
+    now = now or timezone.now()
+    result = DigestResult()
+
+    for mode, interval in DIGEST_INTERVALS.items():
+        groups = defaultdict(list)
+        subscribers = due_subscribers(mode, now).values_list('id', 'user_id', 'digest_sent_at', 'user__service', 'user__region')
+        for handyman_id, user_id, sent_at, service, region in subscribers.iterator(chunk_size=batch_size):
+            # First digest covers one interval back
+            groups[(service, region)].append((handyman_id, user_id, sent_at or now - interval))
+
+        for (service, region), members in groups.items():
+            since = min(sent_at for _, _, sent_at in members)
+            projects = list(
+                Project.objects.filter(
+                    service=service,
+                    region=region,
+                    status='published',
+                    created_at__gt=since,
+                    created_at__lte=now,
+                ).order_by('-created_at').values('id', 'name', 'created_at')
+            )
+
+            for start in range(0, len(members), batch_size):
+                batch = members[start:start + batch_size]
+                digests = []
+                for handyman_id, user_id, sent_at in batch:
+                    fresh = [project for project in projects if project['created_at'] > sent_at]
+                    if fresh:
+                        digests.append(build_digest(user_id, fresh))
+                        result.projects += len(fresh)
+
+                with transaction.atomic():
+                    Notification.objects.bulk_create(digests, batch_size=batch_size)
+                    bump_unread([digest.user_id for digest in digests])
+                    Handyman.objects.filter(id__in=[handyman_id for handyman_id, _, _ in batch]).update(digest_sent_at=now)
+
+                result.subscribers += len(batch)
+                result.digests += len(digests)
+
+    logger.info(
+        "Digests: %d subscriber(s) due, %d digest(s) covering %d project notification(s)",
+        result.subscribers, result.digests, result.projects
+    )
+    return result
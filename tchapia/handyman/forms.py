@@ -34,7 +34,7 @@ class HandymanProfileForm(forms.ModelForm):
         model = Handyman
         fields = [
             'experience_years', 'hourly_rate', 'skills',
-            'availability', 'id_card_number', 'id_card_image', 'portfolio_images'
+            'availability', 'notification_digest', 'id_card_number', 'id_card_image', 'portfolio_images'
         ]
         widgets = {
             'experience_years': forms.NumberInput(attrs={
@@ -54,6 +54,9 @@ class HandymanProfileForm(forms.ModelForm):
             'availability': forms.CheckboxInput(attrs={
                 'class': 'form-check-input'
             }),
+            'notification_digest': forms.Select(attrs={
+                'class': 'form-select'
+            }),
             'id_card_number': forms.TextInput(attrs={
                 'class': 'form-control',
                 'placeholder': 'Numéro de carte d\'identité'
@@ -0,0 +1,101 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+
+from base.directory import DIRECTORY_PAGE_SIZE, directory_filters, directory_page
+from handyman.models import Handyman
+from handyman.search import fts_available, search_handymen
+from userauths.models import REGION_CHOICES, SERVICE_CHOICES, User
+
+FIRST_NAMES = ['Jean', 'Paul', 'Marie', 'Aïcha', 'Emmanuel', 'Brice', 'Ngono', 'Fotso', 'Christelle', 'Hervé']
+LAST_NAMES = ['Mbarga', 'Nkoulou', 'Tchoupo', 'Ewane', 'Kamga', 'Ndjock', 'Fouda', 'Essomba', 'Talla', 'Abena']
+SKILLS = [
+    'fuite', 'tuyauterie', 'chauffe-eau', 'tableau électrique', 'câblage', 'disjoncteur', 'peinture',
+    'enduit', 'carrelage', 'faïence', 'serrure', 'porte blindée', 'toiture', 'charpente', 'climatiseur',
+    'jardinage', 'élagage', 'maçonnerie', 'dalle', 'menuiserie', 'placard', 'soudure', 'vitrerie',
+]
+
+QUERIES = ['fuite', 'tableau electrique', 'serrure porte', 'Mbarga', 'climatis', 'faience carrelage']
+
+
+class Command(BaseCommand):
+    help = "Benchmark artisan full-text search against icontains scans on a seeded directory"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artisans', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search index is only used on SQLite")
+        rng = random.Random(options['seed'])
+
+        # Everything runs in one transaction that is rolled back at the end,
+        # so the benchmark leaves the database untouched.
+        with transaction.atomic():
+            self.seed(options['artisans'], rng)
+
+            for q in QUERIES:
+                fts = self.measure(options['repeat'], lambda: directory_page(directory_filters({'q': q})))
+                scan = self.measure(max(options['repeat'] // 10, 1), lambda: self.icontains_page(q))
+                matches = search_handymen(Handyman.objects.all(), q).count()
+                self.report(q, matches, fts, scan)
+
+            transaction.set_rollback(True)
+
+    def seed(self, artisans, rng):
+        self.stdout.write(f"Seeding {artisans} artisans...")
+        start = time.perf_counter()
+        users = User.objects.bulk_create([
+            User(
+                username=f"bench-search-{i}",
+                email=f"bench-search-{i}@bench.tchapia.local",
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                bio=f"Artisan expérimenté en {rng.choice(SKILLS)} et {rng.choice(SKILLS)}",
+                user_type='artisan',
+                service=rng.choice(SERVICE_CHOICES)[0],
+                region=rng.choice(REGION_CHOICES)[0],
+            )
+            for i in range(artisans)
+        ], batch_size=1000)
+        # Index rows are written by the triggers on handyman_handyman
+        Handyman.objects.bulk_create([
+            Handyman(user=user, skills=", ".join(rng.sample(SKILLS, 3)))
+            for user in users
+        ], batch_size=1000)
+        self.stdout.write(f"Seeded in {time.perf_counter() - start:.1f}s")
+
+    def icontains_page(self, q):
+        """What a search would cost without the index"""
+        handymen = Handyman.objects.select_related('user')
+        for term in q.split():
+            handymen = handymen.filter(
+                Q(user__first_name__icontains=term)
+                | Q(user__last_name__icontains=term)
+                | Q(skills__icontains=term)
+                | Q(user__bio__icontains=term)
+            )
+        return list(handymen.order_by('-created_at', '-id')[:DIRECTORY_PAGE_SIZE])
+
+    def measure(self, repeat, run):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, q, matches, fts, scan):
+        # First page of results; the seeded vocabulary is small, so every
+        # term matches a large share of the directory and has to be ranked
+        p95 = sorted(fts)[max(int(len(fts) * 0.95) - 1, 0)]
+        self.stdout.write(
+            f"{q!r:<22} {matches:>6} matches  fts5 median {statistics.median(fts):7.2f} ms  p95 {p95:7.2f} ms   "
+            f"icontains median {statistics.median(scan):8.2f} ms"
+        )
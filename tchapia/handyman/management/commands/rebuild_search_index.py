@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from customer import search as project_search
+from customer.models import Project
+from handyman.search import fts_available, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search indexes of artisans and projects"
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError("Full-text search index is only used on SQLite")
+        rows = rebuild_search_index()
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rows} handymen"))
+        rows = project_search.rebuild_search_index(Project)
+        self.stdout.write(self.style.SUCCESS(f"Indexed {rows} projects"))
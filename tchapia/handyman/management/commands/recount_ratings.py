@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from handyman.models import Handyman, HandymanRating
+from handyman.ratings import recount
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized rating aggregates of every handyman from the rating table"
+
+    def handle(self, *args, **options):
+        handymen = recount(Handyman, HandymanRating)
+        self.stdout.write(self.style.SUCCESS(f"Recounted ratings for {handymen} handymen"))
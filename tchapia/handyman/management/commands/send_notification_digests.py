@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from handyman.digest import send_digests
+
+
+class Command(BaseCommand):
+    help = "Send new-project digests to handymen who opted into digest mode (schedule e.g. every 15 minutes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        result = send_digests(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result.digests} digest(s) sent to {result.subscribers} due subscriber(s), "
+            f"replacing {result.projects} per-project notification(s)"
+        ))
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('customer', '0009_customernotification_customer_notif_unread_idx_and_more'),
+        ('handyman', '0007_handyman_unread_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='handymannotification',
+            index=models.Index(fields=['handyman', 'is_read', 'created_at'], name='handyman_notif_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='handymannotification',
+            index=models.Index(fields=['handyman', 'created_at'], name='handyman_notif_inbox_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0008_handymannotification_handyman_notif_unread_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handyman',
+            name='digest_sent_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='handyman',
+            name='notification_digest',
+            field=models.CharField(choices=[('off', 'Instantané'), ('hourly', 'Résumé horaire'), ('daily', 'Résumé quotidien')], default='off', help_text='Receive new projects one by one or as a periodic digest', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='handymannotification',
+            name='notification_type',
+            field=models.CharField(choices=[('new_project', 'New Project'), ('project_update', 'Project Update'), ('message', 'Message'), ('offer_status', 'Offer Status'), ('digest', 'Digest')], max_length=20),
+        ),
+    ]
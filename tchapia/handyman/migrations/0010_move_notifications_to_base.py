@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Rows copied per INSERT ... SELECT, keeps each statement and its lock short
+CHUNK_SIZE = 5000
+
+
+def copy_notifications(apps, schema_editor):
+    """Stream handyman_notification into base_notification in id ranges"""
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(id), MAX(id) FROM handyman_notification")
+        first_id, last_id = cursor.fetchone()
+        if first_id is None:
+            return
+        for start in range(first_id, last_id + 1, CHUNK_SIZE):
+            cursor.execute(
+                """
+                INSERT INTO base_notification
+                    (user_id, notification_type, title, message, project_id, offer_id,
+                     service_id, payload, is_read, created_at)
+                SELECT o.user_id, n.notification_type, n.title, n.message, n.project_id, NULL,
+                       NULL, '{}', n.is_read, n.created_at
+                FROM handyman_notification n
+                JOIN handyman_handyman o ON o.id = n.handyman_id
+                WHERE n.id >= %s AND n.id < %s
+                ORDER BY n.id
+                """,
+                [start, start + CHUNK_SIZE],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0009_handyman_notification_digest'),
+        ('base', '0006_unified_notification'),
+        ('userauths', '0004_user_unread_notifications_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_notifications, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='HandymanNotification',
+        ),
+        migrations.RemoveField(
+            model_name='handyman',
+            name='unread_count',
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:05
+
+from django.db import migrations, models
+from django.db.models import Count, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, NullIf
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Handyman = apps.get_model('handyman', 'Handyman')
+    HandymanRating = apps.get_model('handyman', 'HandymanRating')
+    ratings = HandymanRating.objects.filter(handyman=OuterRef('pk')).order_by().values('handyman')
+    rating_sum = Coalesce(
+        Subquery(ratings.annotate(total=Sum('rating')).values('total'), output_field=models.IntegerField()),
+        Value(0),
+    )
+    rating_count = Coalesce(
+        Subquery(ratings.annotate(n=Count('id')).values('n'), output_field=models.IntegerField()),
+        Value(0),
+    )
+    Handyman.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=Coalesce(
+            Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)),
+            Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0010_move_notifications_to_base'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='handyman',
+            name='rating_avg',
+            field=models.FloatField(default=0, help_text='Denormalized average rating, 0 without ratings'),
+        ),
+        migrations.AddField(
+            model_name='handyman',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized number of ratings'),
+        ),
+        migrations.AddField(
+            model_name='handyman',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0, help_text='Denormalized sum of all ratings'),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0011_handyman_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='handyman',
+            index=models.Index(fields=['verification_status', '-created_at', '-id'], name='handyman_directory_idx'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# Everything the trigger bodies insert for one handyman row `h` of user `u`
+SEARCH_ROW = "TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')), COALESCE(h.skills, ''), COALESCE(u.bio, ''), COALESCE(u.service, '')"
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE handyman_search USING fts5(
+        name, skills, bio, service,
+        tokenize = "unicode61 remove_diacritics 2"
+    )
+    """,
+    f"""
+    INSERT INTO handyman_search(rowid, name, skills, bio, service)
+    SELECT h.id, {SEARCH_ROW} FROM handyman_handyman h JOIN userauths_user u ON u.id = h.user_id
+    """,
+    f"""
+    CREATE TRIGGER handyman_search_ai AFTER INSERT ON handyman_handyman BEGIN
+        INSERT INTO handyman_search(rowid, name, skills, bio, service)
+        SELECT h.id, {SEARCH_ROW} FROM handyman_handyman h JOIN userauths_user u ON u.id = h.user_id
+        WHERE h.id = NEW.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER handyman_search_au AFTER UPDATE OF skills, user_id ON handyman_handyman BEGIN
+        DELETE FROM handyman_search WHERE rowid = OLD.id;
+        INSERT INTO handyman_search(rowid, name, skills, bio, service)
+        SELECT h.id, {SEARCH_ROW} FROM handyman_handyman h JOIN userauths_user u ON u.id = h.user_id
+        WHERE h.id = NEW.id;
+    END
+    """,
+    """
+    CREATE TRIGGER handyman_search_ad AFTER DELETE ON handyman_handyman BEGIN
+        DELETE FROM handyman_search WHERE rowid = OLD.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER handyman_search_user_au AFTER UPDATE OF first_name, last_name, bio, service ON userauths_user BEGIN
+        DELETE FROM handyman_search WHERE rowid IN (SELECT id FROM handyman_handyman WHERE user_id = NEW.id);
+        INSERT INTO handyman_search(rowid, name, skills, bio, service)
+        SELECT h.id, {SEARCH_ROW} FROM handyman_handyman h JOIN userauths_user u ON u.id = h.user_id
+        WHERE u.id = NEW.id;
+    END
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS handyman_search_user_au",
+    "DROP TRIGGER IF EXISTS handyman_search_ad",
+    "DROP TRIGGER IF EXISTS handyman_search_au",
+    "DROP TRIGGER IF EXISTS handyman_search_ai",
+    "DROP TABLE IF EXISTS handyman_search",
+]
+
+
+def run_on_sqlite(statements):
+    # FTS5 is SQLite only, other backends search with icontains
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0012_handyman_directory_idx'),
+        ('userauths', '0004_user_unread_notifications_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_sqlite(CREATE_SQL), run_on_sqlite(DROP_SQL)),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0013_handyman_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SavedSearch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('service', models.CharField(choices=[('plomberie', 'Plomberie'), ('electricite', 'Électricité'), ('menuiserie', 'Menuiserie'), ('peinture', 'Peinture'), ('maconnerie', 'Maçonnerie'), ('jardinage', 'Jardinage'), ('climatisation', 'Climatisation'), ('carrelage', 'Carrelage'), ('nettoyage', 'Nettoyage'), ('serrurerie', 'Serrurerie')], max_length=50)),
+                ('region', models.CharField(choices=[('adamawa', 'Adamawa'), ('centre', 'Centre'), ('east', 'East'), ('far_north', 'Far North'), ('littoral', 'Littoral'), ('north', 'North'), ('northwest', 'Northwest'), ('south', 'South'), ('southwest', 'Southwest'), ('west', 'West')], max_length=20)),
+                ('city', models.CharField(blank=True, choices=[('all', 'Toutes les villes'), ('douala', 'Douala'), ('yaounde', 'Yaoundé'), ('bafoussam', 'Bafoussam'), ('bamenda', 'Bamenda'), ('garoua', 'Garoua'), ('maroua', 'Maroua'), ('ngaoundere', 'Ngaoundéré'), ('bertoua', 'Bertoua'), ('ebolowa', 'Ebolowa'), ('kumba', 'Kumba')], default='', max_length=100)),
+                ('priority', models.CharField(blank=True, choices=[('low', 'Faible'), ('medium', 'Moyenne'), ('high', 'Haute'), ('urgent', 'Urgent')], default='', max_length=20)),
+                ('budget', models.CharField(blank=True, choices=[('low', 'Petit budget (< 50,000 XAF)'), ('medium', 'Budget moyen (50,000 - 200,000 XAF)'), ('high', 'Gros budget (> 200,000 XAF)'), ('negotiable', 'Budget à négocier')], default='', max_length=20)),
+                ('alert_count', models.PositiveIntegerField(default=0)),
+                ('last_alert_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('handyman', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saved_searches', to='handyman.handyman')),
+            ],
+            options={
+                'db_table': 'handyman_savedsearch',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['service', 'region', 'city', 'priority', 'budget'], name='savedsearch_match_idx')],
+                'unique_together': {('handyman', 'service', 'region', 'city', 'priority', 'budget')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# PostgreSQL only, see customer migration 0014
+INDEXES = [
+    GinIndex(OpClass(Upper('skills'), name='gin_trgm_ops'), name='handyman_skills_trgm_idx'),
+]
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    Handyman = apps.get_model('handyman', 'Handyman')
+    for index in INDEXES:
+        schema_editor.add_index(Handyman, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Handyman = apps.get_model('handyman', 'Handyman')
+    for index in INDEXES:
+        schema_editor.remove_index(Handyman, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('handyman', '0014_saved_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -1,6 +1,13 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from base.models import DenormalizedFieldsMixin
+from customer.models import PRIORITY_CHOICES
+from userauths.models import CITIES, REGION_CHOICES, SERVICE_CHOICES
+from .ratings import apply_rating
 
 # Create your models here.
 
@@ -10,28 +17,56 @@ VERIFICATION_STATUS_CHOICES = [
     ('rejected', 'Rejected'),
 ]
 
-class Handyman(models.Model):
+NOTIFICATION_DIGEST_CHOICES = [
+    ('off', 'Instantané'),
+    ('hourly', 'Résumé horaire'),
+    ('daily', 'Résumé quotidien'),
+]
+
+# Budget bands of the project browser, see handyman.saved_searches.BUDGET_FILTERS
+BUDGET_CHOICES = [
+    ('low', 'Petit budget (< 50,000 XAF)'),
+    ('medium', 'Budget moyen (50,000 - 200,000 XAF)'),
+    ('high', 'Gros budget (> 200,000 XAF)'),
+    ('negotiable', 'Budget à négocier'),
+]
+
+class Handyman(DenormalizedFieldsMixin, models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='handyman_profile')
     experience_years = models.PositiveIntegerField(default=0)
     hourly_rate = models.DecimalField(max_digits=8, decimal_places=2, help_text='Rate per hour in XAF', blank=True, null=True)
     skills = models.TextField(help_text='List your skills separated by commas', blank=True, null=True)
     availability = models.BooleanField(default=True)
+    notification_digest = models.CharField(max_length=10, choices=NOTIFICATION_DIGEST_CHOICES, default='off', help_text='Receive new projects one by one or as a periodic digest')
+    digest_sent_at = models.DateTimeField(blank=True, null=True)
     verification_status = models.CharField(max_length=20, choices=VERIFICATION_STATUS_CHOICES, default='pending')
     id_card_number = models.CharField(max_length=50, blank=True, null=True)
     id_card_image = models.ImageField(upload_to='id_cards/', blank=True, null=True)
     portfolio_images = models.TextField(blank=True, null=True, help_text='URLs of portfolio images separated by commas')
+    rating_sum = models.PositiveIntegerField(default=0, help_text='Denormalized sum of all ratings')
+    rating_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of ratings')
+    rating_avg = models.FloatField(default=0, help_text='Denormalized average rating, 0 without ratings')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Only ever changed with F() updates, see handyman.ratings
+    DENORMALIZED_FIELDS = ['rating_sum', 'rating_count', 'rating_avg']
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - Handyman"
 
     @property
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings:
-            return sum(rating.rating for rating in ratings) / len(ratings)
-        return 0
+        return self.rating_avg
+
+    @property
+    def notifications(self):
+        # Compatibility with the former per-role notification table
+        return self.user.notifications.all()
+
+    @property
+    def unread_count(self):
+        return self.user.unread_notifications_count
 
     @property
     def total_projects(self):
@@ -39,6 +74,10 @@ class Handyman(models.Model):
 
     class Meta:
         db_table = 'handyman_handyman'
+        indexes = [
+            # Keyset pagination of the artisan directory, see base.directory
+            models.Index(fields=['verification_status', '-created_at', '-id'], name='handyman_directory_idx'),
+        ]
 
 class HandymanService(models.Model):
     handyman = models.ForeignKey(Handyman, on_delete=models.CASCADE, related_name='services')
@@ -65,6 +104,22 @@ class HandymanRating(models.Model):
     def __str__(self):
         return f"{self.handyman.user.first_name} - {self.rating} stars"
 
+    def save(self, *args, **kwargs):
+        # The handyman's aggregates change in the same transaction as the rating
+        with transaction.atomic():
+            previous = None
+            if self.pk and not self._state.adding:
+                previous = (
+                    HandymanRating.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values_list('handyman_id', 'rating')
+                    .first()
+                )
+            super().save(*args, **kwargs)
+            if previous is not None:
+                apply_rating(Handyman, previous[0], -previous[1], -1)
+            apply_rating(Handyman, self.handyman_id, self.rating, 1)
+
     class Meta:
         db_table = 'handyman_handymanrating'
         unique_together = ['handyman', 'customer', 'project']
@@ -94,29 +149,6 @@ class ProjectOffer(models.Model):
         unique_together = ['handyman', 'project']
         ordering = ['-created_at']
 
-class HandymanNotification(models.Model):
-    NOTIFICATION_TYPES = [
-        ('new_project', 'New Project'),
-        ('project_update', 'Project Update'),
-        ('message', 'Message'),
-        ('offer_status', 'Offer Status'),
-    ]
-
-    handyman = models.ForeignKey(Handyman, on_delete=models.CASCADE, related_name='notifications')
-    notification_type = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
-    title = models.CharField(max_length=200)
-    message = models.TextField()
-    project = models.ForeignKey('customer.Project', on_delete=models.CASCADE, null=True, blank=True)
-    is_read = models.BooleanField(default=False)
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    def __str__(self):
-        return f"{self.handyman.user.first_name} - {self.title}"
-
-    class Meta:
-        db_table = 'handyman_notification'
-        ordering = ['-created_at']
-
 
 class HandymanPortfolioImage(models.Model):
     handyman = models.ForeignKey(Handyman, on_delete=models.CASCADE, related_name='portfolio_images_set')
@@ -131,3 +163,47 @@ class HandymanPortfolioImage(models.Model):
     class Meta:
         db_table = 'handyman_portfolio_image'
         ordering = ['uploaded_at']
+
+class SavedSearch(models.Model):
+    """
+    A project browser filter combination an artisan wants alerts for. Empty
+    city, priority and budget match any project.
+    """
+    handyman = models.ForeignKey(Handyman, on_delete=models.CASCADE, related_name='saved_searches')
+    service = models.CharField(max_length=50, choices=SERVICE_CHOICES)
+    region = models.CharField(max_length=20, choices=REGION_CHOICES)
+    city = models.CharField(max_length=100, choices=CITIES, blank=True, default='')
+    priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES, blank=True, default='')
+    budget = models.CharField(max_length=20, choices=BUDGET_CHOICES, blank=True, default='')
+    alert_count = models.PositiveIntegerField(default=0)
+    last_alert_at = models.DateTimeField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.handyman.user.first_name} - {self.label}"
+
+    @property
+    def label(self):
+        parts = [self.get_service_display(), self.get_region_display()]
+        for field in ['city', 'priority', 'budget']:
+            if getattr(self, field):
+                parts.append(getattr(self, f'get_{field}_display')())
+        return " / ".join(parts)
+
+    def get_absolute_url(self):
+        """The project browser with this search's filters"""
+        params = {
+            field: getattr(self, field)
+            for field in ['service', 'region', 'city', 'priority', 'budget']
+            if getattr(self, field)
+        }
+        return f"{reverse('handyman:projects_browse')}?{urlencode(params)}"
+
+    class Meta:
+        db_table = 'handyman_savedsearch'
+        ordering = ['-created_at']
+        unique_together = ['handyman', 'service', 'region', 'city', 'priority', 'budget']
+        indexes = [
+            # Matching a published project against every saved search, see handyman.saved_searches
+            models.Index(fields=['service', 'region', 'city', 'priority', 'budget'], name='savedsearch_match_idx'),
+        ]
@@ -0,0 +1,57 @@
+"""
+Helpers keeping the denormalized rating aggregates of ``Handyman``
+(``rating_sum``, ``rating_count`` and ``rating_avg``) in step with its
+``HandymanRating`` rows.
+
+Aggregates are only ever changed with F() expressions in the transaction that
+writes the rating, so concurrent reviews never overwrite each other. Rows that
+bypass the model (bulk_create, raw SQL) are repaired by
+``manage.py recount_ratings``.
+"""
+from django.db import models
+from django.db.models import Count, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf
+
+
+def average(rating_sum, rating_count):
+    """SQL expression for rating_sum / rating_count, 0 without ratings"""
+    return Coalesce(
+        Cast(rating_sum, FloatField()) / NullIf(rating_count, Value(0)),
+        Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def apply_rating(handyman_model, handyman_id, rating_delta, count_delta):
+    """Add a rating change to the aggregates of `handyman_id` with one UPDATE"""
+    rating_sum = F('rating_sum') + rating_delta
+    rating_count = F('rating_count') + count_delta
+    # Every expression in SET reads the pre-update values, so the average is
+    # computed from the new sum and count in the same statement
+    return handyman_model.objects.filter(id=handyman_id).update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=average(rating_sum, rating_count),
+        # Cached directory cards are keyed on updated_at, see base.fragments
+        updated_at=Now(),
+    )
+
+
+def recount(handyman_model, rating_model):
+    """Recompute every handyman's aggregates from the rating table in one UPDATE"""
+    ratings = rating_model.objects.filter(handyman=OuterRef('pk')).order_by().values('handyman')
+    rating_sum = Coalesce(
+        Subquery(ratings.annotate(total=Sum('rating')).values('total'), output_field=models.IntegerField()),
+        Value(0),
+    )
+    rating_count = Coalesce(
+        Subquery(ratings.annotate(n=Count('id')).values('n'), output_field=models.IntegerField()),
+        Value(0),
+    )
+    return handyman_model.objects.update(
+        rating_sum=rating_sum,
+        rating_count=rating_count,
+        rating_avg=average(rating_sum, rating_count),
+        # Cached directory cards are keyed on updated_at, see base.fragments
+        updated_at=Now(),
+    )
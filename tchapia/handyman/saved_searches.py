@@ -0,0 +1,119 @@
+"""
+Saved searches and their alerts.
+
+An artisan saves a project browser filter combination. When a project is
+published it is matched against every saved search at once: the project's
+own (service, region, city, priority, budget band) is looked up in the
+``savedsearch_match_idx`` index, with the empty value standing for "any",
+instead of replaying each search. Matching artisans get one alert per
+project, written with bulk_create, and the searches' alert counters are
+bumped with one UPDATE per batch.
+"""
+import logging
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from base.models import Notification
+from base.notifications import bump_unread
+from .models import SavedSearch
+
+logger = logging.getLogger(__name__)
+
+SAVED_SEARCH_BATCH_SIZE = getattr(settings, 'SAVED_SEARCH_BATCH_SIZE', 500)
+
+# Saved searches per artisan
+SAVED_SEARCH_LIMIT = getattr(settings, 'SAVED_SEARCH_LIMIT', 20)
+
+# Filter of each budget band in the project browser
+BUDGET_FILTERS = {
+    'low': Q(budget_max__lte=50000),
+    'medium': Q(budget_max__gt=50000, budget_max__lte=200000),
+    'high': Q(budget_max__gt=200000),
+    'negotiable': Q(budget_max__isnull=True, budget_min__isnull=True),
+}
+
+# Fields of a saved search, in index order
+SEARCH_FIELDS = ['service', 'region', 'city', 'priority', 'budget']
+
+
+def budget_band(project):
+    """The BUDGET_FILTERS band `project` falls in, or '' if none"""
+    if project.budget_max is None:
+        return 'negotiable' if project.budget_min is None else ''
+    if project.budget_max <= 50000:
+        return 'low'
+    if project.budget_max <= 200000:
+        return 'medium'
+    return 'high'
+
+
+def search_fields(params, user):
+    """
+    Saved search fields from browser parameters. Service and region default
+    to the artisan's own, like the browser does.
+    """
+    fields = {name: params.get(name, '') for name in SEARCH_FIELDS}
+    fields['service'] = fields['service'] or user.service or ''
+    fields['region'] = fields['region'] or user.region or ''
+    return fields
+
+
+def matching_searches(project):
+    """Saved searches of available artisans that `project` matches"""
+    return SavedSearch.objects.filter(
+        service=project.service,
+        region=project.region,
+        city__in=['', project.city or ''],
+        priority__in=['', project.priority],
+        budget__in=['', budget_band(project)],
+        handyman__availability=True,
+    )
+
+
+def build_alert(user_id, project, searches):
+    """Alert notification for `project` matching `searches` of one artisan"""
+    return Notification(
+        user_id=user_id,
+        notification_type='saved_search',
+        title=f"Recherche enregistrée: {project.name}",
+        message=f"Le projet '{project.name}' correspond à votre recherche « {searches[0].label} ». Budget: {project.budget_range}",
+        project_id=project.id,
+        payload={'saved_search_ids': [search.id for search in searches]},
+    )
+
+
+def alert_saved_searches(project, exclude_user_ids=(), batch_size=None):
+    """
+    Alert the artisans whose saved searches match `project`, except
+    `exclude_user_ids` (already notified of it). Returns the number of alerts.
+    """
+    batch_size = batch_size or SAVED_SEARCH_BATCH_SIZE
+    exclude_user_ids = set(exclude_user_ids)
+
+    searches_by_user = defaultdict(list)
+    for search in matching_searches(project).select_related('handyman__user').order_by('id'):
+        user_id = search.handyman.user_id
+        if user_id not in exclude_user_ids:
+            searches_by_user[user_id].append(search)
+
+    now = timezone.now()
+    users = list(searches_by_user.items())
+    alerts = 0
+    for start in range(0, len(users), batch_size):
+        batch = users[start:start + batch_size]
+        with transaction.atomic():
+            notifications = Notification.objects.bulk_create([
+                build_alert(user_id, project, searches) for user_id, searches in batch
+            ])
+            bump_unread([notification.user_id for notification in notifications])
+            SavedSearch.objects.filter(
+                id__in=[search.id for _, searches in batch for search in searches]
+            ).update(alert_count=F('alert_count') + 1, last_alert_at=now)
+        alerts += len(notifications)
+
+    logger.info("Project #%s matched the saved searches of %d artisan(s)", project.id, alerts)
+    return alerts
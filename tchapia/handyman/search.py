@@ -0,0 +1,157 @@
+"""
+Full-text search over artisans.
+
+On SQLite, ``handyman_search`` is an FTS5 table whose rowid is the handyman
+id. It indexes the artisan's name, skills, bio and service, and triggers on
+``handyman_handyman`` and ``userauths_user`` keep it in sync, including for
+bulk and raw writes (see migration 0013). Results are ranked with bm25,
+weighting names above skills above the bio, and paged straight from the
+search table by that rank.
+
+Other database backends fall back to ``icontains`` filters, backed on
+PostgreSQL by trigram indexes (see handyman migration 0015 and
+userauths migration 0006).
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import EmptyResultSet
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+SEARCH_TABLE = 'handyman_search'
+
+# bm25 column weights, in table column order: name, skills, bio, service
+SEARCH_WEIGHTS = (10.0, 5.0, 1.0, 3.0)
+
+# Ids of the handymen matching an FTS5 query
+SEARCH_MATCH_SQL = f"SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s"
+
+# FTS5 ranking function for the hidden ``rank`` column, set per query
+SEARCH_RANK = f"bm25({', '.join(str(weight) for weight in SEARCH_WEIGHTS)})"
+
+# One page of matches read straight from the search table, best first. The
+# match runs once and bm25 is computed inside FTS5; the join only drops rows
+# whose handyman is gone. search_page appends the filters, the keyset bound
+# and ORDER BY ... LIMIT.
+SEARCH_PAGE_SQL = (
+    f"SELECT {SEARCH_TABLE}.rowid, {SEARCH_TABLE}.rank FROM {SEARCH_TABLE} "
+    f"JOIN handyman_handyman ON handyman_handyman.id = {SEARCH_TABLE}.rowid "
+    f"WHERE {SEARCH_TABLE} MATCH %s AND {SEARCH_TABLE}.rank MATCH %s"
+)
+
+SEARCH_ORDERING = ['search_rank', 'id']
+
+# Maximum number of terms taken from a query
+SEARCH_MAX_TERMS = 8
+
+# Rows of the search table, rebuilt from scratch by rebuild_search_index
+SEARCH_SOURCE_SQL = """
+    SELECT h.id, TRIM(COALESCE(u.first_name, '') || ' ' || COALESCE(u.last_name, '')),
+           COALESCE(h.skills, ''), COALESCE(u.bio, ''), COALESCE(u.service, '')
+    FROM handyman_handyman h JOIN userauths_user u ON u.id = h.user_id
+"""
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def search_terms(q):
+    return _TERM_RE.findall(q or '')[:SEARCH_MAX_TERMS]
+
+
+def fts_query(q):
+    """
+    FTS5 query matching every term of `q` as a prefix, or '' if there is
+    nothing to search. User input never reaches the FTS5 query syntax unquoted.
+    """
+    return " ".join(f'"{term}"*' for term in search_terms(q))
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def search_handymen(queryset, q):
+    """`queryset` restricted to handymen matching `q`"""
+    if not fts_available():
+        return _search_fallback(queryset, q)
+
+    match = fts_query(q)
+    if not match:
+        return queryset.none()
+    return queryset.filter(id__in=RawSQL(SEARCH_MATCH_SQL, [match]))
+
+
+def search_page(queryset, q, after=None, limit=20):
+    """
+    Up to `limit` handymen of `queryset` matching `q`, best first, as
+    ``{'id': ..., 'search_rank': ...}`` dicts sorted by SEARCH_ORDERING
+    (lower rank is better). `after` is the ``(search_rank, id)`` key of the
+    last row of the previous page.
+
+    On SQLite the page is read from the search table ordered by its bm25
+    rank, so matches are neither matched twice nor ranked row by row through
+    the ORM. `queryset` only contributes its filters.
+    """
+    if not fts_available():
+        return _search_page_fallback(queryset, q, after, limit)
+
+    match = fts_query(q)
+    if not match:
+        return []
+    sql = SEARCH_PAGE_SQL
+    params = [match, SEARCH_RANK]
+    if queryset.query.has_filters():
+        try:
+            ids_sql, ids_params = queryset.order_by().values('id').query.sql_with_params()
+        except EmptyResultSet:
+            return []
+        sql += f" AND handyman_handyman.id IN ({ids_sql})"
+        params.extend(ids_params)
+    if after is not None:
+        rank, handyman_id = after
+        # Bounded on the rank alone first, as in base.pagination.after
+        sql += f" AND {SEARCH_TABLE}.rank >= %s AND ({SEARCH_TABLE}.rank > %s OR {SEARCH_TABLE}.rowid > %s)"
+        params.extend([rank, rank, handyman_id])
+    sql += f" ORDER BY {SEARCH_TABLE}.rank, {SEARCH_TABLE}.rowid LIMIT %s"
+    params.append(limit)
+
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [{'id': handyman_id, 'search_rank': rank} for handyman_id, rank in cursor.fetchall()]
+
+
+def _search_fallback(queryset, q):
+    terms = search_terms(q)
+    if not terms:
+        return queryset.none()
+    for term in terms:
+        # User columns in a subquery of their own, which PostgreSQL answers
+        # from the trigram indexes of userauths migration 0006
+        users = get_user_model().objects.filter(
+            Q(first_name__icontains=term)
+            | Q(last_name__icontains=term)
+            | Q(bio__icontains=term)
+            | Q(service__icontains=term)
+        )
+        queryset = queryset.filter(Q(skills__icontains=term) | Q(user__in=users.values('pk')))
+    return queryset
+
+
+def _search_page_fallback(queryset, q, after, limit):
+    # Without bm25 every match ranks the same, ordering falls back to id
+    queryset = _search_fallback(queryset, q).order_by('id')
+    if after is not None:
+        queryset = queryset.filter(id__gt=after[1])
+    return [{'id': handyman_id, 'search_rank': 0.0} for handyman_id in queryset.values_list('id', flat=True)[:limit]]
+
+
+def rebuild_search_index():
+    """Repopulate the search table from the handyman and user tables"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}(rowid, name, skills, bio, service) {SEARCH_SOURCE_SQL}")
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f"SELECT COUNT(*) FROM {SEARCH_TABLE}")
+        return cursor.fetchone()[0]
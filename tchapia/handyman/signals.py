@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, pre_delete
+from django.dispatch import receiver
+
+from base.models import Notification
+from base.notifications import forget_unread
+from .models import Handyman, HandymanRating, ProjectOffer
+from .ratings import apply_rating
+
+
+@receiver(pre_delete, sender=ProjectOffer)
+def forget_offer_notifications(sender, instance, **kwargs):
+    # Notifications about this offer are removed by the cascade
+    forget_unread(Notification.objects.filter(offer=instance))
+
+
+@receiver(post_delete, sender=HandymanRating)
+def forget_rating(sender, instance, **kwargs):
+    # Deletions run inside the collector's transaction
+    apply_rating(Handyman, instance.handyman_id, -instance.rating, -1)
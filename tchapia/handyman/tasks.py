@@ -0,0 +1,20 @@
+from base.jobs import task
+from base.models import Notification
+from customer.models import Customer
+
+
+@task
+def notify_customer(customer_id, notification_type, title, message, project_id=None, offer_id=None):
+    """Create a customer notification"""
+    user_id = Customer.objects.filter(id=customer_id).values_list('user_id', flat=True).first()
+    if user_id is None:
+        # Customer was deleted before the job ran
+        return
+    Notification.objects.create(
+        user_id=user_id,
+        notification_type=notification_type,
+        title=title,
+        message=message,
+        project_id=project_id,
+        offer_id=offer_id
+    )
@@ -1,3 +1,518 @@
+import io
+import unittest
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.utils import timezone
+from django.utils.html import escape
+
+from base import matching
+from base.models import Notification
+from customer.models import Customer, Project
+from customer.tasks import notify_saved_searches
+from userauths.models import User
+
+from .digest import send_digests
+from .models import Handyman, HandymanRating, SavedSearch
+from .ratings import recount
+from .saved_searches import alert_saved_searches, budget_band, matching_searches
+from .search import SEARCH_TABLE, rebuild_search_index, search_handymen, search_page
+
+
+class SavedSearchAlertTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        matching.reset_index()
+        self.addCleanup(matching.reset_index)
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.handyman = Handyman.objects.create(user=self.artisan, notification_digest='daily')
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+
+    def project(self, **fields):
+        values = {
+            'name': 'Tableau électrique', 'description': 'Remplacer le tableau', 'service': 'electricite',
+            'region': 'centre', 'city': 'yaounde', 'status': 'published', 'priority': 'urgent',
+            'budget_min': 0, 'budget_max': 0, 'location_address': 'Bastos',
+        }
+        values.update(fields)
+        return Project.objects.create(customer=self.customer, **values)
+
+    def save_search(self, **fields):
+        values = {'service': 'electricite', 'region': 'centre'}
+        values.update(fields)
+        return SavedSearch.objects.create(handyman=self.handyman, **values)
+
+    def test_budget_bands_follow_the_browser(self):
+        self.assertEqual(budget_band(Project(budget_max=0)), 'low')
+        self.assertEqual(budget_band(Project(budget_max=120000)), 'medium')
+        self.assertEqual(budget_band(Project(budget_max=500000)), 'high')
+        self.assertEqual(budget_band(Project()), 'negotiable')
+        self.assertEqual(budget_band(Project(budget_min=1000)), '')
+
+    def test_matching_project_alerts_once_per_artisan(self):
+        broad = self.save_search()
+        narrow = self.save_search(city='yaounde', priority='urgent', budget='low')
+        self.save_search(priority='low')
+        self.save_search(region='littoral')
+
+        project = self.project()
+        self.assertEqual(alert_saved_searches(project), 1)
+
+        alert = Notification.objects.get(user=self.artisan)
+        self.assertEqual(alert.notification_type, 'saved_search')
+        self.assertEqual(alert.project, project)
+        self.assertEqual(alert.payload, {'saved_search_ids': [broad.id, narrow.id]})
+        self.assertEqual(
+            list(SavedSearch.objects.filter(alert_count=1).order_by('id')),
+            [broad, narrow],
+        )
+        self.artisan.refresh_from_db()
+        self.assertEqual(self.artisan.unread_notifications_count, 1)
+
+    def test_no_alert_without_a_match(self):
+        self.save_search(city='douala')
+        self.save_search(budget='high')
+        self.assertEqual(alert_saved_searches(self.project()), 0)
+        self.assertFalse(Notification.objects.exists())
+
+    def test_unavailable_and_excluded_artisans_are_skipped(self):
+        self.save_search()
+        project = self.project()
+        self.assertEqual(alert_saved_searches(project, exclude_user_ids=[self.artisan.id]), 0)
+        self.handyman.availability = False
+        self.handyman.save()
+        self.assertEqual(alert_saved_searches(project), 0)
+
+    def test_task_skips_artisans_notified_of_the_project(self):
+        self.save_search(service='plomberie', region='littoral')
+        project = self.project(service='plomberie', region='littoral')
+        # Instant notifications already cover this project
+        self.handyman.notification_digest = 'off'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.handyman.save()
+        self.assertEqual(notify_saved_searches(project_id=project.id, service='plomberie'), 0)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+    def test_matching_uses_the_index(self):
+        sql, params = matching_searches(self.project()).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(any('savedsearch_match_idx' in detail for detail in plan), plan)
+        self.assertFalse([detail for detail in plan if detail.startswith('SCAN handyman_savedsearch')], plan)
+
+
+class SaveSearchViewTests(TestCase):
+    def setUp(self):
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.client.force_login(self.artisan)
+
+    def test_saves_the_current_filters_once(self):
+        data = {'service': '', 'region': '', 'city': 'douala', 'priority': 'urgent', 'budget': ''}
+        response = self.client.post('/handyman/searches/save/', data)
+        search = SavedSearch.objects.get()
+        self.assertRedirects(response, search.get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(
+            (search.service, search.region, search.city, search.priority, search.budget),
+            ('plomberie', 'littoral', 'douala', 'urgent', ''),
+        )
+        self.client.post('/handyman/searches/save/', data)
+        self.assertEqual(SavedSearch.objects.count(), 1)
+
+    def test_rejects_unknown_values(self):
+        self.client.post('/handyman/searches/save/', {'budget': 'gratuit'})
+        self.assertFalse(SavedSearch.objects.exists())
+
+    def test_browser_lists_saved_searches(self):
+        self.client.post('/handyman/searches/save/', {'priority': 'high'})
+        response = self.client.get('/handyman/projects/')
+        self.assertContains(response, escape(SavedSearch.objects.get().get_absolute_url()))
+
+
+class ProjectDetailConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        self.customer_user = User.objects.create_user(
+            username='client', email='client@example.com', password='secret', first_name='Aline', user_type='client',
+        )
+        self.project = Project.objects.create(
+            customer=Customer.objects.create(user=self.customer_user), name='Fuite', description='Fuite',
+            service='plomberie', region='littoral', status='published', location_address='Akwa',
+        )
+        self.url = f'/handyman/project/{self.project.id}/'
+        self.client.force_login(self.artisan)
+
+    def test_unchanged_project_returns_304(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_customer_changes_are_seen(self):
+        etag = self.client.get(self.url)['ETag']
+        self.customer_user.first_name = 'Carine'
+        self.customer_user.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Carine')
+
+    def test_projects_outside_the_artisans_area_still_redirect(self):
+        self.project.region = 'centre'
+        self.project.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH='"x"').status_code, 302)
+
+
+class NotificationInboxTests(TestCase):
+    url = '/handyman/notifications/'
+
+    def setUp(self):
+        cache.clear()
+        self.artisan = User.objects.create_user(
+            username='artisan', email='artisan@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        )
+        Handyman.objects.create(user=self.artisan)
+        self.client.force_login(self.artisan)
+
+    def notify(self, count, **fields):
+        for i in range(count):
+            Notification.objects.create(
+                user=self.artisan, notification_type='message', title=f"Message {i}", **fields,
+            )
+
+    def unread(self):
+        self.artisan.refresh_from_db()
+        return self.artisan.unread_notifications_count
+
+    def pages(self, **params):
+        ids, cursor = [], None
+        while True:
+            response = self.client.get(self.url, dict(params, cursor=cursor) if cursor else params)
+            ids.append([notification.id for notification in response.context['notifications']])
+            cursor = response.context['next_cursor']
+            if cursor is None:
+                return ids
+
+    def test_cursor_walks_every_notification_once(self):
+        self.notify(45)
+        newest_first = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        # A tie on created_at across a page boundary is broken by the id
+        Notification.objects.filter(id__in=newest_first[10:30]).update(created_at=timezone.now())
+        newest_first = list(Notification.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+        pages = self.pages()
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), newest_first)
+
+    def test_unread_filter(self):
+        self.notify(3)
+        self.notify(2, is_read=True)
+        self.assertEqual(len(sum(self.pages(unread='1'), [])), 3)
+
+    def test_invalid_cursor_restarts_from_the_first_page(self):
+        self.notify(25)
+        first = self.client.get(self.url).context['notifications']
+        response = self.client.get(self.url, {'cursor': 'pas-un-curseur!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context['notifications']), list(first))
+
+    def test_opening_marks_read_once(self):
+        self.notify(2)
+        notification = Notification.objects.first()
+        self.client.get(f'{self.url}{notification.id}/')
+        self.client.get(f'{self.url}{notification.id}/')
+        notification.refresh_from_db()
+        self.assertTrue(notification.is_read)
+        self.assertEqual(self.unread(), 1)
+
+    def test_mark_all_read(self):
+        self.notify(3)
+        # Only on POST
+        self.client.get(f'{self.url}mark-all-read/')
+        self.assertEqual(self.unread(), 3)
+        self.client.post(f'{self.url}mark-all-read/')
+        self.assertEqual(self.unread(), 0)
+        self.assertFalse(Notification.objects.filter(is_read=False).exists())
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "EXPLAIN QUERY PLAN output is SQLite specific")
+    def test_later_pages_seek_the_index(self):
+        self.notify(25)
+        cursor = self.client.get(self.url).context['next_cursor']
+        queries = []
+
+        def record(execute, sql, params, many, context):
+            queries.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            self.client.get(self.url, {'cursor': cursor})
+        # With the values bound as parameters, as in production
+        sql, params = next((sql, params) for sql, params in queries if '"base_notification"."id" <' in sql)
+        with connection.cursor() as explain:
+            explain.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            plan = [row[-1] for row in explain.fetchall()]
+        self.assertTrue(any('user_id=? AND created_at<?' in detail for detail in plan), plan)
+
+
+class DigestTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+
+    def artisan(self, name, digest='daily', region='littoral', **fields):
+        user = User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='secret',
+            user_type='artisan', service='plomberie', region=region,
+        )
+        return Handyman.objects.create(user=user, notification_digest=digest, **fields)
+
+    def project(self, name, hours_ago, **fields):
+        values = {'service': 'plomberie', 'region': 'littoral', 'status': 'published'}
+        values.update(fields)
+        project = Project.objects.create(
+            customer=self.customer, name=name, description=name, location_address='Akwa', **values,
+        )
+        Project.objects.filter(id=project.id).update(created_at=self.now - timedelta(hours=hours_ago))
+        return project
+
+    def test_due_subscribers_get_one_digest_of_new_projects(self):
+        handyman = self.artisan('daily')
+        self.artisan('instant', digest='off')
+        self.artisan('away', availability=False)
+        newest = self.project('Fuite', hours_ago=1)
+        older = self.project('Robinet', hours_ago=5)
+        self.project('Brouillon', hours_ago=1, status='draft')
+        self.project('Yaoundé', hours_ago=1, region='centre')
+        self.project('Ancien', hours_ago=30)
+
+        result = send_digests(now=self.now)
+
+        self.assertEqual((result.subscribers, result.digests, result.projects), (1, 1, 2))
+        digest = Notification.objects.get()
+        self.assertEqual(digest.user_id, handyman.user_id)
+        self.assertEqual(digest.payload, {'project_ids': [newest.id, older.id]})
+        self.assertIsNone(digest.project_id)
+        self.assertEqual(digest.message, "Nouveaux projets dans votre région: 'Fuite', 'Robinet'.")
+        handyman.refresh_from_db()
+        handyman.user.refresh_from_db()
+        self.assertEqual(handyman.digest_sent_at, self.now)
+        self.assertEqual(handyman.user.unread_notifications_count, 1)
+
+    def test_digests_wait_for_their_interval(self):
+        hourly = self.artisan('hourly', digest='hourly', digest_sent_at=self.now - timedelta(minutes=30))
+        daily = self.artisan('daily', digest_sent_at=self.now - timedelta(hours=2))
+        self.project('Fuite', hours_ago=0.1)
+        self.assertEqual(send_digests(now=self.now).subscribers, 0)
+
+        later = self.now + timedelta(minutes=31)
+        self.assertEqual(send_digests(now=later).digests, 1)
+        self.assertEqual(Notification.objects.get().user_id, hourly.user_id)
+        daily.refresh_from_db()
+        self.assertEqual(daily.digest_sent_at, self.now - timedelta(hours=2))
+
+    def test_projects_are_only_sent_once(self):
+        handyman = self.artisan('hourly', digest='hourly')
+        project = self.project('Fuite', hours_ago=0.5)
+        self.assertEqual(send_digests(now=self.now).digests, 1)
+        self.assertEqual(Notification.objects.get().project_id, project.id)
+
+        # Nothing new: the window still moves forward
+        later = self.now + timedelta(hours=1)
+        result = send_digests(now=later)
+        self.assertEqual((result.subscribers, result.digests), (1, 0))
+        handyman.refresh_from_db()
+        self.assertEqual(handyman.digest_sent_at, later)
+
+    def test_long_digests_are_summarized(self):
+        self.artisan('daily')
+        for i in range(7):
+            self.project(f"Projet {i}", hours_ago=i + 1)
+        send_digests(now=self.now)
+        digest = Notification.objects.get()
+        self.assertEqual(digest.title, "Résumé: 7 nouveau(x) projet(s)")
+        self.assertTrue(digest.message.endswith("'Projet 4' et 2 autre(s)."), digest.message)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.handyman = self.artisan('artisan')
+        self.customer = Customer.objects.create(user=User.objects.create_user(
+            username='client', email='client@example.com', password='secret', user_type='client',
+        ))
+
+    def artisan(self, name):
+        return Handyman.objects.create(user=User.objects.create_user(
+            username=name, email=f'{name}@example.com', password='secret',
+            user_type='artisan', service='plomberie', region='littoral',
+        ))
+
+    def rate(self, rating, handyman=None):
+        project = Project.objects.create(
+            customer=self.customer, name='Fuite', description='Fuite', service='plomberie',
+            region='littoral', status='completed', location_address='Akwa',
+        )
+        return HandymanRating.objects.create(
+            handyman=handyman or self.handyman, customer=self.customer, project=project, rating=rating,
+        )
+
+    def aggregates(self, handyman=None):
+        handyman = handyman or self.handyman
+        handyman.refresh_from_db()
+        return handyman.rating_sum, handyman.rating_count, handyman.rating_avg
+
+    def test_new_ratings_are_added(self):
+        self.assertEqual(self.aggregates(), (0, 0, 0.0))
+        self.rate(4)
+        self.rate(1)
+        self.assertEqual(self.aggregates(), (5, 2, 2.5))
+
+    def test_edited_ratings_replace_their_old_value(self):
+        other = self.artisan('other')
+        rating = self.rate(2)
+        self.rate(4)
+        rating.rating = 5
+        rating.save()
+        self.assertEqual(self.aggregates(), (9, 2, 4.5))
+
+        rating.handyman = other
+        rating.save()
+        self.assertEqual(self.aggregates(), (4, 1, 4.0))
+        self.assertEqual(self.aggregates(other), (5, 1, 5.0))
+
+    def test_deleted_ratings_are_removed(self):
+        first, second = self.rate(3), self.rate(5)
+        first.delete()
+        self.assertEqual(self.aggregates(), (5, 1, 5.0))
+        second.delete()
+        self.assertEqual(self.aggregates(), (0, 0, 0.0))
+
+    def test_profile_saves_keep_the_aggregates(self):
+        stale = Handyman.objects.get(id=self.handyman.id)
+        self.rate(4)
+        stale.skills = 'Plomberie, soudure'
+        stale.save()
+        self.assertEqual(self.aggregates(), (4, 1, 4.0))
+        self.assertEqual(self.handyman.skills, 'Plomberie, soudure')
+
+    def test_recount_repairs_drift(self):
+        self.rate(4)
+        other = self.artisan('other')
+        Handyman.objects.filter(id=self.handyman.id).update(rating_sum=40, rating_count=3, rating_avg=1.0)
+        # Written without the model's save()
+        HandymanRating.objects.bulk_create([
+            HandymanRating(handyman=other, customer=self.customer, project=Project.objects.get(), rating=2),
+        ])
+
+        self.assertEqual(recount(Handyman, HandymanRating), 2)
+        self.assertEqual(self.aggregates(), (4, 1, 4.0))
+        self.assertEqual(self.aggregates(other), (2, 1, 2.0))
+
+        out = io.StringIO()
+        call_command('recount_ratings', stdout=out)
+        self.assertIn("for 2 handymen", out.getvalue())
+
+
+class HandymanSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plumber = self.artisan('plombier', 'Jean', 'Mbarga', skills='Fuite, chauffe-eau', bio='Artisan à Douala')
+        self.electrician = self.artisan(
+            'electricien', 'Paul', 'Ewane', skills='Tableau électrique', bio='Répare aussi les fuites', service='electricite',
+        )
+
+    def artisan(self, username, first_name, last_name, skills='', bio='', service='plomberie'):
+        return Handyman.objects.create(user=User.objects.create_user(
+            username=username, email=f'{username}@example.com', password='secret', user_type='artisan',
+            first_name=first_name, last_name=last_name, bio=bio, service=service, region='littoral',
+        ), skills=skills)
+
+    def found(self, q):
+        return set(search_handymen(Handyman.objects.all(), q).values_list('id', flat=True))
+
+    def test_every_term_must_match_as_a_prefix(self):
+        self.assertEqual(self.found('fuite'), {self.plumber.id, self.electrician.id})
+        self.assertEqual(self.found('fuite chauffe'), {self.plumber.id})
+        self.assertEqual(self.found('Mbar'), {self.plumber.id})
+        self.assertEqual(self.found('fuite maçonnerie'), set())
+        self.assertEqual(self.found('"*) OR ('), set())
+
+    def test_edits_are_searchable(self):
+        self.plumber.skills = 'Soudure'
+        self.plumber.save()
+        self.assertEqual(self.found('soudure'), {self.plumber.id})
+        self.assertEqual(self.found('chauffe'), set())
+
+        # Raw updates of the user row too
+        User.objects.filter(id=self.electrician.user_id).update(last_name='Kamga', bio='Câblage')
+        self.assertEqual(self.found('Kamga'), {self.electrician.id})
+        self.assertEqual(self.found('Ewane'), set())
+        self.assertEqual(self.found('fuite'), set())
+
+        self.electrician.delete()
+        self.assertEqual(self.found('Kamga'), set())
+
+    def test_bulk_created_handymen_are_searchable(self):
+        user = User.objects.create_user(
+            username='macon', email='macon@example.com', password='secret', user_type='artisan', last_name='Fouda',
+        )
+        [handyman] = Handyman.objects.bulk_create([Handyman(user=user, skills='Maçonnerie')])
+        self.assertEqual(self.found('maçonnerie Fouda'), {handyman.id})
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "FTS5 index is SQLite specific")
+    def test_triggers_keep_the_index_equal_to_a_rebuild(self):
+        self.plumber.skills = 'Soudure'
+        self.plumber.save()
+        User.objects.filter(id=self.electrician.user_id).update(first_name='Brice')
+        self.artisan('macon', 'Hervé', 'Fouda', skills='Dalle')
+        self.electrician.delete()
+
+        def rows():
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT rowid, name, skills, bio, service FROM {SEARCH_TABLE} ORDER BY rowid")
+                return cursor.fetchall()
+
+        maintained = rows()
+        rebuild_search_index()
+        self.assertEqual(maintained, rows())
+        self.assertEqual(len(maintained), 2)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "bm25 ranking and diacritics folding need FTS5")
+    def test_names_rank_above_skills_above_bio(self):
+        mbarga = self.artisan('homonyme', 'Fuite', 'Mbarga')
+        ranked = search_page(Handyman.objects.all(), 'fuite')
+        self.assertEqual([row['id'] for row in ranked], [mbarga.id, self.plumber.id, self.electrician.id])
+        self.assertEqual(self.found('electrique'), {self.electrician.id})
+
+    def test_directory_search(self):
+        response = self.client.get('/handymen_list/', {'q': 'chauffe-eau'})
+        self.assertEqual([handyman.id for handyman in response.context['handymen']], [self.plumber.id])
+        self.assertEqual(response.context['current_q'], 'chauffe-eau')
+
+        response = self.client.get('/handymen_list/', {'q': 'fuite', 'service': 'electricite'})
+        self.assertEqual([handyman.id for handyman in response.context['handymen']], [self.electrician.id])
 
-# Create your tests here.
+    def test_directory_search_pages_with_the_cursor(self):
+        for i in range(3):
+            self.artisan(f'fuite{i}', 'Jean', f'Nkoulou{i}', skills='Fuite')
+        expected = [row['id'] for row in search_page(Handyman.objects.all(), 'fuite')]
+        ids, url = [], '/api/handymen/?q=fuite&limit=2&count=1'
+        while url:
+            data = self.client.get(url).json()
+            ids += [row['id'] for row in data['results']]
+            url = data['next_url']
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(ids), 5)
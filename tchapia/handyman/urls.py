@@ -6,8 +6,13 @@ app_name = 'handyman'
 urlpatterns = [
     path('dashboard/', views.projects_view, name='projects'),  # Rename to dashboard
     path('projects/', views.projects_browse_view, name='projects_browse'),  # New projects browser
+    path('searches/save/', views.save_search_view, name='save_search'),
+    path('searches/<int:search_id>/delete/', views.delete_search_view, name='delete_search'),
     path('project/<int:project_id>/', views.project_detail_view, name='project_detail'),
     path('project/<int:project_id>/offer/', views.submit_offer_view, name='submit_offer'),
     path('project/<int:project_id>/offer/edit/', views.edit_offer_view, name='edit_offer'),
     path('profile/edit/', views.profile_edit_view, name='profile_edit'),
+    path('notifications/', views.notifications_view, name='notifications'),
+    path('notifications/<int:notification_id>/', views.notification_open_view, name='notification_open'),
+    path('notifications/mark-all-read/', views.notifications_mark_all_read_view, name='notifications_mark_all_read'),
 ]
\ No newline at end of file
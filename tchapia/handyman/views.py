@@ -1,24 +1,41 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db import transaction
-from customer.models import Project, CustomerNotification
-from .models import Handyman, ProjectOffer, HandymanPortfolioImage
+from django.core.exceptions import ValidationError
+from django.db.models import OuterRef, prefetch_related_objects
+from django.utils.timesince import timesince
+from customer.models import Project
+from customer.search import search_projects
+from base.conditional import changes, conditional_page
+from base.fragments import render_cards
+from base.matching import get_index
+from base.models import Notification
+from base.notifications import mark_all_read
+from base.pagination import keyset_page
+from base.replica import read_only_view
+from base.sqlite import write_transaction
+from .models import BUDGET_CHOICES, Handyman, ProjectOffer, HandymanPortfolioImage, SavedSearch
+from .saved_searches import BUDGET_FILTERS, SAVED_SEARCH_LIMIT, search_fields
 from .forms import HandymanProfileForm, UserProfileForm, ProjectOfferForm
+from . import tasks
+
+NOTIFICATIONS_PAGE_SIZE = 20
+NOTIFICATION_ORDERING = ['-created_at', '-id']
 
 
 def create_customer_notification(customer, notification_type, title, message, project=None, offer=None):
-    """Helper function to create customer notifications"""
-    CustomerNotification.objects.create(
-        customer=customer,
+    """Helper function to queue customer notifications"""
+    tasks.notify_customer.enqueue(
+        customer_id=customer.id,
         notification_type=notification_type,
         title=title,
         message=message,
-        project=project,
-        offer=offer
+        project_id=project.id if project else None,
+        offer_id=offer.id if offer else None
     )
 
 
+@read_only_view
 @login_required
 def projects_view(request):
     # Ensure user is a handyman
@@ -37,9 +54,10 @@ def projects_view(request):
     ).order_by('-created_at')
 
     # Get project count by status
-    total_projects = projects.count()
-    published_projects = projects.filter(status='published').count()
-    in_progress_projects = projects.filter(status='in_progress').count()
+    counts = get_index().project_counts(request.user.service, request.user.region)
+    total_projects = sum(counts.values())
+    published_projects = counts['published']
+    in_progress_projects = counts['in_progress']
 
     context = {
         'handyman': handyman,
@@ -50,6 +68,7 @@ def projects_view(request):
     }
     return render(request, 'handyman/projects.html', context)
 
+@read_only_view
 @login_required
 def projects_browse_view(request):
     # Ensure user is a handyman
@@ -67,11 +86,12 @@ def projects_browse_view(request):
     status_filter = request.GET.get('status', '')
     priority_filter = request.GET.get('priority', '')
     budget_filter = request.GET.get('budget', '')
+    search_query = request.GET.get('q', '').strip()
 
     # Start with base queryset - all published and in_progress projects
     projects = Project.objects.filter(
         status__in=['published', 'in_progress']
-    ).select_related('customer__user').prefetch_related('project_images')
+    )
 
     # Apply filters
     if service_filter:
@@ -95,29 +115,29 @@ def projects_browse_view(request):
     if priority_filter:
         projects = projects.filter(priority=priority_filter)
 
-    if budget_filter:
-        if budget_filter == 'low':
-            projects = projects.filter(budget_max__lte=50000)
-        elif budget_filter == 'medium':
-            projects = projects.filter(budget_max__gt=50000, budget_max__lte=200000)
-        elif budget_filter == 'high':
-            projects = projects.filter(budget_max__gt=200000)
-        elif budget_filter == 'negotiable':
-            projects = projects.filter(budget_max__isnull=True, budget_min__isnull=True)
+    if budget_filter in BUDGET_FILTERS:
+        projects = projects.filter(BUDGET_FILTERS[budget_filter])
 
-    # Order by priority (urgent first) then by creation date
-    projects = projects.order_by('-priority', '-created_at')
-
-    # Get project count by status for all projects in handyman's service/region
-    base_projects = Project.objects.filter(
-        service=request.user.service,
-        region=request.user.region,
-        status__in=['published', 'in_progress']
+    if search_query:
+        # Best matches first, combined with the filters above
+        projects = search_projects(projects, search_query).order_by('search_rank', '-created_at')
+    else:
+        # Order by priority (urgent first) then by creation date
+        projects = projects.order_by('-priority_rank', '-created_at')
+
+    # Cached cards; customers and images are only loaded for cards rendered anew
+    cards = render_cards(
+        'partials/project_card.html', 'project', projects,
+        # "Publié il y a ..." moves on without the project being saved
+        extra=lambda project: timesince(project.created_at),
+        prepare=lambda missing: prefetch_related_objects(missing, 'customer__user', 'project_images'),
     )
 
-    total_projects = base_projects.count()
-    published_projects = base_projects.filter(status='published').count()
-    in_progress_projects = base_projects.filter(status='in_progress').count()
+    # Get project count by status for all projects in handyman's service/region
+    counts = get_index().project_counts(request.user.service, request.user.region)
+    total_projects = sum(counts.values())
+    published_projects = counts['published']
+    in_progress_projects = counts['in_progress']
 
     # Import choices for filters
     from userauths.models import SERVICE_CHOICES, REGION_CHOICES, CITIES
@@ -126,6 +146,7 @@ def projects_browse_view(request):
     context = {
         'handyman': handyman,
         'projects': projects,
+        'cards': cards,
         'total_projects': total_projects,
         'published_projects': published_projects,
         'in_progress_projects': in_progress_projects,
@@ -135,12 +156,8 @@ def projects_browse_view(request):
         'cities': CITIES,
         'priority_choices': PRIORITY_CHOICES,
         'status_choices': [('published', 'Publié'), ('in_progress', 'En cours')],
-        'budget_choices': [
-            ('low', 'Petit budget (< 50,000 XAF)'),
-            ('medium', 'Budget moyen (50,000 - 200,000 XAF)'),
-            ('high', 'Gros budget (> 200,000 XAF)'),
-            ('negotiable', 'Budget à négocier'),
-        ],
+        'budget_choices': BUDGET_CHOICES,
+        'saved_searches': handyman.saved_searches.all(),
         # Current filter values
         'current_service': service_filter,
         'current_region': region_filter,
@@ -148,6 +165,7 @@ def projects_browse_view(request):
         'current_status': status_filter,
         'current_priority': priority_filter,
         'current_budget': budget_filter,
+        'current_q': search_query,
     }
     return render(request, 'handyman/projects_browse.html', context)
 
@@ -167,7 +185,7 @@ def profile_edit_view(request):
 
         if user_form.is_valid() and handyman_form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     user_form.save()
                     handyman_form.save()
 
@@ -200,7 +218,19 @@ def profile_edit_view(request):
     return render(request, 'handyman/profile_edit.html', context)
 
 
+def project_detail_changes(request, project_id):
+    if request.user.user_type != 'artisan':
+        return Project.objects.none()
+    return Project.objects.filter(id=project_id, service=request.user.service, region=request.user.region).annotate(
+        **changes('offers', ProjectOffer.objects.filter(project=OuterRef('pk')), 'updated_at'),
+        # The customer's box: their name and photo (touched through their
+        # projects, see base.signals) and project counts
+        **changes('customer_projects', Project.objects.filter(customer=OuterRef('customer')), 'updated_at'),
+    )
+
+
 @login_required
+@conditional_page('handyman/project_detail.html', project_detail_changes)
 def project_detail_view(request, project_id):
     # Ensure user is a handyman
     if request.user.user_type != 'artisan':
@@ -269,7 +299,7 @@ def submit_offer_view(request, project_id):
         form = ProjectOfferForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     offer = form.save(commit=False)
                     offer.handyman = handyman
                     offer.project = project
@@ -331,7 +361,7 @@ def edit_offer_view(request, project_id):
         form = ProjectOfferForm(request.POST, instance=offer)
         if form.is_valid():
             try:
-                with transaction.atomic():
+                with write_transaction():
                     updated_offer = form.save()
 
                     # Create notification for customer about offer update
@@ -360,3 +390,99 @@ def edit_offer_view(request, project_id):
     }
 
     return render(request, 'handyman/submit_offer.html', context)
+
+
+@login_required
+def notifications_view(request):
+    # Ensure user is a handyman
+    if request.user.user_type != 'artisan':
+        messages.error(request, "Accès non autorisé. Cette page est réservée aux artisans.")
+        return redirect('base:home')
+
+    handyman, created = Handyman.objects.get_or_create(user=request.user)
+
+    # Newest first, paged with a (created_at, id) cursor instead of OFFSET
+    notifications = handyman.notifications.all()
+    unread_only = request.GET.get('unread') == '1'
+    if unread_only:
+        notifications = notifications.filter(is_read=False)
+
+    page, next_cursor = keyset_page(
+        notifications,
+        NOTIFICATION_ORDERING,
+        cursor=request.GET.get('cursor'),
+        page_size=NOTIFICATIONS_PAGE_SIZE,
+    )
+
+    context = {
+        'handyman': handyman,
+        'notifications': page,
+        'next_cursor': next_cursor,
+        'unread_only': unread_only,
+        'unread_count': handyman.unread_count,
+        'open_url_name': 'handyman:notification_open',
+        'mark_all_read_url_name': 'handyman:notifications_mark_all_read',
+        'inbox_url_name': 'handyman:notifications',
+    }
+    return render(request, 'handyman/notifications.html', context)
+
+
+@login_required
+def notification_open_view(request, notification_id):
+    notification = get_object_or_404(Notification, id=notification_id, user=request.user)
+
+    # Mark on click
+    if not notification.is_read:
+        Notification.objects.filter(id=notification.id).mark_read()
+
+    if notification.project_id:
+        return redirect('handyman:project_detail', project_id=notification.project_id)
+    return redirect('handyman:notifications')
+
+
+@login_required
+def notifications_mark_all_read_view(request):
+    if request.method == 'POST':
+        updated = mark_all_read(request.user)
+        messages.success(request, f"{updated} notification(s) marquée(s) comme lue(s).")
+
+    return redirect('handyman:notifications')
+
+
+@login_required
+def save_search_view(request):
+    """Save the project browser's current filters for alerts"""
+    if request.user.user_type != 'artisan':
+        messages.error(request, "Accès non autorisé. Cette page est réservée aux artisans.")
+        return redirect('base:home')
+
+    if request.method != 'POST':
+        return redirect('handyman:projects_browse')
+
+    handyman, created = Handyman.objects.get_or_create(user=request.user)
+    fields = search_fields(request.POST, request.user)
+    search = SavedSearch(handyman=handyman, **fields)
+
+    try:
+        search.full_clean(exclude=['handyman'], validate_unique=False)
+    except ValidationError:
+        messages.error(request, "Cette recherche ne peut pas être enregistrée.")
+        return redirect('handyman:projects_browse')
+
+    if handyman.saved_searches.filter(**fields).exists():
+        messages.info(request, "Cette recherche est déjà enregistrée.")
+    elif handyman.saved_searches.count() >= SAVED_SEARCH_LIMIT:
+        messages.error(request, f"Vous ne pouvez pas enregistrer plus de {SAVED_SEARCH_LIMIT} recherches.")
+    else:
+        search.save()
+        messages.success(request, f"Recherche enregistrée: {search.label}. Vous serez alerté des nouveaux projets correspondants.")
+    return redirect(search.get_absolute_url())
+
+
+@login_required
+def delete_search_view(request, search_id):
+    search = get_object_or_404(SavedSearch, id=search_id, handyman__user=request.user)
+    if request.method == 'POST':
+        search.delete()
+        messages.success(request, "Recherche supprimée.")
+    return redirect('handyman:projects_browse')
@@ -0,0 +1,17 @@
+#!/bin/bash
+# Container entry point: the ASGI server and the background job workers
+# (manage.py run_workers, see base/jobs.py) side by side. When either exits
+# the other is stopped too, so the container exits and gets restarted.
+cd "$(dirname "$0")"
+
+python manage.py run_workers --concurrency "${JOB_WORKERS:-2}" &
+workers=$!
+uvicorn tchapia.asgi:application --host 0.0.0.0 --port 8000 &
+server=$!
+
+trap 'kill -TERM "$workers" "$server" 2>/dev/null' TERM INT
+wait -n "$workers" "$server"
+status=$?
+kill -TERM "$workers" "$server" 2>/dev/null
+wait
+exit "$status"
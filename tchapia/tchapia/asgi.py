@@ -3,14 +3,27 @@ ASGI config for tchapia project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server so that the live notification stream
+(``/notifications/stream/``) costs a coroutine rather than a thread per open
+connection:
+
+    uvicorn tchapia.asgi:application
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tchapia.settings')
 
 application = get_asgi_application()
+
+# runserver serves static files itself, an ASGI server does not
+if settings.DEBUG:
+    from django.contrib.staticfiles.handlers import ASGIStaticFilesHandler
+
+    application = ASGIStaticFilesHandler(application)
@@ -12,7 +12,13 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 from django.contrib.messages import constants as messages 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
+
+from tchapia.databases import databases_from_environment
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -55,6 +61,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "base.replica.ReplicaMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -83,10 +90,53 @@ WSGI_APPLICATION = "tchapia.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_URL picks SQLite (the default) or PostgreSQL, see tchapia/databases.py.
+# SQLite pragmas and write queuing: see base/sqlite.py
+DATABASES = databases_from_environment(BASE_DIR)
+
+# Trigram indexes of the PostgreSQL migrations: the ops classes of GIN
+# indexes are only compiled right with django.contrib.postgres installed
+if DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    INSTALLED_APPS.append("django.contrib.postgres")
+
+DATABASE_ROUTERS = ["base.replica.ReplicaRouter"]
+
+SQLITE_SERIALIZE_WRITES = os.environ.get("SQLITE_SERIALIZE_WRITES", "1") == "1"
+
+
+# Background jobs (see base/jobs.py) run in `manage.py run_workers`. In
+# development JOB_QUEUE_EAGER=1 runs them in the web process instead, right
+# after the request's transaction commits.
+
+JOB_QUEUE_EAGER = os.environ.get("JOB_QUEUE_EAGER", "0") == "1"
+
+
+# Seconds before a process rebuilds its artisan/project matching index (see
+# base/matching.py). A build reads every available handyman and open project,
+# about 0.12s for 30k handymen and 20k open projects on SQLite; an index that
+# is only too old is rebuilt in a thread while requests keep using it.
+
+MATCHING_INDEX_MAX_AGE = int(os.environ.get("MATCHING_INDEX_MAX_AGE", 300))
+
+
+# Cache shared by every worker process on the node (see base/cache.py)
+
+CACHE_LOCATION = os.environ.get("CACHE_LOCATION", BASE_DIR / "cache.sqlite3")
+
+# The test suite clears the cache: give it a throwaway file rather than the
+# one of the dev server and workers
+if sys.argv[1:2] == ["test"]:
+    _test_cache_dir = tempfile.mkdtemp(prefix="tchapia-test-cache-")
+    atexit.register(shutil.rmtree, _test_cache_dir, ignore_errors=True)
+    CACHE_LOCATION = os.path.join(_test_cache_dir, "cache.sqlite3")
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": "base.cache.SQLiteCache",
+        "LOCATION": CACHE_LOCATION,
+        "OPTIONS": {
+            "MAX_ENTRIES": 50000,
+        },
     }
 }
 
@@ -0,0 +1,38 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db import migrations
+from django.db.models.functions import Upper
+
+# PostgreSQL only, see customer migration 0014. Every column the artisan
+# search looks at, so its OR can combine index scans.
+INDEXES = [
+    GinIndex(OpClass(Upper(field), name='gin_trgm_ops'), name=f'user_{field}_trgm_idx')
+    for field in ['first_name', 'last_name', 'bio', 'service']
+]
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    User = apps.get_model('userauths', 'User')
+    for index in INDEXES:
+        schema_editor.add_index(User, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    User = apps.get_model('userauths', 'User')
+    for index in INDEXES:
+        schema_editor.remove_index(User, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('userauths', '0005_user_user_service_region_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 
+from base.models import DenormalizedFieldsMixin
+
 # Create your models here.
 
 REGION_CHOICES = [
@@ -48,7 +50,7 @@ SERVICE_CHOICES = [
     ('serrurerie', 'Serrurerie'),
 ]
 
-class User(AbstractUser):
+class User(DenormalizedFieldsMixin, AbstractUser):
     email = models.EmailField(unique=True)
     phone = models.CharField(max_length=20)
     whatsapp = models.CharField(max_length=20, blank=True, null=True)
@@ -62,13 +64,21 @@ class User(AbstractUser):
     is_active = models.BooleanField(default=True)
     date_joined = models.DateTimeField(auto_now_add=True)
     last_login = models.DateTimeField(auto_now=True)
+    unread_notifications_count = models.PositiveIntegerField(default=0, help_text='Denormalized number of unread notifications')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'phone', 'city', 'region']
 
+    # Only ever changed with F() updates, see base.notifications
+    DENORMALIZED_FIELDS = ['unread_notifications_count']
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} - {self.email}"
 
     class Meta:
         db_table = 'userauths_user'
+        indexes = [
+            # Matching artisans to a project (customer.fanout.matching_handymen)
+            models.Index(fields=['service', 'region'], name='user_service_region_idx'),
+        ]
 